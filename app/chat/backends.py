@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Set
+
+import httpx
+
+from ..config.settings import settings
+from .http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+class BackendError(Exception):
+    """A backend failed at the transport level or with a 5xx; the request may be retried elsewhere."""
+
+class Backend:
+    """One Ollama host and what the pool knows about it."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.loaded_models: Set[str] = set()
+        self.requests = 0
+        self.errors = 0
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+class BackendPool:
+    """
+    A set of interchangeable Ollama hosts. Requests go to the available backend with
+    the fewest outstanding requests, preferring backends that already have the model
+    loaded. After max_failures consecutive failures a backend is ejected for
+    eject_seconds; a passing health check reinstates it early. If every backend is
+    ejected, the one due back first is used rather than failing outright.
+    """
+
+    def __init__(self, name: str, urls: Iterable[str], max_failures: int = 3, eject_seconds: float = 30.0):
+        self.name = name
+        self.backends: List[Backend] = [Backend(url) for url in dict.fromkeys(urls)]
+        if not self.backends:
+            raise Exception(f"Backend pool {name} has no backends configured")
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self._turn = 0
+
+    def choose(self, model: Optional[str] = None, exclude: Iterable[Backend] = ()) -> Optional[Backend]:
+        """Pick the backend for the next request, or None if every backend is excluded."""
+        excluded = set(map(id, exclude))
+        candidates = [backend for backend in self.backends if id(backend) not in excluded]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        available = [backend for backend in candidates if backend.available(now)]
+        if not available:
+            return min(candidates, key=lambda backend: backend.ejected_until)
+        if model:
+            warm = [backend for backend in available if model in backend.loaded_models]
+            available = warm or available
+        # Rotate the starting point so ties do not always go to the first backend.
+        self._turn = (self._turn + 1) % len(available)
+        rotated = available[self._turn:] + available[:self._turn]
+        return min(rotated, key=lambda backend: backend.outstanding)
+
+    @asynccontextmanager
+    async def track(self, backend: Backend):
+        """Count a request as outstanding on the backend while it runs."""
+        backend.outstanding += 1
+        backend.requests += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+
+    def record_success(self, backend: Backend, model: Optional[str] = None):
+        backend.failures = 0
+        if model:
+            backend.loaded_models.add(model)
+
+    def record_failure(self, backend: Backend, reason: str):
+        backend.failures += 1
+        backend.errors += 1
+        if backend.failures >= self.max_failures and backend.available(time.monotonic()):
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+            logger.warning(f"Ejected {self.name} backend {backend.url} for {self.eject_seconds:.0f}s: {reason}")
+
+    async def health_check(self, http_client: httpx.AsyncClient, timeout: float):
+        """Probe every backend with /api/ps, which also reports the models it has loaded."""
+        async def probe(backend: Backend):
+            try:
+                response = await http_client.get(f"{backend.url}/api/ps", timeout=timeout)
+                if response.status_code >= 500:
+                    raise BackendError(f"status {response.status_code}")
+                if response.status_code == 200:
+                    backend.loaded_models = {
+                        model.get("name") or model.get("model") for model in response.json().get("models", [])
+                    }
+                if not backend.available(time.monotonic()):
+                    logger.info(f"Reinstated {self.name} backend {backend.url}")
+                backend.ejected_until = 0.0
+                backend.failures = 0
+            except (httpx.HTTPError, BackendError, ValueError) as e:
+                self.record_failure(backend, f"health check failed: {str(e) or type(e).__name__}")
+        await asyncio.gather(*(probe(backend) for backend in self.backends))
+
+    def stats(self) -> List[Dict]:
+        now = time.monotonic()
+        return [{
+            'url': backend.url,
+            'available': backend.available(now),
+            'outstanding': backend.outstanding,
+            'requests': backend.requests,
+            'errors': backend.errors,
+            'loaded_models': sorted(backend.loaded_models)
+        } for backend in self.backends]
+
+_pools: Dict[str, BackendPool] = {}
+_health_task: Optional[asyncio.Task] = None
+
+def _configured_pool(name: str, urls: Iterable[str]) -> BackendPool:
+    if name not in _pools:
+        _pools[name] = BackendPool(
+            name, urls,
+            max_failures=settings.OLLAMA_BACKEND_MAX_FAILURES,
+            eject_seconds=settings.OLLAMA_BACKEND_EJECT_SECONDS
+        )
+    return _pools[name]
+
+def get_chat_pool() -> BackendPool:
+    return _configured_pool("chat", settings.OLLAMA_CHAT_BACKENDS)
+
+def get_embedding_pool() -> BackendPool:
+    return _configured_pool("embedding", settings.OLLAMA_EMBEDDING_BACKENDS)
+
+def get_single_backend_pool(url: str) -> BackendPool:
+    """A one-host pool for clients pinned to an explicit base URL."""
+    return _configured_pool(url.rstrip('/'), [url])
+
+async def _health_loop():
+    while True:
+        await asyncio.sleep(settings.OLLAMA_HEALTH_CHECK_INTERVAL)
+        for pool in list(_pools.values()):
+            try:
+                await pool.health_check(get_http_client(), settings.OLLAMA_HEALTH_CHECK_TIMEOUT)
+            except Exception as e:
+                logger.error(f"Error health-checking {pool.name} backends: {str(e)}")
+
+def start_health_checks():
+    global _health_task
+    get_chat_pool()
+    get_embedding_pool()
+    if _health_task is None:
+        _health_task = asyncio.get_running_loop().create_task(_health_loop())
+
+def stop_health_checks():
+    global _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        _health_task = None
+
+def backend_stats() -> Dict[str, List[Dict]]:
+    return {name: pool.stats() for name, pool in _pools.items()}
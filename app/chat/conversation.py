@@ -0,0 +1,81 @@
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from ..config.settings import settings
+from .prompt_builder import MESSAGE_OVERHEAD_TOKENS
+
+logger = logging.getLogger(__name__)
+
+class Conversation:
+    """
+    Chat state of one session for /api/chat: the prior turns exactly as they were sent.
+    Replaying them unchanged keeps the message prefix stable, so the backend reuses its
+    KV cache for it and only prefills the new user message.
+    """
+
+    def __init__(self, model: str, system_prompt: str):
+        self.model = model
+        self.system_prompt = system_prompt
+        self.turns: List[Dict] = []
+
+    def matches(self, model: str, system_prompt: str) -> bool:
+        return self.model == model and self.system_prompt == system_prompt
+
+    def record(self, user_content: str, reply: str):
+        self.turns.append({"role": "user", "content": user_content})
+        self.turns.append({"role": "assistant", "content": reply})
+
+    def tokens(self, count_tokens: Callable[[str], int]) -> int:
+        return sum(count_tokens(turn["content"]) + MESSAGE_OVERHEAD_TOKENS for turn in self.turns)
+
+    def trim(self, max_tokens: int, count_tokens: Callable[[str], int]) -> bool:
+        """
+        Drop the oldest turns once the history exceeds max_tokens. It is cut to half of
+        that, so the prefix then stays stable (and cached) for many turns until the next trim.
+        """
+        if self.tokens(count_tokens) <= max_tokens:
+            return False
+        while self.turns and self.tokens(count_tokens) > max_tokens // 2:
+            del self.turns[:2]
+        return True
+
+class ConversationStore:
+    """Per-session Conversations, least recently used first, bounded like the session memory registry."""
+
+    def __init__(self, max_sessions: int = 64):
+        self.max_sessions = max_sessions
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self.invalidations = 0
+        self.trims = 0
+
+    def get(self, session_name: str, model: str, system_prompt: str) -> Conversation:
+        """The session's conversation, started afresh if the model or system prompt changed."""
+        conversation = self._conversations.get(session_name)
+        if conversation is not None and not conversation.matches(model, system_prompt):
+            logger.info(f"Model or system prompt changed for session {session_name}; starting a new conversation")
+            self.invalidations += 1
+            conversation = None
+        if conversation is None:
+            conversation = Conversation(model, system_prompt)
+            self._conversations[session_name] = conversation
+        self._conversations.move_to_end(session_name)
+        while len(self._conversations) > self.max_sessions:
+            self._conversations.popitem(last=False)
+        return conversation
+
+    def trim(self, conversation: Conversation, count_tokens: Callable[[str], int]):
+        max_tokens = int(settings.MAX_CONTEXT_TOKENS * settings.CHAT_HISTORY_MAX_SHARE)
+        if conversation.trim(max_tokens, count_tokens):
+            self.trims += 1
+
+    def drop(self, session_name: str):
+        self._conversations.pop(session_name, None)
+
+    def stats(self) -> Dict:
+        return {
+            'sessions': len(self._conversations),
+            'turns': sum(len(c.turns) // 2 for c in self._conversations.values()),
+            'invalidations': self.invalidations,
+            'trims': self.trims
+        }
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+EmbedBatchFn = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+class EmbeddingBatcher:
+    """
+    Coalesces embedding requests from concurrent callers.
+
+    Texts submitted within max_wait seconds of each other (or until max_batch_size
+    texts are pending) are sent to the backend as one batched call, and the results
+    are fanned back out to the waiting futures. Identical texts inside a batch are
+    embedded once.
+    """
+
+    def __init__(self, embed_batch: EmbedBatchFn, max_batch_size: int = 32, max_wait: float = 0.005):
+        self._embed_batch = embed_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches_sent = 0
+        self.texts_embedded = 0
+
+    async def embed(self, text: str) -> List[float]:
+        return (await self.embed_many([text]))[0]
+
+    async def embed_many(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.append((text, future))
+            futures.append(future)
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+        if self._pending and self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            task = loop.create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: List[Tuple[str, asyncio.Future]]):
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            embeddings = await self._embed_batch(unique_texts)
+            if len(embeddings) != len(unique_texts):
+                raise Exception(f"Expected {len(unique_texts)} embeddings, got {len(embeddings)}")
+        except Exception as e:
+            logger.error(f"Batched embedding of {len(unique_texts)} texts failed: {str(e)}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches_sent += 1
+        self.texts_embedded += len(unique_texts)
+        logger.debug(f"Embedded batch of {len(unique_texts)} texts for {len(batch)} requests")
+        by_text: Dict[str, List[float]] = dict(zip(unique_texts, embeddings))
+        for text, future in batch:
+            if not future.done():
+                future.set_result(by_text[text])
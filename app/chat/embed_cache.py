@@ -0,0 +1,216 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..concurrency import get_executor, run_blocking
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(text: str) -> str:
+    """Normalization applied before hashing: NFC, trimmed, whitespace collapsed."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+class DiskEmbeddingStore:
+    """
+    Persistent tier for one embedding model: a raw float32 file of rows that is
+    memory-mapped for reads, plus an append-only "hash row" index file. Blocking;
+    EmbeddingCache calls it from the blocking pool, so access is serialized by a lock.
+    """
+
+    def __init__(self, directory: str, model: str, max_entries: int):
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, f"{safe_model}.f32")
+        self.index_path = os.path.join(directory, f"{safe_model}.idx")
+        self.meta_path = os.path.join(directory, f"{safe_model}.meta.json")
+        self.max_entries = max_entries
+        self.dimension: Optional[int] = None
+        self.rows: Dict[str, int] = {}
+        self._next_row = 0
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        try:
+            with open(self.meta_path, 'r') as f:
+                self.dimension = json.load(f)["dimension"]
+            available_rows = os.path.getsize(self.vectors_path) // (4 * self.dimension)
+            with open(self.index_path, 'r') as f:
+                for line in f:
+                    parts = line.split()
+                    # Rows whose vector bytes never made it to disk are ignored.
+                    if len(parts) == 2 and int(parts[1]) < available_rows:
+                        self.rows[parts[0]] = int(parts[1])
+            self._next_row = max(self.rows.values()) + 1 if self.rows else 0
+            if available_rows > self._next_row or os.path.getsize(self.vectors_path) % (4 * self.dimension):
+                # Drop vectors whose index line was never written (and any torn row), so
+                # the next appended vector lands on row _next_row.
+                os.truncate(self.vectors_path, self._next_row * 4 * self.dimension)
+            logger.info(f"Loaded {len(self.rows)} cached embeddings from {self.vectors_path}")
+        except Exception as e:
+            logger.error(f"Error loading embedding cache {self.vectors_path}: {str(e)}")
+            self.dimension = None
+            self.rows = {}
+            self._next_row = 0
+
+    def get_many(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        with self._lock:
+            rows = [self.rows.get(key) for key in keys]
+            last = max((row for row in rows if row is not None), default=None)
+            if last is None:
+                return [None] * len(keys)
+            if self._mmap is None or last >= self._mmap.shape[0]:
+                self._mmap = np.memmap(self.vectors_path, dtype='float32', mode='r').reshape(-1, self.dimension)
+            return [np.array(self._mmap[row]) if row is not None else None for row in rows]
+
+    def put_many(self, entries: List[Tuple[str, np.ndarray]]):
+        """Append new (key, vector) entries with one write to each file."""
+        with self._lock:
+            if self.dimension is None and entries:
+                self.dimension = int(entries[0][1].shape[0])
+                with open(self.meta_path, 'w') as f:
+                    json.dump({"dimension": self.dimension}, f)
+                # Start from empty files; anything left there could not be loaded.
+                open(self.vectors_path, 'wb').close()
+                open(self.index_path, 'w').close()
+            new_rows: Dict[str, int] = {}
+            vectors = []
+            for key, vector in entries:
+                if key in self.rows or key in new_rows or vector.shape[0] != self.dimension:
+                    continue
+                if len(self.rows) + len(new_rows) >= self.max_entries:
+                    break
+                new_rows[key] = self._next_row + len(new_rows)
+                vectors.append(vector.astype('float32').tobytes())
+            if not new_rows:
+                return
+            # Vector bytes go first so an index line never points past the end of the file.
+            with open(self.vectors_path, 'ab') as f:
+                f.write(b"".join(vectors))
+            with open(self.index_path, 'a') as f:
+                f.write("".join(f"{key} {row}\n" for key, row in new_rows.items()))
+            self.rows.update(new_rows)
+            self._next_row += len(new_rows)
+
+class EmbeddingCache:
+    """
+    Content-addressed cache in front of the embedding model, keyed by
+    (embedding model, hash of the normalized text). A bounded in-memory LRU sits
+    on top of an optional per-model disk tier that survives restarts. Disk reads run
+    on the blocking pool and disk writes are handed to it in the background, so the
+    event loop only touches the LRU.
+    """
+
+    def __init__(self, max_entries: int = 10000, persist_path: Optional[str] = None,
+                 disk_max_entries: int = 1000000):
+        self.max_entries = max_entries
+        self.persist_path = persist_path
+        self.disk_max_entries = disk_max_entries
+        self._lru: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._disk: Dict[str, DiskEmbeddingStore] = {}
+        self._disk_guard = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _disk_store(self, model: str) -> Optional[DiskEmbeddingStore]:
+        if not self.persist_path:
+            return None
+        with self._disk_guard:
+            if model not in self._disk:
+                self._disk[model] = DiskEmbeddingStore(self.persist_path, model, self.disk_max_entries)
+            return self._disk[model]
+
+    def _remember(self, key: Tuple[str, str], vector: np.ndarray):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    async def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Cached embeddings for texts, None where there is none."""
+        keys = [(model, text_hash(text)) for text in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        missing = []
+        for i, key in enumerate(keys):
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.memory_hits += 1
+                results[i] = vector.tolist()
+            else:
+                missing.append(i)
+        if missing and self.persist_path:
+            try:
+                vectors = await run_blocking(self._read_disk, model, [keys[i][1] for i in missing])
+            except Exception as e:
+                logger.error(f"Error reading cached embeddings: {str(e)}")
+                vectors = [None] * len(missing)
+            for i, vector in zip(missing, vectors):
+                if vector is not None:
+                    self._remember(keys[i], vector)
+                    self.disk_hits += 1
+                    results[i] = vector.tolist()
+        self.misses += sum(1 for result in results if result is None)
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """Cache embeddings; the disk tier is written in the background on the blocking pool."""
+        entries = []
+        for text, embedding in zip(texts, embeddings):
+            key = (model, text_hash(text))
+            vector = np.asarray(embedding, dtype='float32')
+            self._remember(key, vector)
+            entries.append((key[1], vector))
+        if entries and self.persist_path:
+            get_executor().submit(self._write_disk, model, entries)
+
+    def _read_disk(self, model: str, hashes: List[str]) -> List[Optional[np.ndarray]]:
+        return self._disk_store(model).get_many(hashes)
+
+    def _write_disk(self, model: str, entries: List[Tuple[str, np.ndarray]]):
+        try:
+            self._disk_store(model).put_many(entries)
+        except Exception as e:
+            logger.error(f"Error persisting cached embeddings: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self._lru),
+            "disk_entries": sum(len(store.rows) for store in list(self._disk.values()))
+        }
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Process-wide embedding cache, or None when disabled in settings."""
+    global _embedding_cache
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+    if _embedding_cache is None:
+        _embedding_cache = EmbeddingCache(
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+            persist_path=settings.EMBEDDING_CACHE_PATH if settings.EMBEDDING_CACHE_PERSIST else None,
+            disk_max_entries=settings.EMBEDDING_CACHE_DISK_MAX_ENTRIES
+        )
+    return _embedding_cache
@@ -0,0 +1,53 @@
+import httpx
+import logging
+from typing import Optional
+
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Application-scoped connection pool shared by all Ollama traffic.
+_http_client: Optional[httpx.AsyncClient] = None
+
+def _build_http_client() -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=settings.OLLAMA_POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OLLAMA_POOL_MAX_KEEPALIVE,
+        keepalive_expiry=settings.OLLAMA_POOL_KEEPALIVE_EXPIRY
+    )
+    timeout = httpx.Timeout(
+        connect=settings.OLLAMA_CONNECT_TIMEOUT,
+        read=settings.OLLAMA_READ_TIMEOUT,
+        write=settings.OLLAMA_WRITE_TIMEOUT,
+        pool=settings.OLLAMA_POOL_TIMEOUT
+    )
+    logger.info(
+        f"Creating shared Ollama HTTP pool (max_connections={limits.max_connections}, "
+        f"max_keepalive={limits.max_keepalive_connections})"
+    )
+    return httpx.AsyncClient(limits=limits, timeout=timeout)
+
+async def init_http_client() -> httpx.AsyncClient:
+    """Create the shared pool; called on application startup."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
+
+async def close_http_client() -> None:
+    """Close the shared pool; called on application shutdown."""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+        logger.info("Closed shared Ollama HTTP pool")
+    _http_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the shared pool. It is created lazily so that code running outside the
+    FastAPI lifecycle (scripts, the REPL) still works.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = _build_http_client()
+    return _http_client
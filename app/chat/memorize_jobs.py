@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_QUEUED = "queued"
+STATUS_SUMMARIZING = "summarizing"
+STATUS_STORING = "storing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+FINISHED = (STATUS_DONE, STATUS_FAILED)
+
+Summarize = Callable[[str, str], Awaitable[str]]
+Store = Callable[[str, List[str], List[Dict]], Awaitable[List[str]]]
+
+class MemorizeQueueFull(Exception):
+    """Raised when too many memorize jobs are pending; maps to 503 with Retry-After."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class MemorizeQueue:
+    """
+    Runs memorization as background jobs. submit() returns a job id immediately; a pool
+    of workers takes up to batch_size queued jobs at a time, summarizes them concurrently
+    and then stores the summaries with one add_memories call per session. Each job is
+    summarized by its own LLM call: several conversations in one prompt would need the
+    reply split back into per-job summaries, and one bad split would fail the whole batch.
+    The stores of a batch run concurrently, so the embedding batcher merges them into one
+    request even across sessions. A failed job is retried up to max_attempts times with backoff.
+    Finished jobs stay queryable for retention seconds.
+    """
+
+    def __init__(self, summarize: Summarize, store: Store, workers: int = 2, batch_size: int = 8,
+                 max_pending: int = 256, max_attempts: int = 3, retention: float = 3600.0):
+        self.summarize = summarize
+        self.store = store
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.max_pending = max_pending
+        self.max_attempts = max(1, max_attempts)
+        self.retention = retention
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._retries = set()
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.get_running_loop().create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self, grace: float = 10.0):
+        """Give queued jobs up to grace seconds to finish, then stop the workers."""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=grace)
+        except asyncio.TimeoutError:
+            pass
+        if self.pending():
+            logger.warning(f"Stopping with {self.pending()} memorize jobs unfinished")
+        for task in self._tasks + list(self._retries):
+            task.cancel()
+        self._tasks = []
+        self._retries.clear()
+
+    def pending(self) -> int:
+        return sum(1 for job in self._jobs.values() if job['status'] not in FINISHED)
+
+    def submit(self, session: str, conversation_text: str, metadata: Optional[Dict] = None) -> Dict:
+        if self._queue is None:
+            raise Exception("Memorize queue is not running")
+        self._prune()
+        if self.pending() >= self.max_pending:
+            raise MemorizeQueueFull(f"Too many memorize jobs pending ({self.max_pending})", retry_after=10)
+        now = time.time()
+        job = {
+            'id': uuid.uuid4().hex,
+            'session': session,
+            'status': STATUS_QUEUED,
+            'attempts': 0,
+            'created_at': now,
+            'updated_at': now,
+            'summary': None,
+            'memory_key': None,
+            'error': None,
+            '_text': conversation_text,
+            '_metadata': metadata or {}
+        }
+        self._jobs[job['id']] = job
+        self._queue.put_nowait(job)
+        return self.status(job['id'])
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """Public view of a job, or None if it is unknown or expired."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        view = {key: value for key, value in job.items() if not key.startswith('_')}
+        if job['status'] == STATUS_QUEUED:
+            view['position'] = sum(
+                1 for other in self._jobs.values() if other['status'] == STATUS_QUEUED and other['created_at'] < job['created_at']
+            )
+        return view
+
+    def _set_status(self, job: Dict, status: str, error: Optional[str] = None):
+        job['status'] = status
+        job['updated_at'] = time.time()
+        if error is not None:
+            job['error'] = error
+        if status in FINISHED:
+            # The conversation text is no longer needed once the job has finished.
+            job.pop('_text', None)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items() if job['status'] in FINISHED and job['updated_at'] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    async def _next_batch(self) -> List[Dict]:
+        batch = [await self._queue.get()]
+        while len(batch) < self.batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._run_batch(batch)
+            except Exception as e:
+                logger.error(f"Error in memorize worker: {str(e)}")
+                for job in batch:
+                    if job['status'] not in FINISHED:
+                        self._fail(job, str(e))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _run_batch(self, batch: List[Dict]):
+        self.batches += 1
+        for job in batch:
+            job['attempts'] += 1
+            self._set_status(job, STATUS_SUMMARIZING)
+        summaries = await asyncio.gather(
+            *(self.summarize(job['session'], job['_text']) for job in batch), return_exceptions=True
+        )
+        by_session: Dict[str, List[Dict]] = defaultdict(list)
+        for job, summary in zip(batch, summaries):
+            if isinstance(summary, BaseException):
+                self._fail(job, str(summary) or type(summary).__name__)
+                continue
+            job['summary'] = summary
+            self._set_status(job, STATUS_STORING)
+            by_session[job['session']].append(job)
+        await asyncio.gather(*(self._store_session(session, jobs) for session, jobs in by_session.items()))
+
+    async def _store_session(self, session: str, jobs: List[Dict]):
+        try:
+            keys = await self.store(session, [job['summary'] for job in jobs], [job['_metadata'] for job in jobs])
+        except Exception as e:
+            for job in jobs:
+                self._fail(job, str(e))
+            return
+        for job, key in zip(jobs, keys):
+            job['memory_key'] = key
+            self._set_status(job, STATUS_DONE)
+            self.completed += 1
+
+    def _fail(self, job: Dict, error: str):
+        if job['attempts'] < self.max_attempts:
+            # Back off before retrying; the job counts as queued again in the meantime.
+            self._set_status(job, STATUS_QUEUED, error)
+            delay = 2 ** job['attempts']
+            task = asyncio.get_running_loop().create_task(self._requeue(job, delay))
+            self._retries.add(task)
+            task.add_done_callback(self._retries.discard)
+            return
+        logger.error(f"Memorize job {job['id']} for session {job['session']} failed: {error}")
+        self._set_status(job, STATUS_FAILED, error)
+        self.failed += 1
+
+    async def _requeue(self, job: Dict, delay: float):
+        await asyncio.sleep(delay)
+        self._queue.put_nowait(job)
+
+    def stats(self) -> Dict:
+        counts = defaultdict(int)
+        for job in self._jobs.values():
+            counts[job['status']] += 1
+        return {
+            'workers': len(self._tasks),
+            'jobs': dict(counts),
+            'completed': self.completed,
+            'failed': self.failed,
+            'batches': self.batches
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from ..config.settings import settings
+from .backends import Backend, BackendPool, get_chat_pool, get_embedding_pool
+from .http_client import get_http_client
+from .ollama_client import llm_options
+
+logger = logging.getLogger(__name__)
+
+KIND_CHAT = "chat"
+KIND_EMBEDDING = "embedding"
+
+class ModelResidencyManager:
+    """
+    Keeps models loaded on every backend of their pool. A generation with an empty
+    prompt (or an embedding of an empty input) makes Ollama load the model without
+    doing any work, and its keep_alive sets how long the model then stays resident.
+    The configured models are warmed at startup and touched again every interval,
+    which also reloads them after Ollama unloaded them; other models can be warmed
+    on demand, for example when a session switches to them.
+    """
+
+    def __init__(self, interval: float = 120.0, timeout: float = 300.0):
+        self.interval = interval
+        self.timeout = timeout
+        self._warming: Dict[Tuple[str, str], asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.warmups = 0
+        self.failures = 0
+        self.load_seconds: Dict[str, float] = {}
+
+    @staticmethod
+    def _pool(kind: str) -> BackendPool:
+        return get_embedding_pool() if kind == KIND_EMBEDDING else get_chat_pool()
+
+    @staticmethod
+    def kind_of(model: str) -> str:
+        return KIND_EMBEDDING if model in settings.MODEL_WARMUP_EMBEDDING_MODELS else KIND_CHAT
+
+    def pinned_models(self) -> List[Tuple[str, str]]:
+        return ([(model, KIND_CHAT) for model in settings.MODEL_WARMUP_CHAT_MODELS]
+                + [(model, KIND_EMBEDDING) for model in settings.MODEL_WARMUP_EMBEDDING_MODELS])
+
+    async def warm(self, model: str, kind: str = KIND_CHAT) -> int:
+        """Load the model on every available backend of its pool; returns on how many it succeeded."""
+        pool = self._pool(kind)
+        now = time.monotonic()
+        backends = [backend for backend in pool.backends if backend.available(now)]
+        results = await asyncio.gather(*(self._warm_once(pool, backend, model, kind) for backend in backends))
+        return sum(results)
+
+    def is_loaded(self, model: str, kind: Optional[str] = None) -> bool:
+        """Whether some available backend of the model's pool reports it as loaded."""
+        now = time.monotonic()
+        return any(
+            model in backend.loaded_models
+            for backend in self._pool(kind or self.kind_of(model)).backends if backend.available(now)
+        )
+
+    def warm_in_background(self, model: str, kind: Optional[str] = None):
+        asyncio.get_running_loop().create_task(self.warm(model, kind or self.kind_of(model)))
+
+    async def _warm_once(self, pool: BackendPool, backend: Backend, model: str, kind: str) -> bool:
+        """Single-flight per (backend, model): concurrent callers share one load request."""
+        key = (backend.url, model)
+        task = self._warming.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._warm_backend(pool, backend, model, kind))
+            self._warming[key] = task
+            task.add_done_callback(lambda _: self._warming.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _warm_backend(self, pool: BackendPool, backend: Backend, model: str, kind: str) -> bool:
+        http_client = get_http_client()
+        keep_alive = settings.OLLAMA_KEEP_ALIVE
+        start = time.monotonic()
+        try:
+            async with pool.track(backend):
+                if kind == KIND_EMBEDDING:
+                    response = await http_client.post(
+                        f"{backend.url}/api/embed",
+                        json={"model": model, "input": "", "keep_alive": keep_alive},
+                        timeout=self.timeout
+                    )
+                    if response.status_code == 404:
+                        response = await http_client.post(
+                            f"{backend.url}/api/embeddings",
+                            json={"model": model, "prompt": "", "keep_alive": keep_alive},
+                            timeout=self.timeout
+                        )
+                else:
+                    response = await http_client.post(
+                        f"{backend.url}/api/generate",
+                        # Same options as real generations: a different num_ctx would make
+                        # Ollama reload the model on the first chat.
+                        json={"model": model, "prompt": "", "stream": False, "options": llm_options(),
+                              "keep_alive": keep_alive},
+                        timeout=self.timeout
+                    )
+            if response.status_code != 200:
+                raise Exception(f"Error from Ollama API: {response.status_code} - {response.text}")
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Could not warm {model} on {backend.url}: {str(e) or type(e).__name__}")
+            return False
+        elapsed = time.monotonic() - start
+        self.warmups += 1
+        self.load_seconds[f"{backend.url} {model}"] = elapsed
+        if model not in backend.loaded_models:
+            logger.info(f"Loaded {model} on {backend.url} in {elapsed:.1f}s")
+        pool.record_success(backend, model)
+        return True
+
+    async def _keep_resident(self):
+        while True:
+            for model, kind in self.pinned_models():
+                try:
+                    await self.warm(model, kind)
+                except Exception as e:
+                    logger.error(f"Error keeping {model} resident: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None and settings.MODEL_WARMUP_ENABLED:
+            self._task = asyncio.get_running_loop().create_task(self._keep_resident())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {
+            'pinned': [model for model, _ in self.pinned_models()],
+            'warming': [f"{url} {model}" for url, model in self._warming],
+            'warmups': self.warmups,
+            'failures': self.failures,
+            'load_seconds': self.load_seconds
+        }
+
+_residency_manager: Optional[ModelResidencyManager] = None
+
+def get_residency_manager() -> ModelResidencyManager:
+    global _residency_manager
+    if _residency_manager is None:
+        _residency_manager = ModelResidencyManager(
+            interval=settings.MODEL_RESIDENCY_INTERVAL,
+            timeout=settings.MODEL_WARMUP_TIMEOUT
+        )
+    return _residency_manager
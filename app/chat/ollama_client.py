@@ -1,57 +1,254 @@
+import asyncio
 import httpx
 import logging
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
 
-from ..config.settings import OLLAMA_BASE_URL, OLLAMA_EMBEDDING_MODEL, OLLAMA_CHAT_MODEL
+from ..config.settings import OLLAMA_EMBEDDING_MODEL, OLLAMA_CHAT_MODEL, settings
+from ..serialization import json_loads
+from .backends import Backend, BackendError, get_chat_pool, get_embedding_pool, get_single_backend_pool
+from .embed_batcher import EmbeddingBatcher
+from .embed_cache import get_embedding_cache
+from .http_client import get_http_client
 
 logger = logging.getLogger(__name__)
 
+# One embedding coalescer per (backend pool, embedding model), shared by all clients.
+_embedding_batchers: Dict[Tuple[str, str], EmbeddingBatcher] = {}
+# Servers that answered 404 on /api/embed (Ollama before 0.3) use the per-text endpoint.
+_legacy_embed_servers: Set[str] = set()
+
+def llm_options() -> Dict:
+    """Generation options from the LLM_* settings, in Ollama's option names."""
+    return {
+        "temperature": settings.LLM_TEMPERATURE,
+        "top_p": settings.LLM_TOP_P,
+        "num_predict": settings.LLM_MAX_TOKENS,
+        "num_ctx": settings.MAX_CONTEXT_TOKENS,
+        "frequency_penalty": settings.LLM_FREQUENCY_PENALTY,
+        "presence_penalty": settings.LLM_PRESENCE_PENALTY,
+        "repeat_penalty": settings.LLM_REPETITION_PENALTY
+    }
+
 class OllamaClient:
     def __init__(self, 
-                 base_url: str = OLLAMA_BASE_URL,
+                 base_url: Optional[str] = None,
                  embedding_model: str = OLLAMA_EMBEDDING_MODEL,
-                 chat_model: str = OLLAMA_CHAT_MODEL):
-        self.base_url = base_url.rstrip('/')
+                 chat_model: str = OLLAMA_CHAT_MODEL,
+                 http_client: Optional[httpx.AsyncClient] = None):
+        """
+        Without base_url, chat and embedding requests are spread over the configured
+        backend pools (OLLAMA_CHAT_BACKENDS and OLLAMA_EMBEDDING_BACKENDS); with it,
+        the client is pinned to that one host.
+        """
+        if base_url:
+            self.chat_pool = self.embedding_pool = get_single_backend_pool(base_url)
+        else:
+            self.chat_pool = get_chat_pool()
+            self.embedding_pool = get_embedding_pool()
         self.embedding_model = embedding_model
         self.chat_model = chat_model
-        logger.info(f"Initialized OllamaClient with base_url: {self.base_url}")
-        logger.info(f"Using embedding model: {self.embedding_model}")
-        logger.info(f"Using chat model: {self.chat_model}")
+        # When no client is injected, requests go through the shared application pool.
+        self._http_client = http_client
+        logger.debug(f"Initialized OllamaClient with {self.chat_pool.name} and {self.embedding_pool.name} backend pools, "
+                     f"embedding model: {self.embedding_model}, chat model: {self.chat_model}")
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        return self._http_client or get_http_client()
 
     async def get_embedding(self, text: str) -> List[float]:
         logger.debug(f"Getting embedding for text: {text[:100]}...")
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/embeddings",
-                json={"model": self.embedding_model, "prompt": text},
-                timeout=30.0
+        embeddings = await self.get_embeddings([text])
+        return embeddings[0]
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several texts. Cached vectors are returned directly; the rest are
+        coalesced with concurrent requests into batched calls and then cached.
+        """
+        cache = get_embedding_cache()
+        if cache is None:
+            return await self._embedding_batcher().embed_many(texts)
+        embeddings = await cache.get_many(self.embedding_model, texts)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            fetched = await self._embedding_batcher().embed_many([texts[i] for i in missing])
+            for i, embedding in zip(missing, fetched):
+                embeddings[i] = embedding
+            stored = [i for i in missing if embeddings[i]]
+            cache.put_many(self.embedding_model, [texts[i] for i in stored], [embeddings[i] for i in stored])
+        return embeddings
+
+    def _embedding_batcher(self) -> EmbeddingBatcher:
+        key = (self.embedding_pool.name, self.embedding_model)
+        if key not in _embedding_batchers:
+            _embedding_batchers[key] = EmbeddingBatcher(
+                self.embed_batch,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                max_wait=settings.EMBEDDING_BATCH_MAX_WAIT_MS / 1000.0
             )
+        return _embedding_batchers[key]
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts with a single call to Ollama's batch endpoint /api/embed. Embedding
+        is idempotent, so when a backend fails the call is retried on another one.
+        """
+        tried: List[Backend] = []
+        while True:
+            backend = self.embedding_pool.choose(self.embedding_model, exclude=tried)
+            if backend is None:
+                raise last_error
+            tried.append(backend)
+            try:
+                async with self.embedding_pool.track(backend):
+                    embeddings = await self._embed_on(backend, texts)
+                self.embedding_pool.record_success(backend, self.embedding_model)
+                return embeddings
+            except BackendError as e:
+                self.embedding_pool.record_failure(backend, str(e))
+                last_error = e
+                if len(tried) < len(self.embedding_pool.backends):
+                    logger.warning(f"Embedding on {backend.url} failed, retrying on another backend: {str(e)}")
+
+    async def _embed_on(self, backend: Backend, texts: List[str]) -> List[List[float]]:
+        if backend.url not in _legacy_embed_servers:
+            response = await self._post(backend, "/api/embed", {"model": self.embedding_model, "input": texts})
             if response.status_code == 200:
-                response_data = response.json()
-                return response_data.get("embedding", [])
-            else:
+                return json_loads(response.content).get("embeddings", [])
+            if response.status_code != 404:
                 error_msg = f"Error from Ollama API: {response.status_code} - {response.text}"
                 logger.error(error_msg)
                 raise Exception(error_msg)
+        embeddings = list(await asyncio.gather(*(self._embed_single(backend, text) for text in texts)))
+        if backend.url not in _legacy_embed_servers:
+            logger.warning(f"{backend.url} has no /api/embed; falling back to per-text /api/embeddings")
+            _legacy_embed_servers.add(backend.url)
+        return embeddings
 
-    async def chat(self, message: str, context: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
+    async def _embed_single(self, backend: Backend, text: str) -> List[float]:
+        response = await self._post(backend, "/api/embeddings", {"model": self.embedding_model, "prompt": text})
+        if response.status_code == 200:
+            response_data = json_loads(response.content)
+            return response_data.get("embedding", [])
+        else:
+            error_msg = f"Error from Ollama API: {response.status_code} - {response.text}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+
+    async def _post(self, backend: Backend, path: str, payload: Dict) -> httpx.Response:
+        """POST to one backend; transport errors and 5xx answers raise BackendError."""
+        try:
+            response = await self.http_client.post(f"{backend.url}{path}", json=payload)
+        except httpx.TransportError as e:
+            raise BackendError(f"Error reaching Ollama at {backend.url}: {str(e) or type(e).__name__}") from e
+        if response.status_code >= 500:
+            raise BackendError(f"Error from Ollama API: {response.status_code} - {response.text}")
+        return response
+
+    def _build_prompt(self, message: str, context: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
         prompt = ""
         if system_prompt:
             prompt += f"System: {system_prompt}\n\n"
         if context:
             prompt += f"Context:\n{context}\n\n"
         prompt += f"User: {message}\nAssistant:"
+        return prompt
+
+    async def chat(self, message: str, context: Optional[str] = None, system_prompt: Optional[str] = None) -> str:
+        prompt = self._build_prompt(message, context, system_prompt)
         logger.debug(f"Sending request to Ollama with prompt: {prompt}")
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/generate",
-                json={"model": self.chat_model, "prompt": prompt, "stream": False},
-                timeout=30.0
-            )
-            if response.status_code == 200:
-                response_data = response.json()
-                return response_data.get("response", "").strip()
-            else:
-                error_msg = f"Error from Ollama API: {response.status_code} - {response.text}"
-                logger.error(error_msg)
-                raise Exception(error_msg)
\ No newline at end of file
+        response_data = await self._post_generation("/api/generate", {"prompt": prompt})
+        return response_data.get("response", "").strip()
+
+    async def chat_stream(self, message: str, context: Optional[str] = None, system_prompt: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Streaming variant of chat: yields response tokens as Ollama produces them.
+        Ollama answers a streaming /api/generate call with NDJSON, one chunk per line,
+        and marks the last chunk with "done": true.
+        """
+        prompt = self._build_prompt(message, context, system_prompt)
+        logger.debug(f"Streaming request to Ollama with prompt: {prompt}")
+        async for chunk in self._stream_generation("/api/generate", {"prompt": prompt}):
+            token = chunk.get("response", "")
+            if token:
+                yield token
+
+    async def chat_messages(self, messages: List[Dict]) -> str:
+        """
+        Conversation mode: send role/content messages to /api/chat. When consecutive calls
+        share a message prefix, Ollama reuses the KV cache for it, so only the new part is prefilled.
+        """
+        logger.debug(f"Sending {len(messages)} chat messages to Ollama")
+        response_data = await self._post_generation("/api/chat", {"messages": messages})
+        return response_data.get("message", {}).get("content", "").strip()
+
+    async def chat_messages_stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        """Streaming variant of chat_messages."""
+        logger.debug(f"Streaming {len(messages)} chat messages to Ollama")
+        async for chunk in self._stream_generation("/api/chat", {"messages": messages}):
+            token = chunk.get("message", {}).get("content", "")
+            if token:
+                yield token
+
+    def _generation_payload(self, payload: Dict, stream: bool) -> Dict:
+        return {
+            "model": self.chat_model,
+            **payload,
+            "stream": stream,
+            "options": llm_options(),
+            "keep_alive": settings.OLLAMA_KEEP_ALIVE
+        }
+
+    async def _post_generation(self, path: str, payload: Dict) -> Dict:
+        backend = self.chat_pool.choose(self.chat_model)
+        async with self.chat_pool.track(backend):
+            try:
+                response = await self._post(backend, path, self._generation_payload(payload, False))
+            except BackendError as e:
+                self.chat_pool.record_failure(backend, str(e))
+                logger.error(str(e))
+                raise
+        if response.status_code == 200:
+            self.chat_pool.record_success(backend, self.chat_model)
+            return json_loads(response.content)
+        else:
+            error_msg = f"Error from Ollama API: {response.status_code} - {response.text}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+
+    async def _stream_generation(self, path: str, payload: Dict) -> AsyncIterator[Dict]:
+        """Yield the NDJSON chunks of a streaming generation call up to the one marked done."""
+        backend = self.chat_pool.choose(self.chat_model)
+        async with self.chat_pool.track(backend):
+            try:
+                async with self.http_client.stream(
+                    "POST",
+                    f"{backend.url}{path}",
+                    json=self._generation_payload(payload, True)
+                ) as response:
+                    if response.status_code != 200:
+                        body = await response.aread()
+                        error_msg = f"Error from Ollama API: {response.status_code} - {body.decode(errors='replace')}"
+                        logger.error(error_msg)
+                        if response.status_code >= 500:
+                            raise BackendError(error_msg)
+                        raise Exception(error_msg)
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk = json_loads(line)
+                        if chunk.get("error"):
+                            error_msg = f"Error from Ollama API: {chunk['error']}"
+                            logger.error(error_msg)
+                            raise Exception(error_msg)
+                        yield chunk
+                        if chunk.get("done"):
+                            break
+            except httpx.TransportError as e:
+                self.chat_pool.record_failure(backend, str(e) or type(e).__name__)
+                raise BackendError(f"Error reaching Ollama at {backend.url}: {str(e) or type(e).__name__}") from e
+            except BackendError as e:
+                self.chat_pool.record_failure(backend, str(e))
+                raise
+        self.chat_pool.record_success(backend, self.chat_model)
@@ -0,0 +1,178 @@
+import logging
+from typing import Callable, Dict, List, Optional
+
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+TRUNCATION_MARKER = " ..."
+MEMORY_HEADER = "Relevant Memories:\n"
+# Chat templates wrap each message in role markers; budget a few tokens for them.
+MESSAGE_OVERHEAD_TOKENS = 4
+
+def estimate_tokens(text: str) -> int:
+    """
+    Fast token estimate: about four UTF-8 bytes per token. This holds for English with
+    common BPE vocabularies and gives Cyrillic (two bytes per letter) about two letters per token.
+    """
+    return (len(text.encode("utf-8")) + 3) // 4
+
+_tokenizer_counter: Optional[Callable[[str], int]] = None
+_tokenizer_loaded = False
+
+def get_token_counter() -> Callable[[str], int]:
+    """
+    The exact counter for PROMPT_TOKENIZER when it is set and the optional `tokenizers`
+    package can load it; otherwise estimate_tokens.
+    """
+    global _tokenizer_counter, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        if settings.PROMPT_TOKENIZER:
+            try:
+                from tokenizers import Tokenizer
+                tokenizer = Tokenizer.from_pretrained(settings.PROMPT_TOKENIZER)
+                _tokenizer_counter = lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+                logger.info(f"Counting prompt tokens with tokenizer {settings.PROMPT_TOKENIZER}")
+            except Exception as e:
+                logger.warning(f"Could not load tokenizer {settings.PROMPT_TOKENIZER}, estimating token counts: {str(e)}")
+    return _tokenizer_counter or estimate_tokens
+
+class PromptTooLong(Exception):
+    """The user message alone exceeds the prompt budget."""
+
+class PromptBuilder:
+    """
+    Assembles system prompt, retrieved memories and the user message within a token budget:
+    MAX_CONTEXT_TOKENS minus LLM_MAX_TOKENS reserved for the response. The user message
+    is kept first, then the system prompt; memories are packed best score first, and one
+    that does not fit whole is truncated to the remaining budget or dropped.
+    """
+
+    def __init__(self, max_context_tokens: Optional[int] = None, response_tokens: Optional[int] = None,
+                 count_tokens: Optional[Callable[[str], int]] = None):
+        max_context_tokens = max_context_tokens or settings.MAX_CONTEXT_TOKENS
+        response_tokens = settings.LLM_MAX_TOKENS if response_tokens is None else response_tokens
+        self.budget = max(1, max_context_tokens - response_tokens)
+        self.count_tokens = count_tokens or get_token_counter()
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut text down to max_tokens, keeping its beginning."""
+        if max_tokens <= 0:
+            return ""
+        tokens = self.count_tokens(text)
+        if tokens <= max_tokens:
+            return text
+        # Token counts are close to proportional to length, so cut proportionally and shrink until it fits.
+        length = int(len(text) * max_tokens / tokens)
+        while length > 0:
+            candidate = text[:length].rstrip() + TRUNCATION_MARKER
+            if self.count_tokens(candidate) <= max_tokens:
+                return candidate
+            length = int(length * 0.9)
+        return ""
+
+    def build(self, system_prompt: str, memories: List[Dict], user_message: str) -> Dict:
+        """
+        Returns the prompt with its token count, the memories that made it in, how many
+        were dropped, and whether anything was truncated.
+        """
+        budget = self.budget
+        truncated = False
+
+        user_part = "User: " + user_message + "\nAssistant:"
+        user_tokens = self.count_tokens(user_part)
+        if user_tokens > budget:
+            user_part = self.truncate("User: " + user_message, budget - self.count_tokens("\nAssistant:")) + "\nAssistant:"
+            user_tokens = self.count_tokens(user_part)
+            truncated = True
+        remaining = budget - user_tokens
+
+        system_part = ""
+        if system_prompt:
+            system_part = system_prompt + "\n\n"
+            if self.count_tokens(system_part) > remaining:
+                system_part = self.truncate(system_prompt, remaining - 1)
+                system_part = system_part + "\n\n" if system_part else ""
+                truncated = True
+            remaining -= self.count_tokens(system_part)
+
+        memory_block, used, remaining, memories_truncated = self._pack_memories(memories, remaining)
+        prompt = system_part + memory_block + user_part
+        return self._result(prompt, budget - remaining, memories, used, truncated or memories_truncated)
+
+    def build_messages(self, system_prompt: str, history: List[Dict], memories: List[Dict], user_message: str) -> Dict:
+        """
+        Chat-mode variant for /api/chat: the system prompt and prior turns form a stable
+        message prefix the backend can reuse from its KV cache, and the retrieved memories
+        go into the new user message. The user message is never cut: the system prompt is
+        truncated, then the oldest turns of `history` are deleted in place (a user/assistant
+        pair at a time) until it fits, and PromptTooLong is raised if it cannot fit even on
+        its own. Memories get whatever budget is left.
+        """
+        budget = self.budget
+        user_tokens = self.count_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+        if user_tokens > budget:
+            raise PromptTooLong(
+                f"The message needs about {user_tokens} tokens but the context budget is {budget} tokens"
+            )
+        remaining = budget - user_tokens
+        truncated = False
+
+        messages = []
+        if system_prompt:
+            if self.count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS > remaining:
+                system_prompt = self.truncate(system_prompt, remaining - MESSAGE_OVERHEAD_TOKENS)
+                truncated = True
+            if system_prompt:
+                messages.append({"role": "system", "content": system_prompt})
+                remaining -= self.count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS
+
+        history_tokens = sum(self.count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in history)
+        while history and history_tokens > remaining:
+            history_tokens -= sum(self.count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in history[:2])
+            del history[:2]
+            truncated = True
+        messages.extend(history)
+        remaining -= history_tokens
+
+        memory_block, used, remaining, memories_truncated = self._pack_memories(memories, remaining)
+        messages.append({"role": "user", "content": memory_block + user_message})
+        result = self._result(None, budget - remaining, memories, used, truncated or memories_truncated)
+        result['messages'] = messages
+        return result
+
+    def _pack_memories(self, memories: List[Dict], remaining: int):
+        """Fit memories, best score first, into `remaining` tokens. Returns (block, used, remaining, truncated)."""
+        memory_lines = []
+        used = []
+        truncated = False
+        if memories and remaining > self.count_tokens(MEMORY_HEADER) + 1:
+            remaining -= self.count_tokens(MEMORY_HEADER) + 1  # header and the closing blank line
+            ranked = sorted(memories, key=lambda m: m.get('score', m.get('similarity') or 0.0), reverse=True)
+            for memory in ranked:
+                line = memory.get('text', '') + "\n"
+                line_tokens = self.count_tokens(line)
+                if line_tokens > remaining:
+                    if remaining < settings.PROMPT_MIN_MEMORY_TOKENS:
+                        break
+                    line = self.truncate(memory.get('text', ''), remaining - 1) + "\n"
+                    line_tokens = self.count_tokens(line)
+                    truncated = True
+                memory_lines.append(line)
+                used.append(memory)
+                remaining -= line_tokens
+        block = MEMORY_HEADER + "".join(memory_lines) + "\n" if memory_lines else ""
+        return block, used, remaining, truncated
+
+    def _result(self, prompt: Optional[str], tokens: int, memories: List[Dict], used: List[Dict], truncated: bool) -> Dict:
+        dropped = len(memories or []) - len(used)
+        if dropped or truncated:
+            logger.info(f"Prompt packed to the {self.budget}-token budget: {len(used)} memories used, {dropped} dropped")
+        return {
+            'prompt': prompt,
+            'tokens': tokens,
+            'memories': used,
+            'dropped_memories': dropped,
+            'truncated': truncated
+        }
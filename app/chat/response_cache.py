@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from ..config.settings import settings
+from .embed_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+def response_key(model: str, context: str, prompt: str) -> str:
+    key = "\x00".join((model, context or "", normalize_text(prompt).lower()))
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+def prompt_context(system_prompt: str, history: List[Dict], memories: List[Dict]) -> str:
+    """
+    Digest of everything in a built prompt besides the user message: the system prompt,
+    the replayed turns and the injected memories. A response is only reused for the same
+    context, so an answer drawn from one session's memories or history never reaches another.
+    """
+    digest = hashlib.sha256((system_prompt or "").encode("utf-8"))
+    for turn in history:
+        digest.update(b"\x00" + turn.get("role", "").encode("utf-8") + b"\x01" + turn.get("content", "").encode("utf-8"))
+    digest.update(b"\x02")
+    for memory in memories:
+        digest.update(b"\x00" + memory.get("text", "").encode("utf-8"))
+    return digest.hexdigest()
+
+class ResponseCache:
+    """
+    Cache of generated chat responses, keyed by (model, prompt context, normalized user
+    message), where the context is the prompt_context digest of the built prompt. With
+    semantic lookup, messages that miss the exact key are matched against the embeddings
+    of cached messages with the same model and context, each (model, context) having its
+    own small FAISS index. Entries expire after ttl seconds; the least recently used go
+    first once max_entries is reached.
+
+    Since the context includes the replayed conversation, only requests with the same
+    history can hit: in conversation mode that is a session's first turn, otherwise any
+    request with the same system prompt and memories.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600.0,
+                 semantic: bool = True, similarity: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._id_to_key: Dict[int, str] = {}
+        self._next_id = 0
+        self._indexes: Dict[Tuple[str, str], faiss.Index] = {}
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _live(self, key: str, now: float) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if now - entry['created'] > self.ttl:
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        if entry['id'] is not None:
+            del self._id_to_key[entry['id']]
+            group = (entry['model'], entry['context'])
+            index = self._indexes[group]
+            index.remove_ids(np.array([entry['id']], dtype='int64'))
+            if not index.ntotal:
+                del self._indexes[group]
+
+    def _hit(self, key: str, entry: Dict) -> str:
+        self._entries.move_to_end(key)
+        entry['hits'] += 1
+        return entry['response']
+
+    def get(self, model: str, context: str, prompt: str) -> Optional[str]:
+        """Exact lookup; does not count a miss, since a semantic lookup may follow."""
+        key = response_key(model, context, prompt)
+        entry = self._live(key, time.monotonic())
+        if entry is None:
+            return None
+        self.exact_hits += 1
+        return self._hit(key, entry)
+
+    def get_similar(self, model: str, context: str, embedding: Optional[List[float]]) -> Optional[str]:
+        """Nearest cached message with the same model and context, if similar enough; counts the miss otherwise."""
+        index = self._indexes.get((model, context or ""))
+        if embedding is not None and self.semantic and index is not None:
+            vector = self._normalize(embedding)
+            if vector.shape[1] == index.d:
+                now = time.monotonic()
+                # Only this model and context are searched; expired entries are skipped.
+                scores, ids = index.search(vector, min(8, index.ntotal))
+                for score, entry_id in zip(scores[0], ids[0]):
+                    if entry_id < 0 or score < self.similarity:
+                        break
+                    key = self._id_to_key.get(int(entry_id))
+                    entry = self._live(key, now) if key is not None else None
+                    if entry is not None:
+                        self.semantic_hits += 1
+                        return self._hit(key, entry)
+        self.misses += 1
+        return None
+
+    def put(self, model: str, context: str, prompt: str, response: str,
+            embedding: Optional[List[float]] = None):
+        if not response:
+            return
+        key = response_key(model, context, prompt)
+        if key in self._entries:
+            self._remove(key)
+        entry_id = None
+        if embedding is not None and self.semantic:
+            vector = self._normalize(embedding)
+            group = (model, context or "")
+            index = self._indexes.get(group)
+            if index is None:
+                index = self._indexes[group] = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            if vector.shape[1] == index.d:
+                entry_id = self._next_id
+                self._next_id += 1
+                index.add_with_ids(vector, np.array([entry_id], dtype='int64'))
+                self._id_to_key[entry_id] = key
+        self._entries[key] = {
+            'id': entry_id,
+            'model': model,
+            'context': context or "",
+            'response': response,
+            'created': time.monotonic(),
+            'hits': 0
+        }
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype='float32').reshape(1, -1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return {
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "contexts": len(self._indexes),
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+_response_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide response cache, or None when disabled in settings."""
+    global _response_cache
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None
+    if _response_cache is None:
+        _response_cache = ResponseCache(
+            max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=settings.RESPONSE_CACHE_TTL,
+            semantic=settings.RESPONSE_CACHE_SEMANTIC,
+            similarity=settings.RESPONSE_CACHE_SIMILARITY
+        )
+    return _response_cache
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Optional
+
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Interactive /chat requests are always granted before background work such as /memorize.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+class SchedulerRejected(Exception):
+    """Raised instead of queueing when the backend is overloaded; maps to an HTTP status with Retry-After."""
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class _Waiter:
+    __slots__ = ("future", "session", "priority")
+
+    def __init__(self, future: asyncio.Future, session: str, priority: int):
+        self.future = future
+        self.session = session
+        self.priority = priority
+
+class SchedulerLease:
+    """A granted slot; release() is idempotent so streaming responses can release from several paths."""
+
+    def __init__(self, scheduler: 'ModelScheduler'):
+        self._scheduler = scheduler
+        self._start = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._scheduler.release(time.monotonic() - self._start)
+
+class ModelScheduler:
+    """
+    Admission control for one model: at most max_concurrency generations run at once,
+    and up to max_queue more wait, each for at most max_wait seconds. Waiters are
+    granted by priority, and round-robin across sessions within a priority, so one busy
+    session cannot starve the others. A full queue rejects immediately (429), except
+    that an interactive request displaces the newest background waiter; a waiter that
+    times out gets 503. Both carry a Retry-After estimated from recent service times.
+    """
+
+    def __init__(self, model: str, max_concurrency: int = 2, max_queue: int = 32, max_wait: float = 20.0):
+        self.model = model
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._queues: Dict[int, "OrderedDict[str, Deque[_Waiter]]"] = {p: OrderedDict() for p in PRIORITIES}
+        self.running = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.service_time = 5.0  # moving average of seconds per generation
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.service_time * (self.queued + 1) / self.max_concurrency))
+
+    async def lease(self, session: str, priority: int = PRIORITY_INTERACTIVE) -> SchedulerLease:
+        if self.running < self.max_concurrency and not self.queued:
+            self.running += 1
+            self.admitted += 1
+            return SchedulerLease(self)
+        if self.queued >= self.max_queue and not (priority == PRIORITY_INTERACTIVE and self._shed_background()):
+            self.rejected += 1
+            raise SchedulerRejected(f"Model {self.model} is overloaded; try again later", 429, self.retry_after())
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), session, priority)
+        self._queues[priority].setdefault(session, deque()).append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not self._granted(waiter):
+                self._discard(waiter)
+                self.timed_out += 1
+                raise SchedulerRejected(f"Timed out waiting for model {self.model}", 503, self.retry_after())
+        except asyncio.CancelledError:
+            if self._granted(waiter):
+                self.release(0.0)
+            elif not waiter.future.done():
+                self._discard(waiter)
+            raise
+        self.admitted += 1
+        return SchedulerLease(self)
+
+    @asynccontextmanager
+    async def slot(self, session: str, priority: int = PRIORITY_INTERACTIVE):
+        lease = await self.lease(session, priority)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    @staticmethod
+    def _granted(waiter: _Waiter) -> bool:
+        return waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None
+
+    def release(self, elapsed: float):
+        self.running -= 1
+        if elapsed > 0:
+            self.service_time = 0.8 * self.service_time + 0.2 * elapsed
+        while self.running < self.max_concurrency and self.queued:
+            waiter = self._next_waiter()
+            self.running += 1
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> _Waiter:
+        for priority in PRIORITIES:
+            queues = self._queues[priority]
+            if queues:
+                session, waiters = next(iter(queues.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    queues.move_to_end(session)
+                else:
+                    del queues[session]
+                self.queued -= 1
+                return waiter
+        raise RuntimeError("scheduler queue count out of sync")
+
+    def _discard(self, waiter: _Waiter):
+        waiters = self._queues[waiter.priority].get(waiter.session)
+        if waiters is not None and waiter in waiters:
+            waiters.remove(waiter)
+            if not waiters:
+                del self._queues[waiter.priority][waiter.session]
+            self.queued -= 1
+
+    def _shed_background(self) -> bool:
+        """Reject the newest background waiter to make room for an interactive request."""
+        queues = self._queues[PRIORITY_BACKGROUND]
+        if not queues:
+            return False
+        session = next(reversed(queues))
+        waiter = queues[session].pop()
+        if not queues[session]:
+            del queues[session]
+        self.queued -= 1
+        self.shed += 1
+        waiter.future.set_exception(
+            SchedulerRejected(f"Displaced by interactive requests for model {self.model}", 503, self.retry_after())
+        )
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            'running': self.running,
+            'queued': self.queued,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'shed': self.shed,
+            'timed_out': self.timed_out,
+            'service_time': self.service_time
+        }
+
+class RequestScheduler:
+    """One ModelScheduler per chat model, created on first use."""
+
+    def __init__(self):
+        self._models: Dict[str, ModelScheduler] = {}
+
+    def get(self, model: str) -> ModelScheduler:
+        if model not in self._models:
+            self._models[model] = ModelScheduler(
+                model,
+                max_concurrency=settings.SCHEDULER_MAX_CONCURRENCY,
+                max_queue=settings.SCHEDULER_MAX_QUEUE,
+                max_wait=settings.SCHEDULER_MAX_WAIT
+            )
+        return self._models[model]
+
+    def stats(self) -> Dict:
+        return {model: scheduler.stats() for model, scheduler in self._models.items()}
+
+_scheduler: Optional[RequestScheduler] = None
+
+def get_scheduler() -> RequestScheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = RequestScheduler()
+    return _scheduler
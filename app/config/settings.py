@@ -19,9 +19,96 @@ OLLAMA_BASE_URL = "http://localhost:11434"
 OLLAMA_EMBEDDING_MODEL = "mxbai-embed-large:latest"  # For embeddings
 OLLAMA_CHAT_MODEL = "phi-4-Q5_K_Munsloth:latest"  # For chat responses
 
+# Ollama backends: requests go to the least busy healthy host, preferring hosts with the model loaded.
+# Chat and embedding traffic can use separate pools.
+OLLAMA_CHAT_BACKENDS = [OLLAMA_BASE_URL]
+OLLAMA_EMBEDDING_BACKENDS = [OLLAMA_BASE_URL]
+OLLAMA_HEALTH_CHECK_INTERVAL = 10.0  # Seconds between /api/ps probes of every backend
+OLLAMA_HEALTH_CHECK_TIMEOUT = 2.0    # Seconds a probe may take
+OLLAMA_BACKEND_MAX_FAILURES = 3      # Consecutive failures before a backend is ejected
+OLLAMA_BACKEND_EJECT_SECONDS = 30.0  # How long an ejected backend is skipped unless a probe passes
+
+# Ollama HTTP connection pool (shared by every OllamaClient, MemoryDB and OllamaEmbedder)
+OLLAMA_POOL_MAX_CONNECTIONS = 100    # Upper bound on open connections to Ollama
+OLLAMA_POOL_MAX_KEEPALIVE = 20       # Idle connections kept alive for reuse
+OLLAMA_POOL_KEEPALIVE_EXPIRY = 30.0  # Seconds an idle connection is kept
+OLLAMA_CONNECT_TIMEOUT = 5.0         # Seconds to establish a connection
+OLLAMA_READ_TIMEOUT = 30.0           # Seconds to wait for (the next chunk of) a response
+OLLAMA_WRITE_TIMEOUT = 30.0          # Seconds to send a request body
+OLLAMA_POOL_TIMEOUT = 10.0           # Seconds to wait for a free connection from the pool
+
+# Threads for blocking work (FAISS searches, NumPy, file I/O) kept off the event loop
+BLOCKING_POOL_WORKERS = 8
+
+# Embedding micro-batching: concurrent embedding requests are coalesced into one /api/embed call
+EMBEDDING_BATCH_MAX_SIZE = 32      # Flush a batch once this many texts are pending
+EMBEDDING_BATCH_MAX_WAIT_MS = 5.0  # ...or once the oldest pending text has waited this long
+
+# Embedding cache: in-memory LRU plus an optional on-disk tier that survives restarts
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_MAX_ENTRIES = 10000          # Vectors kept in the in-memory LRU
+EMBEDDING_CACHE_PERSIST = True               # Also keep vectors in a memory-mapped file per model
+EMBEDDING_CACHE_PATH = os.path.join(MEMORY_PATH, "embedding_cache")
+EMBEDDING_CACHE_DISK_MAX_ENTRIES = 1000000   # Stop persisting new vectors past this many per model
+
 # Memory DB settings
 MEMORY_SIMILARITY_THRESHOLD = 0.3
 MEMORY_MAX_RESULTS = 5
+MEMORY_QUERY_MAX_K = 50            # /memory/query: larger k values are capped to this
+MEMORY_QUERY_MAX_QUERIES = 64      # /memory/query: most queries accepted in one request
+
+# Memory index tiers: small sessions use an exact flat index, large ones an ANN index
+MEMORY_INDEX_TIER = "auto"                 # "flat", "hnsw", "ivf", or "auto" (flat until the threshold)
+MEMORY_INDEX_ANN_TIER = "hnsw"             # ANN tier used by "auto": "hnsw" or "ivf"
+MEMORY_INDEX_ANN_THRESHOLD = 200000        # Memories per session at which "auto" switches to the ANN tier
+MEMORY_INDEX_HNSW_M = 32                   # HNSW graph degree
+MEMORY_INDEX_HNSW_EF_CONSTRUCTION = 200    # HNSW build-time beam width
+MEMORY_INDEX_HNSW_EF_SEARCH = 64           # HNSW query-time beam width
+MEMORY_INDEX_IVF_NLIST = 0                 # IVF inverted lists; 0 = 4 * sqrt(number of vectors)
+MEMORY_INDEX_IVF_NPROBE = 16               # IVF lists scanned per query
+MEMORY_INDEX_TOMBSTONE_RATIO = 0.2         # Rebuild an HNSW index once this share of it is deleted
+MEMORY_INDEX_PERSIST = True                # Save the index next to the snapshot and load it on start
+MEMORY_INDEX_RECALL_SAMPLE_RATE = 0.01     # Share of ANN queries checked against exact search for recall
+
+# Lexical (BM25) index kept next to the vectors; queries fuse both rankings
+MEMORY_LEXICAL_ENABLED = True
+MEMORY_RRF_K = 60                  # Reciprocal rank fusion constant: score = sum of 1 / (k + rank)
+MEMORY_LEXICAL_MIN_SCORE = 0.5     # BM25 hits scoring lower are ignored
+MEMORY_EMBED_DEADLINE_MS = 1500.0  # Queries fall back to lexical-only results if the embedding takes longer (0 waits forever)
+
+# Reranking: FAISS over-fetches k x MEMORY_RERANK_OVERFETCH candidates, rescored on
+# similarity, recency and importance (both decay one ImportanceScorer/RecencyScorer step per period)
+MEMORY_RERANK_ENABLED = True
+MEMORY_RERANK_OVERFETCH = 4
+MEMORY_RERANK_SIMILARITY_WEIGHT = 1.0
+MEMORY_RERANK_RECENCY_WEIGHT = 0.1
+MEMORY_RERANK_IMPORTANCE_WEIGHT = 0.1
+MEMORY_DECAY_PERIOD_HOURS = 24.0
+
+# Shared vector store: one set of sharded indexes for all loaded sessions instead of one index each
+MEMORY_SHARED_STORE = False        # MemoryDB becomes a per-session view filtered by session id
+MEMORY_SHARED_STORE_SHARDS = 4     # Number of indexes the sessions are spread over
+
+# Loaded session memories: least recently used sessions are flushed and unloaded past these caps
+SESSION_CACHE_MAX_SESSIONS = 64                # Sessions kept in memory at once
+SESSION_CACHE_MAX_BYTES = 2 * 1024 ** 3        # Estimated bytes of loaded memories
+SESSION_CACHE_IDLE_SECONDS = 1800.0            # Unload sessions unused for this long
+SESSION_CACHE_SWEEP_INTERVAL = 60.0            # How often idle sessions are looked for (seconds)
+
+# Serialization: orjson and msgpack are optional; without them the stdlib json module is used
+SERIALIZATION_FAST_JSON = True                 # orjson for API responses, stream parsing and JSON files
+SERIALIZATION_RECORD_CODEC = "jsonl"           # Session segments and memory records: "jsonl" or "msgpack" (read either way)
+
+# Session history is stored as append-only segments, one record per chat turn
+SESSION_SEGMENT_TURNS = 256                    # Turns per segment before a new one is started
+SESSION_COMPACT_SEGMENTS = 8                   # Sealed segments that trigger a background merge into one gzip'd segment
+SESSION_CATALOG_PATH = os.path.join(BASE_DIR, "data", "session_catalog.sqlite3")  # Rebuilt from SESSIONS_PATH if missing
+
+# Memory write-ahead log: inserts are appended and folded into the snapshot by compaction
+WAL_FSYNC_BATCH = 32            # fsync once this many entries are unsynced...
+WAL_FSYNC_INTERVAL_MS = 50.0    # ...or this long after the oldest unsynced entry
+WAL_COMPACT_THRESHOLD = 1000    # Compact once the log holds this many entries
+WAL_COMPACT_INTERVAL = 300.0    # Compact a non-empty log at least this often (seconds)
 
 # LLM settings
 LLM_TEMPERATURE = 0.7  # Controls randomness: 0.0 = deterministic, 1.0 = more random
@@ -32,6 +119,47 @@ LLM_PRESENCE_PENALTY = 0.0   # Encourage introducing new topics
 LLM_REPETITION_PENALTY = 1.2 # Penalty for repeating tokens/phrases
 MAX_CONTEXT_TOKENS = 8000  # Reduced value for testing memory recall
 
+# Prompt assembly: the prompt plus LLM_MAX_TOKENS of response must fit in MAX_CONTEXT_TOKENS
+PROMPT_TOKENIZER = None          # Optional Hugging Face tokenizer name for exact counts (needs `tokenizers`); None estimates
+PROMPT_MIN_MEMORY_TOKENS = 32    # A memory is truncated to the remaining budget only if at least this much is left
+
+# Conversation mode: /chat uses /api/chat with the session's prior turns as a stable prefix,
+# so Ollama reuses its KV cache instead of re-prefilling the whole context every turn
+CHAT_CONVERSATION_MODE = True
+CHAT_HISTORY_MAX_SHARE = 0.5     # Share of MAX_CONTEXT_TOKENS the replayed history may use before old turns are dropped
+OLLAMA_KEEP_ALIVE = "30m"        # How long Ollama keeps the model (and its cache) loaded after a request
+
+# Model residency: configured models are loaded at startup and touched periodically so they stay loaded
+MODEL_WARMUP_ENABLED = True
+MODEL_WARMUP_CHAT_MODELS = [OLLAMA_CHAT_MODEL]
+MODEL_WARMUP_EMBEDDING_MODELS = [OLLAMA_EMBEDDING_MODEL]
+MODEL_RESIDENCY_INTERVAL = 120.0  # Seconds between keep-alive touches (well below OLLAMA_KEEP_ALIVE)
+MODEL_WARMUP_TIMEOUT = 300.0      # Seconds a model load may take
+MODEL_WARM_ON_SWITCH = True       # Load a model as soon as a session selects it (POST /models/warm)
+
+# Background memorization: /memorize enqueues a job and returns its id right away
+MEMORIZE_WORKERS = 2              # Concurrent batches
+MEMORIZE_BATCH_SIZE = 8           # Jobs summarized together and stored with one add_memories per session
+MEMORIZE_MAX_PENDING = 256        # Further submissions get 503 with Retry-After
+MEMORIZE_MAX_ATTEMPTS = 3
+MEMORIZE_JOB_RETENTION = 3600     # Seconds a finished job stays available at /memorize/{job_id}
+MEMORIZE_SHUTDOWN_GRACE = 10.0    # Seconds queued jobs get to finish at shutdown
+
+# Response cache (opt-in): repeated questions are answered from cache instead of a new generation.
+# Entries are keyed on the whole prompt context (system prompt, replayed turns, memories), so
+# it only helps first-turn or non-conversation traffic (CHAT_CONVERSATION_MODE = False); later
+# turns of a conversation never repeat a context.
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_MAX_ENTRIES = 1000  # Least recently used responses are evicted beyond this
+RESPONSE_CACHE_TTL = 3600.0        # Seconds a cached response stays valid
+RESPONSE_CACHE_SEMANTIC = True     # Also match near-duplicate questions by embedding similarity
+RESPONSE_CACHE_SIMILARITY = 0.95   # Minimum cosine similarity for a near-duplicate hit
+
+# Generation scheduler: admission control per chat model in front of Ollama
+SCHEDULER_MAX_CONCURRENCY = 2    # Generations running at once per model (match OLLAMA_NUM_PARALLEL)
+SCHEDULER_MAX_QUEUE = 32         # Requests waiting per model before new ones get 429
+SCHEDULER_MAX_WAIT = 20.0        # Seconds a request may wait for a slot before it gets 503
+
 # Chat settings
 SYSTEM_PROMPT = f"""You are a helpful AI assistant. Current time: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC.
 Use the context from relevant memories if provided to give more informed answers.
@@ -44,8 +172,67 @@ settings = SimpleNamespace(
     OLLAMA_BASE_URL=OLLAMA_BASE_URL,
     OLLAMA_EMBEDDING_MODEL=OLLAMA_EMBEDDING_MODEL,
     OLLAMA_CHAT_MODEL=OLLAMA_CHAT_MODEL,
+    OLLAMA_CHAT_BACKENDS=OLLAMA_CHAT_BACKENDS,
+    OLLAMA_EMBEDDING_BACKENDS=OLLAMA_EMBEDDING_BACKENDS,
+    OLLAMA_HEALTH_CHECK_INTERVAL=OLLAMA_HEALTH_CHECK_INTERVAL,
+    OLLAMA_HEALTH_CHECK_TIMEOUT=OLLAMA_HEALTH_CHECK_TIMEOUT,
+    OLLAMA_BACKEND_MAX_FAILURES=OLLAMA_BACKEND_MAX_FAILURES,
+    OLLAMA_BACKEND_EJECT_SECONDS=OLLAMA_BACKEND_EJECT_SECONDS,
+    OLLAMA_POOL_MAX_CONNECTIONS=OLLAMA_POOL_MAX_CONNECTIONS,
+    OLLAMA_POOL_MAX_KEEPALIVE=OLLAMA_POOL_MAX_KEEPALIVE,
+    OLLAMA_POOL_KEEPALIVE_EXPIRY=OLLAMA_POOL_KEEPALIVE_EXPIRY,
+    OLLAMA_CONNECT_TIMEOUT=OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_READ_TIMEOUT=OLLAMA_READ_TIMEOUT,
+    OLLAMA_WRITE_TIMEOUT=OLLAMA_WRITE_TIMEOUT,
+    OLLAMA_POOL_TIMEOUT=OLLAMA_POOL_TIMEOUT,
+    BLOCKING_POOL_WORKERS=BLOCKING_POOL_WORKERS,
+    EMBEDDING_BATCH_MAX_SIZE=EMBEDDING_BATCH_MAX_SIZE,
+    EMBEDDING_BATCH_MAX_WAIT_MS=EMBEDDING_BATCH_MAX_WAIT_MS,
+    EMBEDDING_CACHE_ENABLED=EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_MAX_ENTRIES=EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_CACHE_PERSIST=EMBEDDING_CACHE_PERSIST,
+    EMBEDDING_CACHE_PATH=EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_DISK_MAX_ENTRIES=EMBEDDING_CACHE_DISK_MAX_ENTRIES,
     MEMORY_SIMILARITY_THRESHOLD=MEMORY_SIMILARITY_THRESHOLD,
     MEMORY_MAX_RESULTS=MEMORY_MAX_RESULTS,
+    MEMORY_QUERY_MAX_K=MEMORY_QUERY_MAX_K,
+    MEMORY_QUERY_MAX_QUERIES=MEMORY_QUERY_MAX_QUERIES,
+    MEMORY_INDEX_TIER=MEMORY_INDEX_TIER,
+    MEMORY_INDEX_ANN_TIER=MEMORY_INDEX_ANN_TIER,
+    MEMORY_INDEX_ANN_THRESHOLD=MEMORY_INDEX_ANN_THRESHOLD,
+    MEMORY_INDEX_HNSW_M=MEMORY_INDEX_HNSW_M,
+    MEMORY_INDEX_HNSW_EF_CONSTRUCTION=MEMORY_INDEX_HNSW_EF_CONSTRUCTION,
+    MEMORY_INDEX_HNSW_EF_SEARCH=MEMORY_INDEX_HNSW_EF_SEARCH,
+    MEMORY_INDEX_IVF_NLIST=MEMORY_INDEX_IVF_NLIST,
+    MEMORY_INDEX_IVF_NPROBE=MEMORY_INDEX_IVF_NPROBE,
+    MEMORY_INDEX_TOMBSTONE_RATIO=MEMORY_INDEX_TOMBSTONE_RATIO,
+    MEMORY_INDEX_PERSIST=MEMORY_INDEX_PERSIST,
+    MEMORY_INDEX_RECALL_SAMPLE_RATE=MEMORY_INDEX_RECALL_SAMPLE_RATE,
+    MEMORY_LEXICAL_ENABLED=MEMORY_LEXICAL_ENABLED,
+    MEMORY_RRF_K=MEMORY_RRF_K,
+    MEMORY_LEXICAL_MIN_SCORE=MEMORY_LEXICAL_MIN_SCORE,
+    MEMORY_EMBED_DEADLINE_MS=MEMORY_EMBED_DEADLINE_MS,
+    MEMORY_RERANK_ENABLED=MEMORY_RERANK_ENABLED,
+    MEMORY_RERANK_OVERFETCH=MEMORY_RERANK_OVERFETCH,
+    MEMORY_RERANK_SIMILARITY_WEIGHT=MEMORY_RERANK_SIMILARITY_WEIGHT,
+    MEMORY_RERANK_RECENCY_WEIGHT=MEMORY_RERANK_RECENCY_WEIGHT,
+    MEMORY_RERANK_IMPORTANCE_WEIGHT=MEMORY_RERANK_IMPORTANCE_WEIGHT,
+    MEMORY_DECAY_PERIOD_HOURS=MEMORY_DECAY_PERIOD_HOURS,
+    MEMORY_SHARED_STORE=MEMORY_SHARED_STORE,
+    MEMORY_SHARED_STORE_SHARDS=MEMORY_SHARED_STORE_SHARDS,
+    SESSION_CACHE_MAX_SESSIONS=SESSION_CACHE_MAX_SESSIONS,
+    SESSION_CACHE_MAX_BYTES=SESSION_CACHE_MAX_BYTES,
+    SESSION_CACHE_IDLE_SECONDS=SESSION_CACHE_IDLE_SECONDS,
+    SESSION_CACHE_SWEEP_INTERVAL=SESSION_CACHE_SWEEP_INTERVAL,
+    SERIALIZATION_FAST_JSON=SERIALIZATION_FAST_JSON,
+    SERIALIZATION_RECORD_CODEC=SERIALIZATION_RECORD_CODEC,
+    SESSION_SEGMENT_TURNS=SESSION_SEGMENT_TURNS,
+    SESSION_COMPACT_SEGMENTS=SESSION_COMPACT_SEGMENTS,
+    SESSION_CATALOG_PATH=SESSION_CATALOG_PATH,
+    WAL_FSYNC_BATCH=WAL_FSYNC_BATCH,
+    WAL_FSYNC_INTERVAL_MS=WAL_FSYNC_INTERVAL_MS,
+    WAL_COMPACT_THRESHOLD=WAL_COMPACT_THRESHOLD,
+    WAL_COMPACT_INTERVAL=WAL_COMPACT_INTERVAL,
     # LLM settings
     LLM_TEMPERATURE=LLM_TEMPERATURE,
     LLM_MAX_TOKENS=LLM_MAX_TOKENS,
@@ -53,5 +240,31 @@ settings = SimpleNamespace(
     LLM_FREQUENCY_PENALTY=LLM_FREQUENCY_PENALTY,
     LLM_PRESENCE_PENALTY=LLM_PRESENCE_PENALTY,
     LLM_REPETITION_PENALTY=LLM_REPETITION_PENALTY,
+    MAX_CONTEXT_TOKENS=MAX_CONTEXT_TOKENS,
+    PROMPT_TOKENIZER=PROMPT_TOKENIZER,
+    PROMPT_MIN_MEMORY_TOKENS=PROMPT_MIN_MEMORY_TOKENS,
+    CHAT_CONVERSATION_MODE=CHAT_CONVERSATION_MODE,
+    CHAT_HISTORY_MAX_SHARE=CHAT_HISTORY_MAX_SHARE,
+    OLLAMA_KEEP_ALIVE=OLLAMA_KEEP_ALIVE,
+    MODEL_WARMUP_ENABLED=MODEL_WARMUP_ENABLED,
+    MODEL_WARMUP_CHAT_MODELS=MODEL_WARMUP_CHAT_MODELS,
+    MODEL_WARMUP_EMBEDDING_MODELS=MODEL_WARMUP_EMBEDDING_MODELS,
+    MODEL_RESIDENCY_INTERVAL=MODEL_RESIDENCY_INTERVAL,
+    MODEL_WARMUP_TIMEOUT=MODEL_WARMUP_TIMEOUT,
+    MODEL_WARM_ON_SWITCH=MODEL_WARM_ON_SWITCH,
+    MEMORIZE_WORKERS=MEMORIZE_WORKERS,
+    MEMORIZE_BATCH_SIZE=MEMORIZE_BATCH_SIZE,
+    MEMORIZE_MAX_PENDING=MEMORIZE_MAX_PENDING,
+    MEMORIZE_MAX_ATTEMPTS=MEMORIZE_MAX_ATTEMPTS,
+    MEMORIZE_JOB_RETENTION=MEMORIZE_JOB_RETENTION,
+    MEMORIZE_SHUTDOWN_GRACE=MEMORIZE_SHUTDOWN_GRACE,
+    RESPONSE_CACHE_ENABLED=RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_ENTRIES=RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_TTL=RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_SEMANTIC=RESPONSE_CACHE_SEMANTIC,
+    RESPONSE_CACHE_SIMILARITY=RESPONSE_CACHE_SIMILARITY,
+    SCHEDULER_MAX_CONCURRENCY=SCHEDULER_MAX_CONCURRENCY,
+    SCHEDULER_MAX_QUEUE=SCHEDULER_MAX_QUEUE,
+    SCHEDULER_MAX_WAIT=SCHEDULER_MAX_WAIT,
     SYSTEM_PROMPT=SYSTEM_PROMPT,
 )
\ No newline at end of file
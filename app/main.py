@@ -1,22 +1,141 @@
+import asyncio
 import logging
 import uuid
 from fastapi import FastAPI, HTTPException, Request, Query
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
 from app.memory.memory_db import MemoryDB
+from app.memory.session_registry import SessionRegistry
+from app.memory.model_registry import get_model_registry
 from app.chat.ollama_client import OllamaClient
+from app.chat.http_client import init_http_client, close_http_client
+from app.chat.backends import backend_stats, start_health_checks, stop_health_checks
+from app.chat.model_warmup import get_residency_manager
+from app.chat.memorize_jobs import MemorizeQueue, MemorizeQueueFull
+from app.chat.embed_cache import get_embedding_cache
+from app.chat.prompt_builder import PromptBuilder, PromptTooLong
+from app.chat.conversation import ConversationStore
+from app.chat.response_cache import get_response_cache, prompt_context
+from app.chat.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, SchedulerRejected, get_scheduler
+from app.memory.index_tiers import stats_report
+from app.memory.shared_store import shared_store_stats
 from app.memory import session_manager
+from app.memory.session_catalog import SORT_COLUMNS, close_session_catalog
+from app.concurrency import get_executor, run_blocking, shutdown_executor
+from app.serialization import FastJSONResponse, json_dumps, json_loads
+from app.config.settings import settings
 
-app = FastAPI()
+# Responses are encoded with orjson when it is installed (see app.serialization).
+app = FastAPI(default_response_class=FastJSONResponse)
 logger = logging.getLogger("app.main")
 
 # Mount static files; index.html is served separately.
 app.mount("/static", StaticFiles(directory="app/static", html=True), name="static")
 
-# Global dictionary to hold session-related MemoryDB instances.
-session_memory_dbs = {}
+# OllamaClient instances keyed by chat model; all of them share one HTTP pool.
+ollama_clients = {}
+
+def get_ollama_client(chat_model: str = None) -> OllamaClient:
+    key = chat_model or ""
+    if key not in ollama_clients:
+        ollama_clients[key] = OllamaClient(chat_model=chat_model) if chat_model else OllamaClient()
+    return ollama_clients[key]
+
+async def load_session_memory(session_name: str) -> MemoryDB:
+    return await MemoryDB.create(
+        db_name="chat_memory",
+        session_name=session_name,
+        ollama_client=get_ollama_client()
+    )
+
+# Bounded registry of session-related MemoryDB instances (LRU, idle eviction, single-flight loads).
+session_memory_dbs = SessionRegistry(
+    load_session_memory,
+    max_sessions=settings.SESSION_CACHE_MAX_SESSIONS,
+    max_bytes=settings.SESSION_CACHE_MAX_BYTES,
+    idle_seconds=settings.SESSION_CACHE_IDLE_SECONDS,
+    sweep_interval=settings.SESSION_CACHE_SWEEP_INTERVAL
+)
+
+# Per-session chat history replayed to /api/chat so Ollama can reuse its cached prefix.
+session_conversations = ConversationStore(max_sessions=settings.SESSION_CACHE_MAX_SESSIONS)
+
+async def summarize_conversation(session_name: str, conversation_text: str) -> str:
+    prompt = (
+        "Please summarize the following conversation concisely, focusing on key points and important details.\n\n"
+        f"{conversation_text}\n\nSummary:"
+    )
+    # Summarization yields to interactive chat.
+    ollama_client = get_ollama_client()
+    async with get_scheduler().get(ollama_client.chat_model).slot(session_name, PRIORITY_BACKGROUND):
+        return await ollama_client.chat(prompt)
+
+async def store_summaries(session_name: str, summaries: list, metadatas: list) -> list:
+    async with session_memory_dbs.lease(session_name) as memory_db:
+        keys = await memory_db.add_memories(summaries, metadatas)
+        memory_count = len(memory_db.memories)
+    await run_blocking(session_manager.record_memories, session_name, memory_count)
+    return keys
+
+# Memorization runs as background jobs; /memorize only enqueues.
+memorize_queue = MemorizeQueue(
+    summarize_conversation,
+    store_summaries,
+    workers=settings.MEMORIZE_WORKERS,
+    batch_size=settings.MEMORIZE_BATCH_SIZE,
+    max_pending=settings.MEMORIZE_MAX_PENDING,
+    max_attempts=settings.MEMORIZE_MAX_ATTEMPTS,
+    retention=settings.MEMORIZE_JOB_RETENTION
+)
+
+@app.on_event("startup")
+async def startup_event():
+    await init_http_client()
+    get_executor()
+    # Opening the session catalog rebuilds it from disk if its database is missing.
+    await run_blocking(session_manager.get_catalog)
+    start_health_checks()
+    # Load the configured chat and embedding models now and keep them resident.
+    get_residency_manager().start()
+    session_memory_dbs.start()
+    memorize_queue.start()
+    # Learn the embedding dimension up front so the first session load needs no probe.
+    asyncio.get_running_loop().create_task(warm_model_registry())
+
+async def warm_model_registry():
+    try:
+        await get_model_registry().ensure_dimension(get_ollama_client())
+    except Exception as e:
+        logger.warning(f"Could not determine embedding dimension at startup: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    stop_health_checks()
+    get_residency_manager().stop()
+    await memorize_queue.close(settings.MEMORIZE_SHUTDOWN_GRACE)
+    await session_memory_dbs.close()
+    await close_http_client()
+    shutdown_executor()
+    close_session_catalog()
+
+@app.exception_handler(SchedulerRejected)
+async def scheduler_rejected_handler(request: Request, exc: SchedulerRejected):
+    return FastJSONResponse(
+        content={"detail": str(exc)},
+        status_code=exc.status_code,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.exception_handler(MemorizeQueueFull)
+async def memorize_queue_full_handler(request: Request, exc: MemorizeQueueFull):
+    return FastJSONResponse(
+        content={"detail": str(exc)},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 @app.get("/")
 async def root():
@@ -25,58 +144,341 @@ async def root():
         return FileResponse(index_path)
     raise HTTPException(status_code=404, detail="index.html not found")
 
+def sse_event(event: str, data: dict) -> str:
+    """Format one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json_dumps(data)}\n\n"
+
+async def stream_chat_events(tokens, memories: list, on_complete=None):
+    """
+    Forward tokens from Ollama as 'token' events; the closing 'done' event carries
+    the full response and the memories that were used for the prompt. on_complete
+    receives the full response once the stream finished without error.
+    """
+    response_parts = []
+    try:
+        async for token in tokens:
+            response_parts.append(token)
+            yield sse_event("token", {"token": token})
+        response = "".join(response_parts).strip()
+        if on_complete is not None:
+            on_complete(response)
+        yield sse_event("done", {"response": response, "memories": memories})
+    except Exception as e:
+        logger.error(f"Error while streaming chat response: {str(e)}")
+        yield sse_event("error", {"detail": str(e)})
+
+async def release_after(tokens, lease):
+    """Hold a scheduler slot for the lifetime of a token stream."""
+    try:
+        async for token in tokens:
+            yield token
+    finally:
+        lease.release()
+
+def cached_chat_events(response: str, memories: list):
+    """Replay a cached response as a single 'token' event followed by 'done'."""
+    yield sse_event("token", {"token": response})
+    yield sse_event("done", {"response": response, "memories": memories, "cached": True})
+
+async def lookup_cached_response(response_cache, ollama_client: OllamaClient, context: str, user_message: str):
+    """
+    Exact lookup first, then a near-duplicate search by embedding, both within the same
+    prompt context. Returns the cached response (or None) and the message embedding,
+    which is reused to store a new response.
+    """
+    model = ollama_client.chat_model
+    cached = response_cache.get(model, context, user_message)
+    if cached is not None:
+        return cached, None
+    embedding = None
+    if response_cache.semantic:
+        try:
+            embedding = await ollama_client.get_embedding(user_message)
+        except Exception as e:
+            logger.warning(f"Could not embed message for the response cache: {str(e)}")
+    return response_cache.get_similar(model, context, embedding), embedding
+
 @app.post("/chat")
 async def chat_endpoint(request: Request):
     try:
-        data = await request.json()
+        data = json_loads(await request.body())
         user_message = data.get("message", "")
         session_name = data.get("session", "").strip()  # session name provided in request
         system_prompt = data.get("system_prompt", "").strip()
         selected_model = data.get("model", None)
+        stream = bool(data.get("stream", False))
+        use_cache = bool(data.get("cache", True))  # per-request bypass of the response cache
         
         if not user_message:
             raise HTTPException(status_code=400, detail="Message not provided")
         if not session_name:
-            return JSONResponse(content={"detail": "Session name is required."}, status_code=400)
+            return FastJSONResponse(content={"detail": "Session name is required."}, status_code=400)
 
         logger.info(f"Received chat request: {user_message}")
 
-        # Use the session-specific MemoryDB instance.
-        if session_name not in session_memory_dbs:
-            session_memory_dbs[session_name] = await MemoryDB.create(
-                db_name="chat_memory",
-                session_name=session_name
-            )
-        memory_db = session_memory_dbs[session_name]
+        # Use selected model if provided; defaults to Gemma for chat.
+        ollama_client = get_ollama_client(selected_model)
+        if settings.MODEL_WARM_ON_SWITCH:
+            # A model no backend has loaded starts loading now, overlapping the memory lookup.
+            residency = get_residency_manager()
+            if not residency.is_loaded(ollama_client.chat_model):
+                residency.warm_in_background(ollama_client.chat_model)
+        prompt_builder = PromptBuilder()
+        conversation = None
+        if settings.CHAT_CONVERSATION_MODE:
+            conversation = session_conversations.get(session_name, ollama_client.chat_model, system_prompt)
 
-        try:
-            memories = await memory_db.query(user_message)
-        except Exception as e:
-            logger.error(f"Error querying memories: {str(e)}")
-            memories = {}
-
-        # Merge system prompt with context, memories, and user message.
-        final_prompt = ""
-        if system_prompt:
-            final_prompt += system_prompt + "\n\n"
-        # Optionally include memories or other context if needed.
-        if memories:
-            # Here you could format the memories to add extra context.
-            final_prompt += "Relevant Memories:\n"
-            for mem in memories.values():
-                final_prompt += mem.get('text', '') + "\n"
-            final_prompt += "\n"
-        final_prompt += "User: " + user_message + "\nAssistant:"
+        # Use the session-specific MemoryDB instance; it stays loaded while leased.
+        async with session_memory_dbs.lease(session_name) as memory_db:
+            try:
+                memories = await memory_db.query(user_message)
+            except Exception as e:
+                logger.error(f"Error querying memories: {str(e)}")
+                memories = []
 
-        # Use selected model if provided; defaults to Gemma for chat.
-        if selected_model:
-            ollama_client = OllamaClient(chat_model=selected_model)
+        # Pack the prompt into the context budget; only the memories that fit are returned.
+        # In conversation mode the session's earlier turns are replayed unchanged ahead of
+        # the new message, so the backend only prefills what is new.
+        if conversation is not None:
+            session_conversations.trim(conversation, prompt_builder.count_tokens)
+            try:
+                built = prompt_builder.build_messages(system_prompt, conversation.turns, memories, user_message)
+            except PromptTooLong as e:
+                raise HTTPException(status_code=400, detail=f"{str(e)}; shorten the message.")
         else:
-            ollama_client = OllamaClient()
+            built = prompt_builder.build(system_prompt, memories, user_message)
+        memories = built['memories']
+
+        # The cache is consulted only now, keyed on the built prompt's context (system prompt,
+        # replayed turns, injected memories), so a session never gets another session's answer.
+        response_cache = get_response_cache() if use_cache else None
+        query_embedding = None
+        cache_context = None
+        if response_cache is not None:
+            cache_context = prompt_context(system_prompt, conversation.turns if conversation is not None else [], memories)
+            cached, query_embedding = await lookup_cached_response(response_cache, ollama_client, cache_context, user_message)
+            if cached is not None:
+                if conversation is not None:
+                    conversation.record(built['messages'][-1]['content'], cached)
+                if stream:
+                    return StreamingResponse(
+                        cached_chat_events(cached, memories),
+                        media_type="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+                    )
+                return {"response": cached, "memories": memories, "cached": True}
+
+        def on_complete(reply: str):
+            if conversation is not None:
+                conversation.record(built['messages'][-1]['content'], reply)
+            if response_cache is not None:
+                response_cache.put(ollama_client.chat_model, cache_context, user_message, reply, query_embedding)
 
-        response = await ollama_client.chat(final_prompt)
+        # Wait for a generation slot; an overloaded model answers 429/503 with Retry-After.
+        model_scheduler = get_scheduler().get(ollama_client.chat_model)
+        if stream:
+            lease = await model_scheduler.lease(session_name, PRIORITY_INTERACTIVE)
+            if conversation is not None:
+                tokens = ollama_client.chat_messages_stream(built['messages'])
+            else:
+                tokens = ollama_client.chat_stream(built['prompt'])
+            return StreamingResponse(
+                stream_chat_events(release_after(tokens, lease), memories, on_complete),
+                media_type="text/event-stream",
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                # Backstop for a stream that never started; release() is idempotent.
+                background=BackgroundTask(lease.release)
+            )
+
+        async with model_scheduler.slot(session_name, PRIORITY_INTERACTIVE):
+            if conversation is not None:
+                response = await ollama_client.chat_messages(built['messages'])
+            else:
+                response = await ollama_client.chat(built['prompt'])
+        on_complete(response)
 
         return {"response": response, "memories": memories}
+    except (HTTPException, SchedulerRejected):
+        raise
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/memory/query")
+async def memory_query_endpoint(request: Request):
+    """Batched recall: one embedding call and one FAISS search for all queries of a session."""
+    try:
+        data = await request.json()
+        if not isinstance(data, dict):
+            raise HTTPException(status_code=400, detail="Request body must be a JSON object.")
+        session_name = data.get("session", "")
+        queries = data.get("queries", [])
+        if not isinstance(session_name, str) or not session_name.strip():
+            raise HTTPException(status_code=400, detail="Session name is required.")
+        session_name = session_name.strip()
+        if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+            raise HTTPException(status_code=400, detail="queries must be a list of strings.")
+        if len(queries) > settings.MEMORY_QUERY_MAX_QUERIES:
+            raise HTTPException(
+                status_code=400, detail=f"At most {settings.MEMORY_QUERY_MAX_QUERIES} queries per request."
+            )
+        try:
+            k = int(data.get("k", 5))
+            threshold = float(data.get("threshold", 0.3))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="k must be an integer and threshold a number.")
+        if k < 1:
+            raise HTTPException(status_code=400, detail="k must be at least 1.")
+        k = min(k, settings.MEMORY_QUERY_MAX_K)
+        async with session_memory_dbs.lease(session_name) as memory_db:
+            results = await memory_db.query_many(queries, k=k, threshold=threshold)
+        return FastJSONResponse(content={"results": [
+            {"query": query, "memories": memories} for query, memories in zip(queries, results)
+        ]})
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in memory query endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/chat/stats")
+async def chat_stats_endpoint():
+    response_cache = get_response_cache()
+    return FastJSONResponse(content={
+        "conversations": session_conversations.stats(),
+        "scheduler": get_scheduler().stats(),
+        "backends": backend_stats(),
+        "residency": get_residency_manager().stats(),
+        "memorize": memorize_queue.stats(),
+        "response_cache": response_cache.stats() if response_cache is not None else {"enabled": False}
+    })
+
+@app.post("/models/warm")
+async def warm_model_endpoint(request: Request):
+    """Start loading a model as soon as the user selects it, before the first message."""
+    data = await request.json()
+    model = (data.get("model") or "").strip()
+    if not model:
+        raise HTTPException(status_code=400, detail="Model not provided")
+    residency = get_residency_manager()
+    if not settings.MODEL_WARM_ON_SWITCH:
+        return FastJSONResponse(content={"model": model, "warming": False})
+    loaded = residency.is_loaded(model)
+    if not loaded:
+        residency.warm_in_background(model)
+    return FastJSONResponse(content={"model": model, "loaded": loaded, "warming": not loaded})
+
+@app.get("/embedding/cache/stats")
+async def embedding_cache_stats_endpoint():
+    cache = get_embedding_cache()
+    if cache is None:
+        return FastJSONResponse(content={"enabled": False})
+    return FastJSONResponse(content={"enabled": True, **cache.stats()})
+
+@app.get("/memory/index/stats")
+async def memory_index_stats_endpoint():
+    sessions = {name: memory_db.index_info() for name, memory_db in session_memory_dbs.items()}
+    return FastJSONResponse(content={
+        "tiers": stats_report(),
+        "sessions": sessions,
+        "registry": session_memory_dbs.stats(),
+        "shared_store": shared_store_stats()
+    })
+
+# Renamed /summarize to /memorize.
+@app.post("/memorize")
+async def memorize_endpoint(request: Request):
+    """
+    Memorize endpoint: queues a job that summarizes the chosen messages from the chat
+    (provided by the user) and stores the summary into the session's memory. Returns
+    the job right away; poll /memorize/{job_id} for its progress.
+    """
+    try:
+        data = await request.json()
+        messages = data.get("messages", [])
+        session_name = data.get("session", "").strip()
+        if not messages:
+            raise HTTPException(status_code=400, detail="No messages provided for memorization.")
+        if not session_name:
+            raise HTTPException(status_code=400, detail="Session name is required for memorization.")
+
+        job = memorize_queue.submit(session_name, "\n".join(messages), metadata={"memorized": True})
+        return FastJSONResponse(content={"detail": "Memorization queued.", "job_id": job['id'], "job": job}, status_code=202)
+    except (HTTPException, MemorizeQueueFull):
+        raise
+    except Exception as e:
+        logger.error(f"Error in memorize endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/memorize/{job_id}")
+async def memorize_status_endpoint(job_id: str):
+    job = memorize_queue.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired memorize job.")
+    return FastJSONResponse(content=job)
+
+# Session files are read and written on the blocking pool, off the event loop.
+@app.post("/session/save")
+async def save_session_endpoint(request: Request):
+    try:
+        data = json_loads(await request.body())
+        session_name = data.get("session_name", "").strip()
+        chat_history = data.get("chat_history", [])
+        start = int(data.get("start", 0))  # turn number of chat_history[0] when the client holds a later page
+        if not session_name:
+            raise HTTPException(status_code=400, detail="Session name must be provided.")
+        # Only turns the store does not have yet are appended.
+        result = await run_blocking(session_manager.save_session, session_name, chat_history, start)
+        return FastJSONResponse(content={**result, "detail": "Session saved."})
+    except HTTPException:
+        raise
+    except session_manager.PartialHistoryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in session saving endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/session/list")
+async def list_session_endpoint(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    sort: str = Query("updated_at", description=f"One of: {', '.join(SORT_COLUMNS)}"),
+    order: str = Query("desc", pattern="^(asc|desc)$"),
+    prefix: str = Query("", description="Only sessions whose name starts with this")
+):
+    """A page of the session catalog with turn count, memory count, size and last update per session."""
+    if sort not in SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(SORT_COLUMNS)}")
+    try:
+        page = await run_blocking(session_manager.list_sessions, offset, limit, sort, order == "desc", prefix)
+        return FastJSONResponse(content=page)
+    except Exception as e:
+        logger.error(f"Error listing sessions: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/session/catalog/rebuild")
+async def rebuild_session_catalog_endpoint():
+    """Recreate the session catalog from the files in the sessions directory."""
+    try:
+        count = await run_blocking(session_manager.rebuild_catalog)
+        return FastJSONResponse(content={"sessions": count, "detail": "Session catalog rebuilt."})
+    except Exception as e:
+        logger.error(f"Error rebuilding session catalog: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/session/load")
+async def load_session_endpoint(
+    session_name: str = Query(..., description="The session file name to load (without .json extension)"),
+    limit: int = Query(None, ge=0, description="Return only the latest `limit` turns (all turns if omitted)"),
+    before: int = Query(None, ge=0, description="Cursor: return turns before this turn number (next_cursor of the previous page)")
+):
+    try:
+        session_data = await run_blocking(session_manager.load_session, session_name, limit, before)
+        # The loaded history replaces whatever the server replayed for this session.
+        session_conversations.drop(session_name)
+        return FastJSONResponse(content=session_data)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in session loading endpoint: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
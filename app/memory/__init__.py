@@ -1,5 +1,5 @@
 from .memory_db import MemoryDB
-from .scoring import ImportanceScorer, RecencyScorer
+from .scoring import ImportanceScorer, RecencyScorer, ScoreArrays
 from .utils import chunk_text, generate_memory_key
 
-__all__ = ['MemoryDB', 'ImportanceScorer', 'RecencyScorer', 'chunk_text', 'generate_memory_key']
\ No newline at end of file
+__all__ = ['MemoryDB', 'ImportanceScorer', 'RecencyScorer', 'ScoreArrays', 'chunk_text', 'generate_memory_key']
\ No newline at end of file
@@ -1,34 +1,30 @@
 import httpx
 import numpy as np
-from typing import List
+from typing import List, Optional
 from ..config.settings import settings
+from ..chat.ollama_client import OllamaClient
 
 class OllamaEmbedder:
-    def __init__(self, model_name: str = settings.EMBED_MODEL_NAME):
-        self.base_url = settings.OLLAMA_BASE_URL
+    def __init__(self, model_name: str = settings.OLLAMA_EMBEDDING_MODEL,
+                 http_client: Optional[httpx.AsyncClient] = None):
         self.model = model_name
+        # Requests are coalesced with other callers of the same model, sent in batches
+        # and spread over the embedding backend pool.
+        self.client = OllamaClient(embedding_model=self.model, http_client=http_client)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        embedding = np.array(embedding)
+        norm = np.linalg.norm(embedding)
+        if norm > 0:
+            embedding = embedding / norm
+        return embedding
 
     async def generate_embedding(self, text: str) -> np.ndarray:
         """Generate embeddings for given text using Ollama's embedding model."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/api/embeddings",
-                json={
-                    "model": self.model,
-                    "prompt": text
-                }
-            )
-            
-            if response.status_code == 200:
-                embedding = np.array(response.json()["embedding"])
-                # Normalize the embedding
-                norm = np.linalg.norm(embedding)
-                if norm > 0:
-                    embedding = embedding / norm
-                return embedding
-            else:
-                raise Exception(f"Embedding generation failed: {response.text}")
+        return self._normalize(await self.client.get_embedding(text))
 
     async def generate_embeddings(self, texts: List[str]) -> List[np.ndarray]:
         """Generate embeddings for multiple texts."""
-        return [await self.generate_embedding(text) for text in texts]
\ No newline at end of file
+        embeddings = await self.client.get_embeddings(texts)
+        return [self._normalize(embedding) for embedding in embeddings]
@@ -0,0 +1,127 @@
+import logging
+import math
+from collections import deque
+from typing import Dict, Iterable, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+TIER_FLAT = "flat"
+TIER_HNSW = "hnsw"
+TIER_IVF = "ivf"
+TIERS = (TIER_FLAT, TIER_HNSW, TIER_IVF)
+
+def choose_tier(count: int, current: Optional[str] = None) -> str:
+    """
+    Pick the index tier for a session holding `count` vectors. With the "auto"
+    policy, sessions move to the ANN tier at MEMORY_INDEX_ANN_THRESHOLD and only
+    return to flat below half of it, so sizes near the threshold do not flap.
+    """
+    policy = settings.MEMORY_INDEX_TIER
+    if policy in TIERS:
+        return policy
+    ann_tier = settings.MEMORY_INDEX_ANN_TIER
+    threshold = settings.MEMORY_INDEX_ANN_THRESHOLD
+    if current == ann_tier:
+        return ann_tier if count >= threshold // 2 else TIER_FLAT
+    return ann_tier if count >= threshold else TIER_FLAT
+
+def ivf_nlist(count: int) -> int:
+    return settings.MEMORY_INDEX_IVF_NLIST or max(1, int(4 * math.sqrt(count)))
+
+def build_index(tier: str, dimension: int, training_vectors: Optional[np.ndarray] = None) -> faiss.Index:
+    """
+    Create an empty index that takes caller-assigned int64 ids. IVF stores ids in its
+    inverted lists natively; flat and HNSW are wrapped in an id map. IVF is trained on
+    training_vectors and falls back to flat when there are too few of them.
+    """
+    if tier == TIER_IVF:
+        count = 0 if training_vectors is None else training_vectors.shape[0]
+        nlist = ivf_nlist(count)
+        if count < nlist:
+            logger.warning(f"Not enough vectors ({count}) to train IVF with {nlist} lists; using a flat index")
+            return build_index(TIER_FLAT, dimension)
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(training_vectors)
+        apply_search_params(index)
+        return index
+    if tier == TIER_HNSW:
+        hnsw = faiss.IndexHNSWFlat(dimension, settings.MEMORY_INDEX_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = settings.MEMORY_INDEX_HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap(hnsw)
+        apply_search_params(index)
+        return index
+    return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+def _inner_index(index: faiss.Index) -> faiss.Index:
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+def index_tier(index: faiss.Index) -> str:
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return TIER_HNSW
+    if isinstance(inner, faiss.IndexIVF):
+        return TIER_IVF
+    return TIER_FLAT
+
+def apply_search_params(index: faiss.Index):
+    """Set query-time parameters, which are not all kept by write_index/read_index."""
+    inner = _inner_index(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = settings.MEMORY_INDEX_HNSW_EF_SEARCH
+    elif isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = settings.MEMORY_INDEX_IVF_NPROBE
+
+def supports_removal(index: faiss.Index) -> bool:
+    """HNSW graphs cannot drop vectors; deletions there are tombstoned until a rebuild."""
+    return index_tier(index) != TIER_HNSW
+
+def exact_search(chunks: Iterable[Tuple[np.ndarray, np.ndarray]], query: np.ndarray, k: int) -> np.ndarray:
+    """Brute-force top-k ids over (vectors, ids) chunks; the ground truth for recall sampling."""
+    best_scores = np.full(0, -np.inf, dtype='float32')
+    best_ids = np.full(0, -1, dtype='int64')
+    for vectors, ids in chunks:
+        scores = vectors @ query
+        best_scores = np.concatenate([best_scores, scores])
+        best_ids = np.concatenate([best_ids, ids])
+        if best_scores.shape[0] > k:
+            top = np.argpartition(-best_scores, k)[:k]
+            best_scores, best_ids = best_scores[top], best_ids[top]
+    return best_ids
+
+class TierStats:
+    """Rolling search latency and sampled recall@k for one index tier."""
+
+    def __init__(self, window: int = 1000):
+        self.queries = 0
+        self.latencies = deque(maxlen=window)
+        self.recalls = deque(maxlen=window)
+
+    def record_latency(self, seconds: float):
+        self.queries += 1
+        self.latencies.append(seconds)
+
+    def record_recall(self, recall: float):
+        self.recalls.append(recall)
+
+    def summary(self) -> Dict:
+        latencies = np.array(self.latencies) * 1000.0 if self.latencies else None
+        return {
+            "queries": self.queries,
+            "p50_ms": float(np.percentile(latencies, 50)) if latencies is not None else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if latencies is not None else None,
+            "recall_at_k": float(np.mean(self.recalls)) if self.recalls else None,
+            "recall_samples": len(self.recalls)
+        }
+
+tier_stats: Dict[str, TierStats] = {tier: TierStats() for tier in TIERS}
+
+def stats_report() -> Dict[str, Dict]:
+    return {tier: stats.summary() for tier, stats in tier_stats.items()}
@@ -0,0 +1,133 @@
+import heapq
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from ..serialization import json_dumps_bytes, json_loads
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_SUFFIX = ".lexical.json"
+
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+# Function words match almost every memory and would let unrelated texts through.
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+herself him himself his how i if in into is it its itself just me more most my myself no nor not now of off on
+once only or other our ours ourselves out over own same she should so some such than that the their theirs them
+themselves then there these they this those through to too under until up very was we were what when where which
+while who whom why will with would you your yours yourself yourselves
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class LexicalIndex:
+    """
+    BM25 inverted index over memory texts, keyed by the memories' stable int64 ids.
+    Maintained incrementally: add() and remove() touch only the postings of one text.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.doc_lengths)
+
+    def add(self, memory_id: int, text: str):
+        if memory_id in self.doc_lengths:
+            self.remove(memory_id)
+        term_counts = Counter(tokenize(text))
+        for term, count in term_counts.items():
+            self.postings.setdefault(term, {})[memory_id] = count
+        length = sum(term_counts.values())
+        self.doc_lengths[memory_id] = length
+        self.doc_terms[memory_id] = tuple(term_counts)
+        self.total_length += length
+
+    def add_many(self, memory_ids, texts):
+        for memory_id, text in zip(memory_ids, texts):
+            self.add(int(memory_id), text)
+
+    def remove(self, memory_id: int):
+        length = self.doc_lengths.pop(memory_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.doc_terms.pop(memory_id):
+            postings = self.postings[term]
+            del postings[memory_id]
+            if not postings:
+                del self.postings[term]
+
+    def remove_many(self, memory_ids):
+        for memory_id in memory_ids:
+            self.remove(int(memory_id))
+
+    def search(self, text: str, k: int, min_score: float = 0.0) -> List[Tuple[int, float]]:
+        """Top-k (memory id, BM25 score) for the query text, best first; scores below min_score are dropped."""
+        count = len(self.doc_lengths)
+        if not count or k <= 0:
+            return []
+        average_length = self.total_length / count or 1.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for memory_id, term_count in postings.items():
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_lengths[memory_id] / average_length)
+                scores[memory_id] += idf * term_count * (self.k1 + 1.0) / (term_count + norm)
+        return heapq.nlargest(k, ((memory_id, score) for memory_id, score in scores.items() if score >= min_score),
+                              key=lambda item: item[1])
+
+    def save(self, path: str, manifest: Dict):
+        """Write the postings atomically, tagged with the snapshot manifest they match."""
+        data = {
+            'manifest': manifest,
+            'k1': self.k1,
+            'b': self.b,
+            'doc_lengths': {str(memory_id): length for memory_id, length in self.doc_lengths.items()},
+            'postings': {term: [list(postings), list(postings.values())] for term, postings in self.postings.items()}
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json_dumps_bytes(data))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, manifest: Dict) -> Optional['LexicalIndex']:
+        """Load a saved index, or None if it is missing or was saved for another snapshot."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = json_loads(f.read())
+            if data.get('manifest') != manifest:
+                logger.info(f"Lexical index {path} does not match the snapshot; rebuilding")
+                return None
+            index = cls(data['k1'], data['b'])
+            index.doc_lengths = {int(memory_id): length for memory_id, length in data['doc_lengths'].items()}
+            index.total_length = sum(index.doc_lengths.values())
+            doc_terms: Dict[int, List[str]] = defaultdict(list)
+            for term, (memory_ids, counts) in data['postings'].items():
+                index.postings[term] = dict(zip(memory_ids, counts))
+                for memory_id in memory_ids:
+                    doc_terms[memory_id].append(term)
+            index.doc_terms = {memory_id: tuple(terms) for memory_id, terms in doc_terms.items()}
+            for memory_id in index.doc_lengths:
+                index.doc_terms.setdefault(memory_id, ())
+            return index
+        except Exception as e:
+            logger.error(f"Error loading lexical index {path}: {str(e)}")
+            return None
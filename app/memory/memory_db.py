@@ -1,24 +1,55 @@
 import os
-import json
+import asyncio
 import faiss
+import json
 import numpy as np
 import logging
+import random
+import time
 import uuid
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Set, Tuple
 
 from ..chat.ollama_client import OllamaClient
+from ..concurrency import AsyncRWLock, get_executor, run_blocking
 from ..config.settings import settings
+from .index_tiers import (
+    TIER_FLAT, apply_search_params, build_index, choose_tier, exact_search,
+    index_tier, supports_removal, tier_stats
+)
+from .lexical_index import LEXICAL_SUFFIX, LexicalIndex
+from .model_registry import get_model_registry
+from .scoring import ScoreArrays, created_timestamp
+from .shared_store import SharedStoreView, get_shared_store
+from .vector_store import VectorStore, migrate_json_memories
+from .wal import WAL_SUFFIX, WriteAheadLog, add_entry, decode_vector, delete_entry
 
 logger = logging.getLogger(__name__)
 
 class MemoryDB:
     def __init__(self, 
                  db_name: str = "chat_memory", 
-                 session_name: Optional[str] = None):
+                 session_name: Optional[str] = None,
+                 ollama_client: Optional[OllamaClient] = None):
         """
-        If session_name is provided, the memory file is stored in the sessions directory as {session_name}_memory.json.
-        The memory records will now include an embedding 'vector' along with text and metadata.
+        If session_name is provided, the memory files are stored in the sessions directory as {session_name}_memory.*.
+        Vectors live in a float32 .npy matrix and text/metadata in a records file, published together
+        as one snapshot generation ({session_name}_memory.snapshot, see VectorStore);
+        a legacy {session_name}_memory.json file is migrated on first load.
+        Inserts are appended to a write-ahead log ({session_name}_memory.wal) and folded into
+        the snapshot by background compaction. The FAISS index is saved next to the snapshot
+        ({session_name}_memory.faiss) and moves between flat and ANN tiers as the session grows.
+        With MEMORY_SHARED_STORE enabled there is no per-session index: self.index is a view on
+        the process-wide SharedVectorStore, filtered to this session.
+        A BM25 LexicalIndex over the texts is kept in sync and saved with each snapshot
+        ({session_name}_memory.lexical.json); queries fuse it with the vector ranking and
+        fall back to it alone when the query embedding misses MEMORY_EMBED_DEADLINE_MS.
+        Importance (metadata 'importance') and creation time live in ScoreArrays indexed
+        by id; vector candidates are over-fetched and reranked on similarity, recency and importance.
+        FAISS, NumPy and file work runs on the blocking thread pool. Searches share a
+        reader/writer lock and run in parallel; inserts, deletes and index swaps take it
+        exclusively. Snapshots hold it shared, so searches continue while one is written.
+        An existing OllamaClient may be passed in; either way requests go through the shared HTTP pool.
         """
         self.session_name = session_name
         if self.session_name:
@@ -29,132 +60,790 @@ class MemoryDB:
             self.db_filename = f"{db_name}.json"
         os.makedirs(self.memory_dir, exist_ok=True)        
         self.db_fullpath = os.path.join(self.memory_dir, self.db_filename)
+        self.store = VectorStore(os.path.splitext(self.db_fullpath)[0])
+        self.wal = WriteAheadLog(
+            self.store.base_path + WAL_SUFFIX,
+            fsync_batch=settings.WAL_FSYNC_BATCH,
+            fsync_interval=settings.WAL_FSYNC_INTERVAL_MS / 1000.0
+        )
+        self._last_compaction = time.monotonic()
+        self._compaction_task: Optional[asyncio.Task] = None
+        self._sync_handle: Optional[asyncio.TimerHandle] = None
         self.memories: Dict[str, Dict] = {}
+        # Stable int64 ids used as FAISS labels, and the id -> key table for lookups.
+        self._id_to_key: Dict[int, str] = {}
+        self._next_id = 0
         self.dimension: Optional[int] = None
         self.index = None  # FAISS index for similarity search
-        self.ollama_client = OllamaClient()  # Ensure your client supports get_embedding
+        self.index_path = self.store.base_path + ".faiss"
+        self.shared = settings.MEMORY_SHARED_STORE
+        # Vectors still in an HNSW graph after their record was deleted or replaced.
+        self._tombstones = 0
+        # While a tier migration builds a new index, changes to the live one are logged here.
+        self._index_changes: Optional[List[Tuple[str, np.ndarray, Optional[np.ndarray]]]] = None
+        self._index_task: Optional[asyncio.Task] = None
+        # True while the rebuild runs on a worker thread, the only phase it can be cancelled in.
+        self._index_building = False
+        self.lexical = LexicalIndex()
+        self.lexical_enabled = settings.MEMORY_LEXICAL_ENABLED
+        self.lexical_path = self.store.base_path + LEXICAL_SUFFIX
+        self.lexical_fallbacks = 0
+        self.scores = ScoreArrays(settings.MEMORY_DECAY_PERIOD_HOURS * 3600.0)
+        self._lock = AsyncRWLock()
+        # Serializes snapshot writers, which only hold the shared side of self._lock.
+        self._snapshot_lock = asyncio.Lock()
+        self.ollama_client = ollama_client or OllamaClient()  # Ensure your client supports get_embedding
         logger.info(f"Initializing MemoryDB for {self.db_fullpath}")
 
     @classmethod
     async def create(cls, 
                      db_name: str = "chat_memory", 
-                     session_name: Optional[str] = None) -> 'MemoryDB':
-        instance = cls(db_name, session_name)
+                     session_name: Optional[str] = None,
+                     ollama_client: Optional[OllamaClient] = None) -> 'MemoryDB':
+        instance = cls(db_name, session_name, ollama_client)
         await instance.initialize()
         return instance
 
     async def initialize(self):
-        self.load_memories()
-        logger.info(f"Loaded {len(self.memories)} memories from disk at {self.db_fullpath}")
-        # Determine dimension from an existing record if available, or initialize using a test message embedding.
-        if self.memories:
-            first_record = next(iter(self.memories.values()))
-            if 'vector' in first_record:
-                self.dimension = len(first_record['vector'])
-        if not self.dimension:
-            test_embedding = await self.ollama_client.get_embedding("test")
-            self.dimension = len(test_embedding)
+        snapshot, dropped_ids, journal = await run_blocking(self.load_memories)
+        logger.info(f"Loaded {len(self.memories)} memories from disk at {self.store.base_path}")
+        # The dimension comes from the stored vectors if available, or from the model registry,
+        # which only probes the embedding model the first time a model is seen.
+        model_registry = get_model_registry()
+        if self.dimension:
+            model = self.ollama_client.embedding_model
+            registered = model_registry.get_dimension(model)
+            if registered is not None and registered != self.dimension:
+                # Written with another embedding model: its vectors cannot be searched with this one.
+                error_msg = (f"Memories at {self.store.base_path} have dimension {self.dimension} but the "
+                             f"embedding model {model} produces {registered}")
+                logger.error(error_msg)
+                raise Exception(error_msg)
+        else:
+            self.dimension = await model_registry.ensure_dimension(self.ollama_client)
             logger.info(f"Initialized embedding dimension to {self.dimension}")
+        await run_blocking(self._build_initial_index, snapshot, dropped_ids, journal)
+        await self._embed_pending()
+        self._maybe_rebuild_index()
 
-        # Create FAISS index to conduct similarity searches.
-        self.index = faiss.IndexFlatIP(self.dimension)
-        # Add existing vectors to the FAISS index.
-        if self.memories:
-            vectors = []
-            for key, memory in self.memories.items():
-                if 'vector' in memory:
-                    vector = np.array(memory['vector']).astype('float32')
-                    # Normalize the vector
-                    vector = vector / np.linalg.norm(vector)
-                    vectors.append(vector)
-            if vectors:
-                vectors_np = np.array(vectors).astype('float32')
-                self.index.add(vectors_np)
-                logger.info(f"Added {len(vectors)} vectors to FAISS index")
+    def _build_initial_index(self, snapshot, dropped_ids: Set[int], journal):
+        # Index rows carry the records' stable int64 ids, so search results map straight
+        # to records. A persisted index matching the snapshot is loaded as is; otherwise
+        # a flat index is filled from the memory-mapped snapshot in one call, and
+        # _maybe_rebuild_index moves it to an ANN tier in the background if needed.
+        snapshot_count = 0 if snapshot is None else snapshot[1].shape[0]
+        self.index = None if self.shared else self._load_persisted_index(snapshot_count)
+        if self.index is not None:
+            if dropped_ids:
+                self._index_remove(np.fromiter(dropped_ids, dtype='int64'))
+        else:
+            if self.shared:
+                store_name = self.session_name or os.path.basename(self.store.base_path)
+                self.index = SharedStoreView(get_shared_store(self.dimension), store_name)
+            else:
+                self.index = build_index(TIER_FLAT, self.dimension)
+            if snapshot_count:
+                vectors, ids = snapshot
+                if dropped_ids:
+                    keep = ~np.isin(ids, np.fromiter(dropped_ids, dtype='int64'))
+                    vectors, ids = vectors[keep], ids[keep]
+                self.index.add_with_ids(vectors, ids)
+        if journal is not None:
+            self.index.add_with_ids(*journal)
+        self._tombstones = max(0, self.index.ntotal - len(self.memories))
+        if self.index.ntotal:
+            logger.info(f"FAISS {index_tier(self.index)} index holds {self.index.ntotal} vectors")
+        if self.lexical_enabled:
+            self._build_lexical_index(snapshot_count, dropped_ids, journal)
+        self._set_scores(np.fromiter(self._id_to_key, dtype='int64', count=len(self._id_to_key)),
+                         [self.memories[key] for key in self._id_to_key.values()])
+
+    def _set_scores(self, ids: np.ndarray, records: List[Dict]):
+        now = time.time()
+        default_importance = self.scores.importance_scorer.initialize()
+        importance = np.array([record.get('metadata', {}).get('importance', default_importance) for record in records], dtype='float32')
+        created = np.array([created_timestamp(record.get('created_at'), now) for record in records], dtype='float64')
+        self.scores.set(ids, importance, created)
+
+    def _build_lexical_index(self, snapshot_count: int, dropped_ids: Set[int], journal):
+        """Load the lexical index saved with the snapshot and apply the journal, or rebuild it from the texts."""
+        lexical = None
+        if settings.MEMORY_INDEX_PERSIST and snapshot_count:
+            lexical = LexicalIndex.load(self.lexical_path, self._snapshot_manifest(snapshot_count))
+        if lexical is not None:
+            lexical.remove_many(dropped_ids)
+            if journal is not None:
+                journal_ids = journal[1]
+                lexical.add_many(journal_ids, (self.memories[self._id_to_key[int(i)]]['text'] for i in journal_ids))
+        else:
+            lexical = LexicalIndex()
+            lexical.add_many(self._id_to_key, (self.memories[key]['text'] for key in self._id_to_key.values()))
+        self.lexical = lexical
 
     def load_memories(self):
+        """
+        Load the snapshot into self.memories and replay the write-ahead log on top of it.
+        Returns (snapshot, dropped_ids, journal): the snapshot's (vectors, ids), the ids of
+        snapshot rows the journal deleted or replaced, and the journal's surviving
+        (vectors, ids); snapshot and journal are None when empty.
+        """
+        self.memories = {}
+        self._id_to_key = {}
+        self._next_id = 0
+        snapshot = snapshot_ids = None
         try:
-            if os.path.exists(self.db_fullpath):
-                with open(self.db_fullpath, 'r') as f:
-                    self.memories = json.load(f)
-                logger.debug(f"Loaded {len(self.memories)} memories from {self.db_fullpath}")
+            if not self.store.exists() and os.path.exists(self.store.legacy_path):
+                migrate_json_memories(self.store)
+            if self.store.exists():
+                records, snapshot = self.store.load()
+                # Snapshots written before ids existed get ids assigned after the highest known one.
+                self._next_id = max((record['id'] + 1 for record in records if record.get('id') is not None), default=0)
+                snapshot_ids = np.empty(len(records), dtype='int64')
+                for row, record in enumerate(records):
+                    key = record.pop('key')
+                    if record.get('id') is None:
+                        record['id'] = self._next_id
+                        self._next_id += 1
+                    record['vector'] = snapshot[row]
+                    snapshot_ids[row] = record['id']
+                    self.memories[key] = record
+                    self._id_to_key[record['id']] = key
+                if snapshot.shape[1]:
+                    self.dimension = snapshot.shape[1]
+                logger.debug(f"Loaded {len(self.memories)} memories from {self.store.records_path}")
             else:
-                logger.debug(f"No existing memory file found at {self.db_fullpath}")
-                self.memories = {}
+                logger.debug(f"No existing memory snapshot found at {self.store.base_path}")
         except Exception as e:
-            logger.error(f"Error loading memories: {str(e)}")
-            self.memories = {}
+            # Starting empty would let the next save replace the snapshot that failed to load.
+            logger.error(f"Error loading memories from {self.store.base_path}: {str(e)}")
+            raise Exception(f"Could not load memories from {self.store.base_path}: {str(e)}") from e
+
+        dropped_ids, journal_vectors = self._replay_journal()
+        if self.memories and not self.dimension:
+            self.dimension = len(next(iter(self.memories.values()))['vector'])
+        journal = None
+        if journal_vectors:
+            journal = (np.vstack(list(journal_vectors.values())), np.fromiter(journal_vectors, dtype='int64'))
+        if snapshot is None or not snapshot.shape[0]:
+            return None, dropped_ids, journal
+        return (snapshot, snapshot_ids), dropped_ids, journal
+
+    def _replay_journal(self) -> Tuple[Set[int], Dict[int, np.ndarray]]:
+        """
+        Apply write-ahead log entries to self.memories. Returns the ids of snapshot rows
+        that were deleted or replaced, and the surviving vectors added by the journal.
+        """
+        dropped_ids: Set[int] = set()
+        journal_vectors: Dict[int, np.ndarray] = {}
+
+        def forget(memory_id: int):
+            if journal_vectors.pop(memory_id, None) is None:
+                dropped_ids.add(memory_id)
+
+        try:
+            entries = self.wal.replay()
+        except Exception as e:
+            logger.error(f"Error replaying write-ahead log {self.wal.path}: {str(e)}")
+            return dropped_ids, journal_vectors
+        for entry in entries:
+            key = entry.get('key')
+            if entry.get('op') == 'add':
+                existing = self.memories.get(key)
+                memory_id = entry.get('id')
+                if memory_id is None:
+                    memory_id = existing['id'] if existing else self._next_id
+                if existing:
+                    forget(existing['id'])
+                    del self._id_to_key[existing['id']]
+                self._next_id = max(self._next_id, memory_id + 1)
+                vector = decode_vector(entry['vector'])
+                self.memories[key] = {
+                    'id': memory_id,
+                    'text': entry['text'],
+                    'vector': vector,
+                    'metadata': entry.get('metadata', {}),
+                    'created_at': entry.get('created_at')
+                }
+                self._id_to_key[memory_id] = key
+                journal_vectors[memory_id] = vector
+            elif entry.get('op') == 'delete' and key in self.memories:
+                memory = self.memories.pop(key)
+                del self._id_to_key[memory['id']]
+                forget(memory['id'])
+        if entries:
+            logger.info(f"Replayed {len(entries)} write-ahead log entries from {self.wal.path}")
+        return dropped_ids, journal_vectors
+
+    async def save(self):
+        """Write a snapshot on the blocking pool. Searches continue meanwhile; writers wait."""
+        async with self._snapshot_lock, self._lock.read():
+            await run_blocking(self.save_memories)
 
     def save_memories(self):
+        """
+        Write a full snapshot; the write-ahead log is then redundant and truncated.
+        Blocking: call save() from async code.
+        """
         try:
-            logger.info(f"Saving memories to: {self.db_fullpath}")
-            with open(self.db_fullpath, 'w') as f:
-                json.dump(self.memories, f)
+            logger.info(f"Saving memories to: {self.store.base_path}")
+            records = []
+            for key, memory in self.memories.items():
+                records.append({
+                    'key': key,
+                    'id': memory['id'],
+                    'text': memory['text'],
+                    'metadata': memory.get('metadata', {}),
+                    'created_at': memory.get('created_at')
+                })
+            if self.memories:
+                vectors = np.vstack([memory['vector'] for memory in self.memories.values()]).astype('float32')
+            else:
+                vectors = np.zeros((0, self.dimension or 0), dtype='float32')
+            # Point records at the new matrix so the previous memory map can be released.
+            for row, memory in enumerate(self.memories.values()):
+                memory['vector'] = vectors[row]
+            self.store.save(records, vectors)
+            self._persist_index()
+            self._persist_lexical_index()
+            # store.save fsync'd the snapshot, so the journal entries it contains can go.
+            self.wal.reset()
+            self._last_compaction = time.monotonic()
             logger.info(f"Successfully saved {len(self.memories)} memories")
         except Exception as e:
             logger.error(f"Error saving memories: {str(e)}")
             raise
 
+    def _persist_index(self):
+        """
+        Save the FAISS index next to the snapshot it matches. The manifest pins the
+        snapshot's record count and modification time so a stale index is never loaded.
+        """
+        if not settings.MEMORY_INDEX_PERSIST or self.index is None or self.shared:
+            return
+        try:
+            index_tmp = self.index_path + ".tmp"
+            faiss.write_index(self.index, index_tmp)
+            os.replace(index_tmp, self.index_path)
+            manifest = {**self._snapshot_manifest(len(self.memories)), 'tier': index_tier(self.index)}
+            with open(self.index_path + ".json", 'w') as f:
+                json.dump(manifest, f)
+        except Exception as e:
+            logger.error(f"Error persisting FAISS index {self.index_path}: {str(e)}")
+
+    def _snapshot_manifest(self, records: int) -> Dict[str, int]:
+        return {'records': records, 'vectors_mtime_ns': os.stat(self.store.vectors_path).st_mtime_ns}
+
+    def _persist_lexical_index(self):
+        if not settings.MEMORY_INDEX_PERSIST or not self.lexical_enabled:
+            return
+        try:
+            self.lexical.save(self.lexical_path, self._snapshot_manifest(len(self.memories)))
+        except Exception as e:
+            logger.error(f"Error persisting lexical index {self.lexical_path}: {str(e)}")
+
+    def _load_persisted_index(self, snapshot_count: int) -> Optional[faiss.Index]:
+        if not settings.MEMORY_INDEX_PERSIST or not os.path.exists(self.index_path):
+            return None
+        try:
+            with open(self.index_path + ".json", 'r') as f:
+                manifest = json.load(f)
+            if (manifest.get('records') != snapshot_count
+                    or manifest.get('vectors_mtime_ns') != os.stat(self.store.vectors_path).st_mtime_ns):
+                logger.info(f"Persisted index {self.index_path} does not match the snapshot; rebuilding")
+                return None
+            index = faiss.read_index(self.index_path)
+            if index.d != self.dimension:
+                return None
+            apply_search_params(index)
+            logger.info(f"Loaded persisted {manifest.get('tier')} index from {self.index_path}")
+            return index
+        except Exception as e:
+            logger.error(f"Error loading persisted index {self.index_path}: {str(e)}")
+            return None
+
+    def _index_add(self, vectors: np.ndarray, ids: np.ndarray):
+        self.index.add_with_ids(vectors, ids)
+        if self._index_changes is not None:
+            self._index_changes.append(('add', ids, vectors))
+
+    def _index_remove(self, ids: np.ndarray):
+        if supports_removal(self.index):
+            self.index.remove_ids(ids)
+        else:
+            self._tombstones += len(ids)
+        if self._index_changes is not None:
+            self._index_changes.append(('remove', ids, None))
+
+    def _maybe_rebuild_index(self):
+        """Start a background rebuild when the session outgrew its tier or HNSW tombstones piled up."""
+        if self._index_task is not None or self.index is None or self.shared:
+            return
+        current = index_tier(self.index)
+        target = choose_tier(len(self.memories), current)
+        too_many_tombstones = self._tombstones > settings.MEMORY_INDEX_TOMBSTONE_RATIO * max(1, self.index.ntotal)
+        if target == current and not too_many_tombstones:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._index_task = loop.create_task(self._rebuild_index(target))
+
+    async def _rebuild_index(self, tier: str):
+        """
+        Build a `tier` index from the current vectors on a worker thread, replay the
+        changes made to the live index meanwhile, then swap it in and persist it.
+        """
+        try:
+            previous = index_tier(self.index)
+            logger.info(f"Building {tier} index for {self.store.base_path} ({len(self.memories)} memories, was {previous})")
+            async with self._lock.read():
+                memories = list(self.memories.values())
+                self._index_changes = []
+            self._index_building = True
+            try:
+                new_index = await run_blocking(self._build_populated_index, tier, memories)
+            finally:
+                self._index_building = False
+            async with self._lock.write():
+                await run_blocking(self._replay_index_changes, new_index)
+                self.index = new_index
+                self._tombstones = max(0, self.index.ntotal - len(self.memories))
+                self._index_changes = None
+            logger.info(f"Switched {self.store.base_path} to a {index_tier(self.index)} index")
+            if self.wal.entries:
+                await self.compact()
+            elif self.store.exists():
+                async with self._snapshot_lock, self._lock.read():
+                    await run_blocking(self._persist_index)
+        except Exception as e:
+            logger.error(f"Error rebuilding index for {self.store.base_path}: {str(e)}")
+        finally:
+            self._index_changes = None
+            self._index_task = None
+
+    def _replay_index_changes(self, index: faiss.Index):
+        for op, change_ids, change_vectors in self._index_changes:
+            if op == 'add':
+                index.add_with_ids(change_vectors, change_ids)
+            elif supports_removal(index):
+                index.remove_ids(change_ids)
+
+    def _build_populated_index(self, tier: str, memories: List[Dict]) -> faiss.Index:
+        ids = np.fromiter((memory['id'] for memory in memories), dtype='int64', count=len(memories))
+        vectors = (np.vstack([memory['vector'] for memory in memories]).astype('float32')
+                   if memories else np.zeros((0, self.dimension), dtype='float32'))
+        training = vectors
+        if vectors.shape[0] > 100000:
+            training = vectors[np.random.choice(vectors.shape[0], 100000, replace=False)]
+        index = build_index(tier, self.dimension, training)
+        if vectors.shape[0]:
+            index.add_with_ids(vectors, ids)
+        return index
+
+    def _search(self, query_vectors: np.ndarray, k: int):
+        """
+        Search the index for the top-k ids, over-fetching past HNSW tombstones, and
+        record per-tier latency. A sample of ANN queries is checked against exact search.
+        Blocking: runs on the thread pool under the shared lock.
+        """
+        tier = index_tier(self.index)
+        fetch = min(self.index.ntotal, k + min(self._tombstones, k))
+        start = time.perf_counter()
+        scores, ids = self.index.search(query_vectors, fetch)
+        tier_stats[tier].record_latency(time.perf_counter() - start)
+        if tier != TIER_FLAT and random.random() < settings.MEMORY_INDEX_RECALL_SAMPLE_RATE:
+            self._sample_recall(tier, query_vectors[0], ids[0], k)
+        return scores, ids
+
+    def _sample_recall(self, tier: str, query_vector: np.ndarray, ann_ids: np.ndarray, k: int):
+        memories = list(self.memories.values())
+        live_ann_ids = [int(i) for i in ann_ids if int(i) in self._id_to_key][:k]
+
+        def measure():
+            chunk_size = 10000
+            chunks = (
+                (np.vstack([m['vector'] for m in memories[i:i + chunk_size]]),
+                 np.array([m['id'] for m in memories[i:i + chunk_size]], dtype='int64'))
+                for i in range(0, len(memories), chunk_size)
+            )
+            exact_ids = set(int(i) for i in exact_search(chunks, query_vector, k))
+            if exact_ids:
+                tier_stats[tier].record_recall(len(exact_ids.intersection(live_ann_ids)) / len(exact_ids))
+
+        get_executor().submit(measure)
+
+    def estimated_bytes(self) -> int:
+        """Rough resident size: each vector is held by the index and by its record, plus record overhead."""
+        dimension = self.dimension or 0
+        return len(self.memories) * (2 * 4 * dimension + 512)
+
+    def index_info(self) -> Dict[str, Any]:
+        return {
+            'tier': 'shared' if self.shared else (index_tier(self.index) if self.index is not None else None),
+            'vectors': self.index.ntotal if self.index is not None else 0,
+            'memories': len(self.memories),
+            'tombstones': self._tombstones,
+            'lexical_terms': len(self.lexical.postings),
+            'lexical_fallbacks': self.lexical_fallbacks,
+            'rebuilding': self._index_task is not None
+        }
+
+    async def compact(self):
+        """Fold the write-ahead log into the snapshot if it has any entries."""
+        if self.wal.entries:
+            await self.save()
+
+    async def close(self):
+        """
+        Stop background work, compact and release the journal; called before the instance
+        is dropped. An index rebuild still building is cancelled, one that is swapping its
+        index in and a running compaction are awaited, so none of them races the final compact.
+        """
+        if self._sync_handle is not None:
+            self._sync_handle.cancel()
+            self._sync_handle = None
+        if self._index_task is not None and self._index_building:
+            self._index_task.cancel()
+        tasks = [task for task in (self._index_task, self._compaction_task) if task is not None]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await self.compact()
+        await run_blocking(self.wal.close)
+        if isinstance(self.index, SharedStoreView):
+            await run_blocking(self.index.release)
+
+    async def _journal(self, entries: List[Dict]):
+        """
+        Append entries to the write-ahead log on the thread pool and schedule its fsync
+        and compaction. Called with the write lock held.
+        """
+        await run_blocking(self.wal.append, entries)
+        loop = asyncio.get_running_loop()
+        if self.wal.unsynced and self._sync_handle is None:
+            self._sync_handle = loop.call_later(self.wal.fsync_interval, self._sync_journal)
+        compaction_due = (
+            self.wal.entries >= settings.WAL_COMPACT_THRESHOLD
+            or time.monotonic() - self._last_compaction >= settings.WAL_COMPACT_INTERVAL
+        )
+        if compaction_due and self._compaction_task is None:
+            self._compaction_task = loop.create_task(self._compact_in_background())
+
+    def _sync_journal(self):
+        self._sync_handle = None
+        get_executor().submit(self.wal.sync)
+
+    async def _compact_in_background(self):
+        try:
+            # Let the insert that triggered compaction return first.
+            await asyncio.sleep(0)
+            await self.compact()
+        except Exception as e:
+            logger.error(f"Error compacting memories for {self.store.base_path}: {str(e)}")
+        finally:
+            self._compaction_task = None
+
+    @staticmethod
+    def _normalize(embeddings: List[List[float]]) -> np.ndarray:
+        """Stack embeddings into a float32 matrix of unit-length rows."""
+        vectors = np.array(embeddings).astype('float32')
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        if not np.all(norms):
+            logger.warning("Received zero vector for embedding.")
+            norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def _allocate_ids(self, count: int) -> np.ndarray:
+        ids = np.arange(self._next_id, self._next_id + count, dtype='int64')
+        self._next_id += count
+        return ids
+
+    async def _embed_pending(self):
+        """Embed records that were migrated without a vector and add them to the store."""
+        pending = self.store.load_pending()
+        if not pending:
+            return
+        try:
+            embeddings = await self.ollama_client.get_embeddings([record['text'] for record in pending])
+        except Exception as e:
+            logger.error(f"Error embedding {len(pending)} pending memories: {str(e)}")
+            return
+        vectors = self._normalize(embeddings)
+        async with self._lock.write():
+            ids = self._allocate_ids(len(pending))
+            for record, vector, memory_id in zip(pending, vectors, ids):
+                key = record.pop('key')
+                record['id'] = int(memory_id)
+                record['vector'] = vector
+                self.memories[key] = record
+                self._id_to_key[record['id']] = key
+            await run_blocking(self._add_to_indexes, vectors, ids, pending)
+        await self.save()
+        await run_blocking(self.store.clear_pending)
+        logger.info(f"Embedded {len(pending)} pending memories")
+
     async def add_memory(self, text: str, metadata: Optional[Dict] = None) -> str:
         """
         Compute an embedding for the text, store the vector with the memory record,
-        update the FAISS index, and save the record to disk.
+        update the FAISS index, and append the record to the write-ahead log.
+        """
+        keys = await self.add_memories([text], [metadata])
+        return keys[0]
+
+    async def add_memories(self, texts: List[str], metadatas: Optional[List[Optional[Dict]]] = None) -> List[str]:
+        """
+        Bulk variant of add_memory: embeds all texts in one batched call, adds the
+        vectors to the FAISS index at once and journals them in one append.
         """
+        if not texts:
+            return []
+        metadatas = metadatas or [None] * len(texts)
         try:
-            # Get the embedding for the text.
-            vector = await self.ollama_client.get_embedding(text)
-            vector = np.array(vector).astype('float32')
-            # Normalize the vector.
-            norm = np.linalg.norm(vector)
-            if norm:
-                vector = vector / norm
-            else:
-                logger.warning("Received zero vector for embedding.")
-            key = str(uuid.uuid4())
-            memory_entry = {
-                'text': text,
-                'vector': vector.tolist(),
-                'metadata': metadata or {},
-                'created_at': datetime.utcnow().isoformat()
-            }
-            # Add to FAISS index.
-            self.index.add(np.array([vector]).astype('float32'))
-            self.memories[key] = memory_entry
-            self.save_memories()
-            return key
+            embeddings = await self.ollama_client.get_embeddings(texts)
+            vectors = self._normalize(embeddings)
+            created_at = datetime.utcnow().isoformat()
+            async with self._lock.write():
+                ids = self._allocate_ids(len(texts))
+                new_memories = {}
+                for text, metadata, vector, memory_id in zip(texts, metadatas, vectors, ids):
+                    new_memories[str(uuid.uuid4())] = {
+                        'id': int(memory_id),
+                        'text': text,
+                        'vector': vector,
+                        'metadata': metadata or {},
+                        'created_at': created_at
+                    }
+                # Journal first, so nothing reaches the index that is not durable.
+                await self._journal([add_entry(key, memory, memory['vector']) for key, memory in new_memories.items()])
+                self.memories.update(new_memories)
+                for key, memory in new_memories.items():
+                    self._id_to_key[memory['id']] = key
+                # Add to FAISS index.
+                await run_blocking(self._add_to_indexes, vectors, ids, list(new_memories.values()))
+            self._maybe_rebuild_index()
+            return list(new_memories)
         except Exception as e:
             logger.error(f"Error adding memory: {str(e)}")
             raise
 
+    async def delete_memory(self, key: str) -> bool:
+        """Remove a memory and its vector; returns False if the key is unknown."""
+        try:
+            async with self._lock.write():
+                memory = self.memories.get(key)
+                if memory is None:
+                    return False
+                await self._journal([delete_entry(key)])
+                del self.memories[key]
+                del self._id_to_key[memory['id']]
+                await run_blocking(self._remove_from_indexes, np.array([memory['id']], dtype='int64'))
+            self._maybe_rebuild_index()
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting memory {key}: {str(e)}")
+            raise
+
+    async def update_memory(self, key: str, text: Optional[str] = None, metadata: Optional[Dict] = None) -> bool:
+        """
+        Replace a memory's text and/or metadata, keeping its key. A new text is re-embedded
+        and indexed under a fresh id, since HNSW cannot drop the old vector and would keep
+        returning it under the same id. Returns False if the key is unknown.
+        """
+        memory = self.memories.get(key)
+        if memory is None:
+            return False
+        try:
+            new_vector = None
+            if text is not None and text != memory['text']:
+                new_vector = self._normalize(await self.ollama_client.get_embeddings([text]))[0]
+            async with self._lock.write():
+                # Re-read: the memory may have changed or gone while the text was embedded.
+                memory = self.memories.get(key)
+                if memory is None:
+                    return False
+                updated = dict(memory)
+                if new_vector is not None:
+                    updated['id'] = int(self._allocate_ids(1)[0])
+                    updated['text'] = text
+                    updated['vector'] = new_vector
+                if metadata is not None:
+                    updated['metadata'] = metadata
+                await self._journal([add_entry(key, updated, updated['vector'])])
+                self.memories[key] = updated
+                if new_vector is not None:
+                    del self._id_to_key[memory['id']]
+                    self._id_to_key[updated['id']] = key
+                    await run_blocking(self._replace_in_indexes, memory['id'], updated)
+                elif metadata is not None:
+                    self._set_scores(np.array([memory['id']], dtype='int64'), [updated])
+            if new_vector is not None:
+                self._maybe_rebuild_index()
+            return True
+        except Exception as e:
+            logger.error(f"Error updating memory {key}: {str(e)}")
+            raise
+
+    def _add_to_indexes(self, vectors: np.ndarray, ids: np.ndarray, records: List[Dict]):
+        self._index_add(vectors, ids)
+        if self.lexical_enabled:
+            self.lexical.add_many(ids, (record['text'] for record in records))
+        self._set_scores(ids, records)
+
+    def _remove_from_indexes(self, ids: np.ndarray):
+        self._index_remove(ids)
+        if self.lexical_enabled:
+            self.lexical.remove_many(ids)
+
+    def _replace_in_indexes(self, old_id: int, record: Dict):
+        self._remove_from_indexes(np.array([old_id], dtype='int64'))
+        self._add_to_indexes(record['vector'].reshape(1, -1), np.array([record['id']], dtype='int64'), [record])
+
     async def query(self, query_text: str, k: int = 5, threshold: float = 0.3) -> List[Dict[str, Any]]:
         """
         Generate an embedding for the query, perform a similarity search using FAISS,
         and return only those memories that meet the specified similarity threshold.
         """
+        results = await self.query_many([query_text], k, threshold)
+        return results[0]
+
+    async def query_many(self, query_texts: List[str], k: int = 5, threshold: float = 0.3) -> List[List[Dict[str, Any]]]:
+        """
+        Batch variant of query: embeds all texts in one batched call and runs a single
+        FAISS search over the n x d query matrix. Vector hits above the threshold are
+        fused with BM25 hits by reciprocal rank fusion. Returns one result list per text.
+        """
+        if not query_texts:
+            return []
         try:
-            query_vector = await self.ollama_client.get_embedding(query_text)
-            query_vector = np.array(query_vector).astype('float32')
-            query_vector = query_vector / np.linalg.norm(query_vector)
-            query_vector_np = np.array([query_vector]).astype('float32')
-            if self.index.ntotal == 0:
-                logger.warning("No vectors in FAISS index!")
-                return []
-            scores, indices = self.index.search(query_vector_np, min(k, self.index.ntotal))
-            results = []
-            all_keys = list(self.memories.keys())
-            for similarity, idx in zip(scores[0], indices[0]):
-                if similarity >= threshold and idx < len(all_keys):
-                    memory_key = all_keys[idx]
-                    memory = self.memories[memory_key]
-                    results.append({
-                        'key': memory_key,
-                        'text': memory['text'],
-                        'similarity': float(similarity),
-                        'metadata': memory.get('metadata', {}),
-                        'created_at': memory.get('created_at')
-                    })
-            results = sorted(results, key=lambda x: x['similarity'], reverse=True)
-            return results
+            query_vectors = await self._embed_queries(query_texts)
+            async with self._lock.read():
+                if self.index.ntotal == 0 and not len(self.lexical):
+                    logger.warning("No vectors in FAISS index!")
+                    return [[] for _ in query_texts]
+                return await run_blocking(self._retrieve, query_texts, query_vectors, k, threshold)
         except Exception as e:
             logger.error(f"Error querying memories: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    async def _embed_queries(self, query_texts: List[str]) -> Optional[np.ndarray]:
+        """
+        Embed the query texts. With the lexical index enabled, returns None instead when
+        the embedding fails or misses MEMORY_EMBED_DEADLINE_MS, so lexical hits stand in.
+        """
+        deadline = settings.MEMORY_EMBED_DEADLINE_MS
+        if not self.lexical_enabled:
+            return self._normalize(await self.ollama_client.get_embeddings(query_texts))
+        task = asyncio.ensure_future(self.ollama_client.get_embeddings(query_texts))
+        try:
+            if deadline:
+                embeddings = await asyncio.wait_for(asyncio.shield(task), deadline / 1000.0)
+            else:
+                embeddings = await task
+            return self._normalize(embeddings)
+        except asyncio.TimeoutError:
+            # The call keeps running, so its result still lands in the embedding cache.
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            logger.warning(f"Query embedding missed the {deadline:.0f} ms deadline; using lexical results only")
+        except Exception as e:
+            logger.error(f"Error embedding queries; using lexical results only: {str(e)}")
+        self.lexical_fallbacks += 1
+        return None
+
+    def _retrieve(self, query_texts: List[str], query_vectors: Optional[np.ndarray],
+                  k: int, threshold: float) -> List[List[Dict[str, Any]]]:
+        """Blocking: gather vector and lexical candidates for each query and fuse them."""
+        candidates = 2 * k
+        vector_hits: List[List[Tuple[int, float]]] = [[] for _ in query_texts]
+        if query_vectors is not None and self.index.ntotal:
+            rerank = settings.MEMORY_RERANK_ENABLED
+            fetch = max(candidates, k * settings.MEMORY_RERANK_OVERFETCH) if rerank else candidates
+            scores, ids = self._search(query_vectors, fetch)
+            vector_hits = [self._live_hits(row_scores, row_ids, threshold) for row_scores, row_ids in zip(scores, ids)]
+            if rerank:
+                now = time.time()
+                vector_hits = [self._rerank(hits, now)[:candidates] for hits in vector_hits]
+        results = []
+        for i, (query_text, hits) in enumerate(zip(query_texts, vector_hits)):
+            similarities = dict(hits)
+            lexical_hits = []
+            if self.lexical_enabled:
+                lexical_hits = self.lexical.search(query_text, candidates, settings.MEMORY_LEXICAL_MIN_SCORE)
+                if query_vectors is not None:
+                    # With an embedding, lexical hits only boost memories that pass the threshold.
+                    lexical_hits = self._above_threshold(lexical_hits, similarities, query_vectors[i], threshold)
+            results.append(self._collect_results(hits, lexical_hits, similarities, k))
+        return results
+
+    def _above_threshold(self, lexical_hits: List[Tuple[int, float]], similarities: Dict[int, float],
+                         query_vector: np.ndarray, threshold: float) -> List[Tuple[int, float]]:
+        """
+        Keep the lexical hits whose similarity to the query reaches threshold. Hits the
+        vector search did not return are scored against their stored vector and their
+        similarity is added to similarities.
+        """
+        kept = []
+        for memory_id, lexical_score in lexical_hits:
+            similarity = similarities.get(memory_id)
+            if similarity is None:
+                memory_key = self._id_to_key.get(memory_id)
+                if memory_key is None:
+                    continue
+                similarity = float(np.dot(self.memories[memory_key]['vector'], query_vector))
+                if similarity < threshold:
+                    continue
+                similarities[memory_id] = similarity
+            kept.append((memory_id, lexical_score))
+        return kept
+
+    def _live_hits(self, scores: np.ndarray, ids: np.ndarray, threshold: float) -> List[Tuple[int, float]]:
+        """One row of FAISS results as (id, similarity), dropping misses, tombstones and duplicates."""
+        hits = []
+        seen = set()
+        for similarity, memory_id in zip(scores, ids):
+            memory_id = int(memory_id)
+            if similarity < threshold or memory_id < 0 or memory_id in seen or memory_id not in self._id_to_key:
+                continue
+            seen.add(memory_id)
+            hits.append((memory_id, float(similarity)))
+        return hits
+
+    def _rerank(self, hits: List[Tuple[int, float]], now: float) -> List[Tuple[int, float]]:
+        """Reorder vector hits by the weighted similarity, recency and importance score."""
+        if len(hits) < 2:
+            return hits
+        ids = np.fromiter((memory_id for memory_id, _ in hits), dtype='int64', count=len(hits))
+        similarities = np.fromiter((similarity for _, similarity in hits), dtype='float32', count=len(hits))
+        combined = self.scores.rescore(
+            ids, similarities, now,
+            settings.MEMORY_RERANK_SIMILARITY_WEIGHT,
+            settings.MEMORY_RERANK_RECENCY_WEIGHT,
+            settings.MEMORY_RERANK_IMPORTANCE_WEIGHT
+        )
+        return [hits[i] for i in np.argsort(-combined, kind='stable')]
+
+    def _collect_results(self, vector_hits: List[Tuple[int, float]], lexical_hits: List[Tuple[int, float]],
+                         similarities: Dict[int, float], k: int) -> List[Dict[str, Any]]:
+        """
+        Fuse the two rankings with reciprocal rank fusion and map the top k to memory
+        records. 'similarity' is None only for lexical-only results, when the query
+        embedding missed its deadline.
+        """
+        fused: Dict[int, float] = {}
+        for hits in (vector_hits, lexical_hits):
+            for rank, (memory_id, _) in enumerate(hits):
+                fused[memory_id] = fused.get(memory_id, 0.0) + 1.0 / (settings.MEMORY_RRF_K + rank + 1)
+        lexical_scores = dict(lexical_hits)
+        results = []
+        for memory_id in sorted(fused, key=fused.get, reverse=True)[:k]:
+            memory_key = self._id_to_key[memory_id]
+            memory = self.memories[memory_key]
+            results.append({
+                'key': memory_key,
+                'text': memory['text'],
+                'similarity': similarities.get(memory_id),
+                'lexical_score': lexical_scores.get(memory_id),
+                'score': fused[memory_id],
+                'metadata': memory.get('metadata', {}),
+                'created_at': memory.get('created_at')
+            })
+        return results
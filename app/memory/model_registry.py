@@ -0,0 +1,83 @@
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+from ..chat.ollama_client import OllamaClient
+from ..concurrency import run_blocking
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingModelRegistry:
+    """
+    Embedding model metadata (currently the vector dimension), discovered once per
+    model and persisted next to the memory data, so that new sessions can size their
+    index without an embedding round trip. Only dimensions measured on an embedding
+    from the model are recorded, never ones read from stored vectors, which may come
+    from a model that was configured earlier.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.models: Dict[str, Dict] = {}
+        self._probes: Dict[str, asyncio.Task] = {}
+        self._load()
+
+    def _load(self):
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    self.models = json.load(f)
+        except Exception as e:
+            logger.error(f"Error loading embedding model registry {self.path}: {str(e)}")
+            self.models = {}
+
+    def _save(self):
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.models, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.error(f"Error saving embedding model registry {self.path}: {str(e)}")
+
+    def get_dimension(self, model: str) -> Optional[int]:
+        return self.models.get(model, {}).get('dimension')
+
+    async def record(self, model: str, dimension: int):
+        if self.get_dimension(model) == dimension:
+            return
+        self.models[model] = {'dimension': dimension, 'detected_at': datetime.utcnow().isoformat()}
+        await run_blocking(self._save)
+        logger.info(f"Recorded embedding dimension {dimension} for model {model}")
+
+    async def ensure_dimension(self, client: OllamaClient) -> int:
+        """Return the client's embedding dimension, probing the model only if it is unknown."""
+        model = client.embedding_model
+        dimension = self.get_dimension(model)
+        if dimension:
+            return dimension
+        task = self._probes.get(model)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._probe(client))
+            self._probes[model] = task
+        return await asyncio.shield(task)
+
+    async def _probe(self, client: OllamaClient) -> int:
+        try:
+            embedding = await client.get_embedding("test")
+            await self.record(client.embedding_model, len(embedding))
+            return len(embedding)
+        finally:
+            self._probes.pop(client.embedding_model, None)
+
+_model_registry: Optional[EmbeddingModelRegistry] = None
+
+def get_model_registry() -> EmbeddingModelRegistry:
+    global _model_registry
+    if _model_registry is None:
+        _model_registry = EmbeddingModelRegistry(os.path.join(settings.MEMORY_PATH, "embedding_models.json"))
+    return _model_registry
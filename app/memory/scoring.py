@@ -1,21 +1,85 @@
 from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
 
 class ImportanceScorer:
+    decay_rate = 0.1
+
     def initialize(self) -> float:
         """Initialize importance score for a new memory."""
         return 1.0
     
     def decay(self, current_score: float) -> float:
         """Apply decay to importance score."""
-        decay_rate = 0.1
-        return max(0.0, current_score * (1 - decay_rate))
+        return max(0.0, current_score * (1 - self.decay_rate))
+
+    def decay_many(self, scores: np.ndarray, steps: np.ndarray) -> np.ndarray:
+        """Closed form of applying decay() `steps` times, for many scores at once."""
+        return np.maximum(0.0, scores * np.power(1 - self.decay_rate, np.maximum(steps, 0.0)))
 
 class RecencyScorer:
+    decay_rate = 0.05
+
     def initialize(self) -> float:
         """Initialize recency score for a new memory."""
         return 1.0
     
     def decay(self, current_score: float) -> float:
         """Apply decay to recency score."""
-        decay_rate = 0.05
-        return max(0.0, current_score * (1 - decay_rate))
\ No newline at end of file
+        return max(0.0, current_score * (1 - self.decay_rate))
+
+    def decay_many(self, scores: np.ndarray, steps: np.ndarray) -> np.ndarray:
+        """Closed form of applying decay() `steps` times, for many scores at once."""
+        return np.maximum(0.0, scores * np.power(1 - self.decay_rate, np.maximum(steps, 0.0)))
+
+def created_timestamp(created_at: Optional[str], default: float) -> float:
+    """POSIX time of an ISO created_at value; naive values are UTC, as written by MemoryDB."""
+    if not created_at:
+        return default
+    try:
+        created = datetime.fromisoformat(created_at)
+    except ValueError:
+        return default
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return created.timestamp()
+
+class ScoreArrays:
+    """
+    Importance and creation time of each memory in NumPy arrays indexed by its stable
+    id, parallel to the FAISS index, so candidates are rescored in one vectorized pass.
+    One decay step of either scorer is applied per decay_period seconds of age.
+    """
+
+    def __init__(self, decay_period: float = 86400.0):
+        self.decay_period = decay_period
+        self.importance_scorer = ImportanceScorer()
+        self.recency_scorer = RecencyScorer()
+        self.importance = np.zeros(0, dtype='float32')
+        self.created = np.zeros(0, dtype='float64')
+
+    def _reserve(self, size: int):
+        if size <= self.importance.shape[0]:
+            return
+        capacity = max(size, 2 * self.importance.shape[0], 1024)
+        importance = np.full(capacity, self.importance_scorer.initialize(), dtype='float32')
+        created = np.zeros(capacity, dtype='float64')
+        importance[:self.importance.shape[0]] = self.importance
+        created[:self.created.shape[0]] = self.created
+        self.importance, self.created = importance, created
+
+    def set(self, ids: np.ndarray, importance: np.ndarray, created: np.ndarray):
+        if not len(ids):
+            return
+        self._reserve(int(np.max(ids)) + 1)
+        self.importance[ids] = importance
+        self.created[ids] = created
+
+    def rescore(self, ids: np.ndarray, similarities: np.ndarray, now: float,
+                similarity_weight: float, recency_weight: float, importance_weight: float) -> np.ndarray:
+        """Weighted sum of similarity, decayed recency and decayed importance for the candidate ids."""
+        steps = (now - self.created[ids]) / self.decay_period
+        recency = self.recency_scorer.decay_many(np.full(len(ids), self.recency_scorer.initialize()), steps)
+        importance = self.importance_scorer.decay_many(self.importance[ids], steps)
+        return similarity_weight * similarities + recency_weight * recency + importance_weight * importance
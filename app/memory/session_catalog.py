@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..config.settings import settings
+from .lexical_index import LEXICAL_SUFFIX
+from .vector_store import (
+    LEGACY_SUFFIX, MIGRATED_SUFFIX, PENDING_SUFFIX, RECORDS_SUFFIX, SNAPSHOT_SUFFIX, VECTORS_SUFFIX, VectorStore
+)
+from .wal import WAL_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+# Files MemoryDB keeps next to the session history as {session}_memory<suffix>.
+MEMORY_BASENAME_SUFFIX = "_memory"
+MEMORY_FILE_SUFFIXES = (
+    SNAPSHOT_SUFFIX, VECTORS_SUFFIX, RECORDS_SUFFIX, PENDING_SUFFIX, WAL_SUFFIX, ".faiss", ".faiss.json", LEXICAL_SUFFIX,
+    LEGACY_SUFFIX, MIGRATED_SUFFIX
+)
+SORT_COLUMNS = ("name", "updated_at", "turns", "memories", "size_bytes")
+
+def is_memory_file(filename: str) -> bool:
+    """Whether a file in SESSIONS_PATH belongs to a session's MemoryDB rather than its history."""
+    return MEMORY_BASENAME_SUFFIX + "." in filename and filename.endswith(MEMORY_FILE_SUFFIXES)
+
+def memory_bytes(session_name: str) -> int:
+    base_path = os.path.join(settings.SESSIONS_PATH, session_name + MEMORY_BASENAME_SUFFIX)
+    total = 0
+    for suffix in MEMORY_FILE_SUFFIXES:
+        path = base_path + suffix
+        try:
+            if os.path.isdir(path):
+                for dirpath, _, filenames in os.walk(path):
+                    total += sum(os.path.getsize(os.path.join(dirpath, filename)) for filename in filenames)
+            else:
+                total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+def _count_memories_on_disk(session_name: str) -> int:
+    """Memories in the snapshot plus the adds (minus deletes) still in the write-ahead log."""
+    base_path = os.path.join(settings.SESSIONS_PATH, session_name + MEMORY_BASENAME_SUFFIX)
+    store = VectorStore(base_path)
+    count = 0
+    if store.exists():
+        count = store.record_count()
+    elif os.path.exists(base_path + LEGACY_SUFFIX):
+        with open(base_path + LEGACY_SUFFIX, 'r', encoding='utf-8') as f:
+            count = len(json.load(f))
+    if os.path.exists(base_path + WAL_SUFFIX):
+        with open(base_path + WAL_SUFFIX, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    op = json.loads(line).get("op")
+                except ValueError:
+                    break  # torn trailing write
+                count += 1 if op == "add" else -1 if op == "delete" else 0
+    return max(0, count)
+
+class SessionCatalog:
+    """
+    SQLite table of sessions with their turn count, memory count, on-disk size and
+    last update, so /session/list needs no directory scan. Rows are updated when a
+    session's history is saved or memories are added; rebuild() recreates them all from
+    the files in SESSIONS_PATH. Calls block and may come from any thread.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        existed = os.path.exists(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " name TEXT PRIMARY KEY,"
+            " turns INTEGER NOT NULL DEFAULT 0,"
+            " memories INTEGER NOT NULL DEFAULT 0,"
+            " history_bytes INTEGER NOT NULL DEFAULT 0,"
+            " memory_bytes INTEGER NOT NULL DEFAULT 0,"
+            " size_bytes INTEGER NOT NULL DEFAULT 0,"
+            " updated_at TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+        self._conn.commit()
+        # A new database file means the catalog was lost or never built; see rebuild().
+        self.created = not existed
+
+    def update_history(self, session_name: str, turns: int, history_bytes: int, updated_at: Optional[str] = None):
+        self._upsert(session_name, updated_at, turns=turns, history_bytes=history_bytes)
+
+    def update_memories(self, session_name: str, memories: int, memory_bytes: int, updated_at: Optional[str] = None):
+        self._upsert(session_name, updated_at, memories=memories, memory_bytes=memory_bytes)
+
+    def _upsert(self, session_name: str, updated_at: Optional[str], **columns: int):
+        names = list(columns)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in names)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT INTO sessions (name, updated_at, {', '.join(names)}) VALUES (?, ?, {', '.join('?' * len(names))})"
+                f" ON CONFLICT(name) DO UPDATE SET {updates}, updated_at = excluded.updated_at",
+                [session_name, updated_at or datetime.utcnow().isoformat(), *columns.values()]
+            )
+            self._conn.execute(
+                "UPDATE sessions SET size_bytes = history_bytes + memory_bytes WHERE name = ?", (session_name,)
+            )
+            self._conn.commit()
+
+    def remove(self, session_name: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE name = ?", (session_name,))
+            self._conn.commit()
+
+    def list(self, offset: int = 0, limit: int = 50, sort: str = "updated_at", descending: bool = True,
+             prefix: str = "") -> Tuple[int, List[Dict]]:
+        """One page of sessions whose name starts with prefix; returns (total matches, rows)."""
+        if sort not in SORT_COLUMNS:
+            raise Exception(f"Cannot sort sessions by {sort}; use one of {', '.join(SORT_COLUMNS)}")
+        where, params = "", []
+        if prefix:
+            # A range on the primary key instead of LIKE, so the lookup uses the index.
+            where, params = "WHERE name >= ? AND name < ?", [prefix, prefix + "\U0010ffff"]
+        order = "DESC" if descending else "ASC"
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM sessions {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT name, turns, memories, size_bytes, updated_at FROM sessions {where}"
+                f" ORDER BY {sort} {order}, name ASC LIMIT ? OFFSET ?",
+                params + [max(0, limit), max(0, offset)]
+            ).fetchall()
+        return total, [
+            {'name': name, 'turns': turns, 'memories': memories, 'size_bytes': size_bytes, 'updated_at': updated_at}
+            for name, turns, memories, size_bytes, updated_at in rows
+        ]
+
+    def rebuild(self, histories: Iterable[Tuple[str, int, int, str]]) -> int:
+        """
+        Recreate every row from disk: histories yields (name, turns, history_bytes, updated_at)
+        for each stored session history, and memory files are found in SESSIONS_PATH.
+        Returns the number of sessions.
+        """
+        sessions: Dict[str, Dict] = {}
+        for session_name, turns, history_bytes, updated_at in histories:
+            sessions[session_name] = {'turns': turns, 'history_bytes': history_bytes, 'updated_at': updated_at}
+        for filename in os.listdir(settings.SESSIONS_PATH):
+            if not is_memory_file(filename):
+                continue
+            session_name = filename[:filename.index(MEMORY_BASENAME_SUFFIX + ".")]
+            if session_name in sessions and 'memories' in sessions[session_name]:
+                continue
+            row = sessions.setdefault(session_name, {'turns': 0, 'history_bytes': 0, 'updated_at': None})
+            try:
+                row['memories'] = _count_memories_on_disk(session_name)
+            except Exception as e:
+                logger.warning(f"Could not count memories of session {session_name}: {str(e)}")
+                row['memories'] = 0
+            row['memory_bytes'] = memory_bytes(session_name)
+            mtime = datetime.utcfromtimestamp(
+                os.path.getmtime(os.path.join(settings.SESSIONS_PATH, filename))
+            ).isoformat()
+            row['updated_at'] = max(filter(None, (row['updated_at'], mtime)))
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions")
+            self._conn.executemany(
+                "INSERT INTO sessions (name, turns, memories, history_bytes, memory_bytes, size_bytes, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (name, row['turns'], row.get('memories', 0), row['history_bytes'], row.get('memory_bytes', 0),
+                     row['history_bytes'] + row.get('memory_bytes', 0), row['updated_at'])
+                    for name, row in sessions.items()
+                ]
+            )
+            self._conn.commit()
+        logger.info(f"Rebuilt session catalog with {len(sessions)} sessions")
+        return len(sessions)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_catalog: Optional[SessionCatalog] = None
+_catalog_guard = threading.Lock()
+
+def get_session_catalog() -> SessionCatalog:
+    global _catalog
+    with _catalog_guard:
+        if _catalog is None:
+            _catalog = SessionCatalog(settings.SESSION_CATALOG_PATH)
+        return _catalog
+
+def close_session_catalog():
+    global _catalog
+    with _catalog_guard:
+        if _catalog is not None:
+            _catalog.close()
+            _catalog = None
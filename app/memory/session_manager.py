@@ -1,33 +1,404 @@
-import os
+import gzip
 import json
+import logging
+import os
+import shutil
+import threading
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 from ..config.settings import settings
+from ..concurrency import get_executor
+from ..serialization import (
+    CODEC_EXTENSIONS, RecordCodec, decode_complete_records, decode_records, detect_codec, encode_records,
+    get_record_codec, json_loads
+)
+from .session_catalog import SessionCatalog, get_session_catalog, is_memory_file, memory_bytes
+
+logger = logging.getLogger(__name__)
 
+# Legacy layout: the whole session as one JSON document. It is migrated on first access.
 SESSION_FILE_SUFFIX = ".json"
+# Current layout: a directory of segments, one record per chat turn, encoded with the
+# record codec; the extension names the codec (.jsonl or .msgpack).
+#   meta.json                       session name, timestamps and the rewrite generation
+#   <start>.jsonl                   plain segment; the last one is appended to
+#   <start>-<end>.jsonl.gz          compacted, gzip'd run of sealed segments [start, end)
+SESSION_DIR_SUFFIX = ".session"
+META_FILE = "meta.json"
+SEGMENT_SUFFIXES = tuple(CODEC_EXTENSIONS.values())
+GZIP_SUFFIX = ".gz"
+
+# Writes and compaction of a session are serialized; the lock dict itself has a guard.
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+_compacting = set()
+_catalog_rebuild_lock = threading.Lock()
+
+class PartialHistoryError(Exception):
+    """A save started past turn 0 that does not continue the stored history."""
+
+def _session_lock(session_name: str) -> threading.Lock:
+    with _locks_guard:
+        if session_name not in _locks:
+            _locks[session_name] = threading.Lock()
+        return _locks[session_name]
 
 def get_session_filepath(session_name: str) -> str:
     filename = f"{session_name}{SESSION_FILE_SUFFIX}"
     return os.path.join(settings.SESSIONS_PATH, filename)
 
-def save_session(session_name: str, chat_history: list) -> None:
-    session_data = {
+def get_session_dirpath(session_name: str) -> str:
+    return os.path.join(settings.SESSIONS_PATH, f"{session_name}{SESSION_DIR_SUFFIX}")
+
+def _split_segment_name(filename: str) -> Optional[Tuple[str, str, bool]]:
+    """(stem, codec extension, compacted) of a segment file name, or None for other files."""
+    compacted = filename.endswith(GZIP_SUFFIX)
+    name = filename[:-len(GZIP_SUFFIX)] if compacted else filename
+    for extension in SEGMENT_SUFFIXES:
+        if name.endswith(extension):
+            return name[:-len(extension)], extension, compacted
+    return None
+
+def _segments(dirpath: str) -> List[Tuple[int, int, str]]:
+    """
+    (start, end, filename) of the live segments in turn order. end is None for plain
+    segments. A plain segment that a compacted one already covers (compaction finished
+    but has not deleted it yet) is skipped.
+    """
+    segments = []
+    for filename in os.listdir(dirpath):
+        parts = _split_segment_name(filename)
+        if parts is None:
+            continue
+        stem, _, compacted = parts
+        if compacted:
+            start, end = stem.split("-")
+            segments.append((int(start), int(end), filename))
+        else:
+            segments.append((int(stem), None, filename))
+    segments.sort(key=lambda segment: (segment[0], segment[1] is None))
+    live = []
+    covered = 0
+    for start, end, filename in segments:
+        if start < covered:
+            continue
+        live.append((start, end, filename))
+        if end is not None:
+            covered = end
+    return live
+
+def _read_segment(dirpath: str, filename: str) -> list:
+    """
+    Turns of one segment. A torn final record left by an interrupted append is cut off
+    the file, as WriteAheadLog.replay does, so the session keeps loading and later
+    appends are not stranded behind it. Compacted segments are written whole and are
+    decoded strictly.
+    """
+    path = os.path.join(dirpath, filename)
+    if filename.endswith(GZIP_SUFFIX):
+        with gzip.open(path, 'rb') as f:
+            return decode_records(f.read())
+    with open(path, 'rb') as f:
+        data = f.read()
+    turns, length = decode_complete_records(data)
+    if length < len(data):
+        logger.warning(f"Truncating torn record at byte {length} of {path}")
+        with open(path, 'r+b') as f:
+            f.truncate(length)
+    return turns
+
+def _written_with(dirpath: str, start: int, codec: RecordCodec) -> bool:
+    """Whether plain segment `start` is named for codec and encoded with it (older files may not be)."""
+    path = os.path.join(dirpath, f"{start:010d}{codec.extension}")
+    if not os.path.exists(path):
+        return False
+    with open(path, 'rb') as f:
+        return detect_codec(f.read(1)) is codec
+
+def _write_segment(dirpath: str, start: int, turns: list, codec: RecordCodec):
+    with open(os.path.join(dirpath, f"{start:010d}{codec.extension}"), 'ab') as f:
+        f.write(encode_records(turns, codec))
+
+def _write_meta(dirpath: str, session_name: str, created_at: Optional[str] = None, saved_at: Optional[str] = None,
+                generation: Optional[int] = None):
+    meta_path = os.path.join(dirpath, META_FILE)
+    now = saved_at or datetime.utcnow().isoformat()
+    previous = _read_meta(dirpath) if os.path.exists(meta_path) else {}
+    meta = {
         "session_name": session_name,
-        "chat_history": chat_history,
-        "saved_at": datetime.utcnow().isoformat()
+        "created_at": created_at or previous.get("created_at") or now,
+        "saved_at": now,
+        "generation": previous.get("generation", 0) if generation is None else generation
     }
-    filepath = get_session_filepath(session_name)
-    with open(filepath, 'w') as f:
-        json.dump(session_data, f)
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def _read_meta(dirpath: str) -> dict:
+    with open(os.path.join(dirpath, META_FILE), 'r') as f:
+        return json.load(f)
+
+def _generation(dirpath: str) -> int:
+    """How many times the session was rewritten; compaction checks it did not change underneath."""
+    if not os.path.exists(os.path.join(dirpath, META_FILE)):
+        return 0
+    return _read_meta(dirpath).get("generation", 0)
+
+def _tail(dirpath: str) -> Tuple[int, list]:
+    """Start index and turns of the segment being appended to; bounded by SESSION_SEGMENT_TURNS."""
+    segments = _segments(dirpath)
+    if not segments:
+        return 0, []
+    start, end, filename = segments[-1]
+    if end is not None:
+        return end, []
+    return start, _read_segment(dirpath, filename)
+
+def _append(dirpath: str, turns: list) -> int:
+    """Append turns, rolling over to a new segment every SESSION_SEGMENT_TURNS; returns the turn count."""
+    start, tail = _tail(dirpath)
+    total = start + len(tail)
+    codec = get_record_codec()
+    if tail and not _written_with(dirpath, start, codec):
+        # Encodings are never mixed within a file; a changed codec starts a new segment.
+        start, tail = total, []
+    segment_turns = settings.SESSION_SEGMENT_TURNS
+    while turns:
+        if len(tail) >= segment_turns:
+            start, tail = total, []
+        chunk = turns[:segment_turns - len(tail)]
+        _write_segment(dirpath, start, chunk, codec)
+        tail = tail + chunk
+        total += len(chunk)
+        turns = turns[len(chunk):]
+    return total
 
-def load_session(session_name: str) -> dict:
+def _rewrite(dirpath: str, session_name: str, chat_history: list):
+    """
+    Replace the stored history. The new segments reuse the old file names, so the
+    generation in meta.json is bumped first to let a running compaction notice.
+    """
+    if os.path.isdir(dirpath):
+        _write_meta(dirpath, session_name, generation=_generation(dirpath) + 1)
+        for filename in os.listdir(dirpath):
+            if _split_segment_name(filename) is not None:
+                os.remove(os.path.join(dirpath, filename))
+    else:
+        os.makedirs(dirpath)
+    _append(dirpath, chat_history)
+
+def _read_range(dirpath: str, first: int, end: int) -> list:
+    """Turns [first, end) of the session, reading only the segments that hold them."""
+    if first >= end:
+        return []
+    pages = []
+    for start, _, filename in reversed(_segments(dirpath)):
+        if start >= end:
+            continue
+        turns = _read_segment(dirpath, filename)
+        pages.append(turns[max(0, first - start):end - start])
+        if start <= first:
+            break
+    return [turn for page in reversed(pages) for turn in page]
+
+def _migrate_legacy(session_name: str):
+    """Convert a single-document session into segments (once, under the session lock)."""
     filepath = get_session_filepath(session_name)
-    if not os.path.exists(filepath):
-        raise FileNotFoundError(f"Session file {filepath} not found.")
-    with open(filepath, 'r') as f:
-        session_data = json.load(f)
-    return session_data
-
-def list_sessions() -> list:
-    files = os.listdir(settings.SESSIONS_PATH)
-    sessions = [f for f in files if f.endswith(SESSION_FILE_SUFFIX)]
-    return [f[:-len(SESSION_FILE_SUFFIX)] for f in sessions]
\ No newline at end of file
+    dirpath = get_session_dirpath(session_name)
+    if os.path.isdir(dirpath) or not os.path.exists(filepath):
+        return
+    with open(filepath, 'rb') as f:
+        session_data = json_loads(f.read())
+    tmp_dirpath = dirpath + ".tmp"
+    shutil.rmtree(tmp_dirpath, ignore_errors=True)
+    os.makedirs(tmp_dirpath)
+    _append(tmp_dirpath, session_data.get("chat_history", []))
+    saved_at = session_data.get("saved_at")
+    _write_meta(tmp_dirpath, session_name, created_at=saved_at, saved_at=saved_at)
+    os.replace(tmp_dirpath, dirpath)
+    os.remove(filepath)
+    logger.info(f"Migrated session {session_name} to segmented history")
+
+def save_session(session_name: str, chat_history: list, start: int = 0) -> dict:
+    """
+    Store chat_history, whose first turn is turn number `start` of the session. The turns
+    the client sent that are already stored are compared with the stored ones; if they all
+    match, only the new turns are appended, reading no segment before `start`. If any
+    differs (the client cleared or edited the history), the session is rewritten from
+    `chat_history` instead, which needs the whole history: PartialHistoryError is raised
+    if `start` is not 0.
+    """
+    dirpath = get_session_dirpath(session_name)
+    with _session_lock(session_name):
+        _migrate_legacy(session_name)
+        appended = None
+        if os.path.isdir(dirpath):
+            tail_start, tail = _tail(dirpath)
+            total = tail_start + len(tail)
+            if start > total:
+                raise PartialHistoryError(
+                    f"Cannot save session {session_name} from turn {start}; only {total} turns are stored"
+                )
+            # Appending is safe only if the client's copy of every stored turn it sent is unchanged.
+            overlap = total - start
+            if start + len(chat_history) >= total and chat_history[:overlap] == _read_range(dirpath, start, total):
+                appended = chat_history[overlap:]
+                total = _append(dirpath, appended)
+        if appended is None:
+            if start:
+                raise PartialHistoryError(
+                    f"Cannot save session {session_name} from a partial history starting at turn {start}: it does "
+                    f"not continue the stored history. Send the whole history (start 0) to replace it."
+                )
+            _rewrite(dirpath, session_name, chat_history)
+            total = len(chat_history)
+            appended = chat_history
+        _write_meta(dirpath, session_name)
+        history_bytes = _history_bytes(dirpath)
+    # Outside the session lock: a catalog rebuild takes the session locks while scanning.
+    _record_history(session_name, total, history_bytes)
+    _maybe_compact(session_name)
+    return {"session_name": session_name, "turns": total, "appended": len(appended)}
+
+def load_session(session_name: str, limit: Optional[int] = None, before: Optional[int] = None) -> dict:
+    """
+    Load a page of the session's history: the latest `limit` turns before turn number
+    `before` (all turns if limit is None), oldest first. `start` is the number of the
+    first returned turn and `next_cursor` the `before` for the previous page, or None
+    when the page reaches the beginning of the session.
+    """
+    dirpath = get_session_dirpath(session_name)
+    with _session_lock(session_name):
+        _migrate_legacy(session_name)
+        if not os.path.isdir(dirpath):
+            raise FileNotFoundError(f"Session {session_name} not found.")
+        tail_start, tail = _tail(dirpath)
+        total = tail_start + len(tail)
+        end = total if before is None else max(0, min(before, total))
+        first = 0 if limit is None else max(0, end - max(0, limit))
+        chat_history = _read_range(dirpath, first, end)
+        meta = _read_meta(dirpath)
+    return {
+        "session_name": session_name,
+        "chat_history": chat_history,
+        "saved_at": meta.get("saved_at"),
+        "total_turns": total,
+        "start": first,
+        "next_cursor": first if first > 0 else None
+    }
+
+def _maybe_compact(session_name: str):
+    """Schedule compaction on the blocking pool once enough sealed segments piled up."""
+    dirpath = get_session_dirpath(session_name)
+    sealed = sum(1 for _, end, _ in _segments(dirpath)[:-1] if end is None)
+    if sealed < settings.SESSION_COMPACT_SEGMENTS:
+        return
+    with _locks_guard:
+        if session_name in _compacting:
+            return
+        _compacting.add(session_name)
+    get_executor().submit(compact_session, session_name)
+
+def compact_session(session_name: str):
+    """
+    Merge all sealed plain segments into one gzip'd segment. The merged file is written
+    without holding the session lock (sealed segments only change when the session is
+    rewritten, which bumps its generation); only removing the merged segments takes it,
+    so saves and loads are not blocked meanwhile.
+    """
+    try:
+        dirpath = get_session_dirpath(session_name)
+        with _session_lock(session_name):
+            generation = _generation(dirpath)
+            sealed = [(start, filename) for start, end, filename in _segments(dirpath)[:-1] if end is None]
+        if len(sealed) < 2:
+            return
+        turns = [turn for _, filename in sealed for turn in _read_segment(dirpath, filename)]
+        start = sealed[0][0]
+        codec = get_record_codec()
+        name = f"{start:010d}-{start + len(turns):010d}{codec.extension}{GZIP_SUFFIX}"
+        tmp_path = os.path.join(dirpath, name + ".tmp")
+        with gzip.open(tmp_path, 'wb') as f:
+            f.write(encode_records(turns, codec))
+        with _session_lock(session_name):
+            if not os.path.isdir(dirpath):
+                os.remove(tmp_path)
+                return
+            if _generation(dirpath) != generation:
+                # The session was rewritten meanwhile; the merged turns are stale.
+                os.remove(tmp_path)
+                return
+            os.replace(tmp_path, os.path.join(dirpath, name))
+            for _, filename in sealed:
+                os.remove(os.path.join(dirpath, filename))
+            tail_start, tail = _tail(dirpath)
+            total, history_bytes = tail_start + len(tail), _history_bytes(dirpath)
+        _record_history(session_name, total, history_bytes)
+        logger.info(f"Compacted {len(sealed)} segments ({len(turns)} turns) of session {session_name}")
+    except Exception as e:
+        logger.error(f"Error compacting session {session_name}: {str(e)}")
+    finally:
+        with _locks_guard:
+            _compacting.discard(session_name)
+
+def _history_bytes(dirpath: str) -> int:
+    return sum(entry.stat().st_size for entry in os.scandir(dirpath) if entry.is_file())
+
+def _record_history(session_name: str, turns: int, history_bytes: int):
+    """Keep the session's catalog row current; a failure here must not fail the save."""
+    try:
+        get_catalog().update_history(session_name, turns, history_bytes)
+    except Exception as e:
+        logger.error(f"Error updating session catalog for {session_name}: {str(e)}")
+
+def record_memories(session_name: str, memories: int):
+    """Update the catalog after memories were added to the session's MemoryDB."""
+    try:
+        get_catalog().update_memories(session_name, memories, memory_bytes(session_name))
+    except Exception as e:
+        logger.error(f"Error updating session catalog for {session_name}: {str(e)}")
+
+def scan_session_history():
+    """Yield (name, turns, history_bytes, updated_at) for every session history in SESSIONS_PATH."""
+    for filename in os.listdir(settings.SESSIONS_PATH):
+        path = os.path.join(settings.SESSIONS_PATH, filename)
+        try:
+            if filename.endswith(SESSION_DIR_SUFFIX) and os.path.isdir(path):
+                session_name = filename[:-len(SESSION_DIR_SUFFIX)]
+                with _session_lock(session_name):
+                    tail_start, tail = _tail(path)
+                    yield session_name, tail_start + len(tail), _history_bytes(path), _read_meta(path).get("saved_at")
+            elif filename.endswith(SESSION_FILE_SUFFIX) and not is_memory_file(filename):
+                with open(path, 'rb') as f:
+                    session_data = json_loads(f.read())
+                yield (filename[:-len(SESSION_FILE_SUFFIX)], len(session_data.get("chat_history", [])),
+                       os.path.getsize(path), session_data.get("saved_at"))
+        except Exception as e:
+            logger.warning(f"Skipping unreadable session {filename}: {str(e)}")
+
+def get_catalog() -> SessionCatalog:
+    """The session catalog, rebuilt from the files on disk if its database was missing."""
+    catalog = get_session_catalog()
+    if catalog.created:
+        with _catalog_rebuild_lock:
+            if catalog.created:
+                catalog.rebuild(scan_session_history())
+                catalog.created = False
+    return catalog
+
+def rebuild_catalog() -> int:
+    with _catalog_rebuild_lock:
+        return get_catalog().rebuild(scan_session_history())
+
+def list_sessions(offset: int = 0, limit: int = 50, sort: str = "updated_at", descending: bool = True,
+                  prefix: str = "") -> dict:
+    """One page of the session catalog, optionally restricted to names starting with prefix."""
+    total, items = get_catalog().list(offset, limit, sort, descending, prefix)
+    return {
+        "sessions": [item['name'] for item in items],
+        "items": items,
+        "total": total,
+        "offset": offset,
+        "limit": limit
+    }
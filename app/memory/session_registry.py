@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from .memory_db import MemoryDB
+
+logger = logging.getLogger(__name__)
+
+class SessionRegistry:
+    """
+    Bounded, least-recently-used cache of per-session MemoryDB instances.
+
+    Sessions are capped by count and by estimated memory footprint and are evicted
+    after being idle for idle_seconds; an evicted session is flushed (compacted) in the
+    background, and reloading it waits for that flush. Concurrent first requests for one session share a single load.
+    Sessions held through lease() are never evicted while in use.
+    """
+
+    def __init__(self,
+                 loader: Callable[[str], Awaitable[MemoryDB]],
+                 max_sessions: int = 64,
+                 max_bytes: int = 2 * 1024 ** 3,
+                 idle_seconds: float = 1800.0,
+                 sweep_interval: float = 60.0):
+        self._loader = loader
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.sweep_interval = sweep_interval
+        self._sessions: "OrderedDict[str, MemoryDB]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        self._leases: Dict[str, int] = {}
+        self._loading: Dict[str, asyncio.Task] = {}
+        # Evicted sessions still being flushed; a reload waits for the flush to finish.
+        self._closing: Dict[str, asyncio.Task] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+        self.evictions = 0
+
+    def __contains__(self, session_name: str) -> bool:
+        return session_name in self._sessions
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def items(self):
+        return list(self._sessions.items())
+
+    def values(self):
+        return list(self._sessions.values())
+
+    async def get(self, session_name: str) -> MemoryDB:
+        memory_db = self._sessions.get(session_name)
+        if memory_db is not None:
+            self._touch(session_name)
+            return memory_db
+        task = self._loading.get(session_name)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._load(session_name))
+            self._loading[session_name] = task
+        # Shielded, so a cancelled caller does not cancel the load other callers wait on.
+        return await asyncio.shield(task)
+
+    @asynccontextmanager
+    async def lease(self, session_name: str) -> AsyncIterator[MemoryDB]:
+        memory_db = await self.get(session_name)
+        self._leases[session_name] = self._leases.get(session_name, 0) + 1
+        try:
+            yield memory_db
+        finally:
+            self._leases[session_name] -= 1
+            if not self._leases[session_name]:
+                del self._leases[session_name]
+            if session_name in self._sessions:
+                self._touch(session_name)
+
+    def _touch(self, session_name: str):
+        self._sessions.move_to_end(session_name)
+        self._last_used[session_name] = time.monotonic()
+
+    async def _load(self, session_name: str) -> MemoryDB:
+        try:
+            closing = self._closing.get(session_name)
+            if closing is not None:
+                await asyncio.wait([closing])
+            memory_db = await self._loader(session_name)
+            self._sessions[session_name] = memory_db
+            self._touch(session_name)
+            self._enforce_limits(keep=session_name)
+            return memory_db
+        finally:
+            self._loading.pop(session_name, None)
+
+    def estimated_bytes(self) -> int:
+        return sum(memory_db.estimated_bytes() for memory_db in self._sessions.values())
+
+    def _enforce_limits(self, keep: Optional[str] = None):
+        """Evict least recently used, unleased sessions until both caps are respected."""
+        total_bytes = self.estimated_bytes()
+        for session_name in list(self._sessions):
+            if len(self._sessions) <= self.max_sessions and total_bytes <= self.max_bytes:
+                break
+            if session_name == keep or session_name in self._leases:
+                continue
+            total_bytes -= self._sessions[session_name].estimated_bytes()
+            self.evict(session_name)
+
+    def evict(self, session_name: str) -> bool:
+        """
+        Unload a session and flush it to disk in the background. Returns False if it
+        is in use or not loaded.
+        """
+        if session_name in self._leases or session_name not in self._sessions:
+            return False
+        memory_db = self._sessions.pop(session_name)
+        self._last_used.pop(session_name, None)
+        self.evictions += 1
+        self._closing[session_name] = asyncio.get_running_loop().create_task(self._close(session_name, memory_db))
+        logger.info(f"Evicted memory for session {session_name}")
+        return True
+
+    async def _close(self, session_name: str, memory_db: MemoryDB):
+        try:
+            await memory_db.close()
+        except Exception as e:
+            logger.error(f"Error flushing memory for session {session_name} on eviction: {str(e)}")
+        finally:
+            self._closing.pop(session_name, None)
+
+    def evict_idle(self) -> int:
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [name for name, last_used in self._last_used.items() if last_used < cutoff]
+        return sum(1 for session_name in idle if self.evict(session_name))
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                evicted = self.evict_idle()
+                if evicted:
+                    logger.info(f"Evicted {evicted} idle sessions")
+            except Exception as e:
+                logger.error(f"Error evicting idle sessions: {str(e)}")
+
+    def start(self):
+        if self._sweeper is None:
+            self._sweeper = asyncio.get_running_loop().create_task(self._sweep())
+
+    async def close(self):
+        """Stop the idle sweeper and flush every loaded session."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for session_name, memory_db in list(self._sessions.items()):
+            try:
+                await memory_db.close()
+            except Exception as e:
+                logger.error(f"Error closing memory for session {session_name}: {str(e)}")
+        self._sessions.clear()
+        self._last_used.clear()
+        if self._closing:
+            await asyncio.wait(list(self._closing.values()))
+
+    def stats(self) -> Dict:
+        return {
+            'sessions': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'estimated_bytes': self.estimated_bytes(),
+            'max_bytes': self.max_bytes,
+            'loading': len(self._loading),
+            'leased': len(self._leases),
+            'closing': len(self._closing),
+            'evictions': self.evictions
+        }
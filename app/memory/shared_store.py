@@ -0,0 +1,144 @@
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from ..concurrency import ThreadRWLock
+from ..config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# A vector's id in the shared store is (session slot << 32) | the session's own id, so
+# the high bits act as the session-id column and one session is a contiguous id range.
+SESSION_SHIFT = 32
+LOCAL_ID_MASK = (1 << SESSION_SHIFT) - 1
+
+class SharedVectorStore:
+    """
+    Holds the vectors of every loaded session in a few sharded ID-mapped indexes.
+    A session lives entirely in one shard; per-session search filters the shard
+    with an IDSelectorRange over the session's id range.
+    Sessions call in from worker threads, so searches share a lock that writes hold exclusively.
+    """
+
+    def __init__(self, dimension: int, shards: int = 4):
+        self.dimension = dimension
+        self.shards = [faiss.IndexIDMap(faiss.IndexFlatIP(dimension)) for _ in range(max(1, shards))]
+        self._next_slot = 0
+        self._slots: Dict[str, int] = {}
+        self._sessions: Dict[int, str] = {}
+        self._counts: Dict[int, int] = {}
+        self._lock = ThreadRWLock()
+
+    def register(self, session_name: str) -> int:
+        with self._lock.write():
+            if session_name not in self._slots:
+                slot = self._next_slot
+                self._next_slot += 1
+                self._slots[session_name] = slot
+                self._sessions[slot] = session_name
+                self._counts[slot] = 0
+            return self._slots[session_name]
+
+    def _shard(self, slot: int) -> faiss.Index:
+        return self.shards[slot % len(self.shards)]
+
+    def _range(self, slot: int) -> faiss.IDSelectorRange:
+        return faiss.IDSelectorRange(slot << SESSION_SHIFT, (slot + 1) << SESSION_SHIFT)
+
+    def count(self, slot: int) -> int:
+        return self._counts.get(slot, 0)
+
+    def add(self, slot: int, vectors: np.ndarray, ids: np.ndarray):
+        with self._lock.write():
+            self._shard(slot).add_with_ids(vectors, (slot << SESSION_SHIFT) | ids.astype('int64'))
+            self._counts[slot] += len(ids)
+
+    def remove(self, slot: int, ids: np.ndarray) -> int:
+        with self._lock.write():
+            removed = self._shard(slot).remove_ids((slot << SESSION_SHIFT) | ids.astype('int64'))
+            self._counts[slot] -= removed
+            return removed
+
+    def search(self, slot: int, query_vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Search one session's vectors; returned ids are the session's own ids (-1 for no result)."""
+        params = faiss.SearchParameters(sel=self._range(slot))
+        with self._lock.read():
+            scores, ids = self._shard(slot).search(query_vectors, k, params=params)
+        return scores, np.where(ids >= 0, ids & LOCAL_ID_MASK, -1)
+
+    def search_all(self, query_vector: np.ndarray, k: int) -> List[Tuple[str, int, float]]:
+        """Cross-session search: top-k (session_name, id, similarity) over every loaded session."""
+        hits = []
+        with self._lock.read():
+            for shard in self.shards:
+                if not shard.ntotal:
+                    continue
+                scores, ids = shard.search(query_vector.reshape(1, -1), min(k, shard.ntotal))
+                for score, global_id in zip(scores[0], ids[0]):
+                    if global_id >= 0:
+                        session_name = self._sessions.get(int(global_id) >> SESSION_SHIFT)
+                        if session_name is not None:
+                            hits.append((session_name, int(global_id) & LOCAL_ID_MASK, float(score)))
+        hits.sort(key=lambda hit: hit[2], reverse=True)
+        return hits[:k]
+
+    def drop_session(self, session_name: str):
+        """Remove an unloaded session's vectors and forget its slot."""
+        with self._lock.write():
+            slot = self._slots.pop(session_name, None)
+            if slot is None:
+                return
+            self._shard(slot).remove_ids(self._range(slot))
+            del self._sessions[slot]
+            del self._counts[slot]
+
+    def stats(self) -> Dict:
+        return {
+            'dimension': self.dimension,
+            'sessions': len(self._slots),
+            'shard_vectors': [shard.ntotal for shard in self.shards]
+        }
+
+class SharedStoreView:
+    """
+    The slice of the shared store that belongs to one session, exposing the part of
+    the FAISS index interface MemoryDB uses (ntotal, d, add_with_ids, remove_ids, search).
+    """
+
+    def __init__(self, store: SharedVectorStore, session_name: str):
+        self.store = store
+        self.session_name = session_name
+        self.slot = store.register(session_name)
+        self.d = store.dimension
+
+    @property
+    def ntotal(self) -> int:
+        return self.store.count(self.slot)
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        self.store.add(self.slot, vectors, ids)
+
+    def remove_ids(self, ids: np.ndarray) -> int:
+        return self.store.remove(self.slot, ids)
+
+    def search(self, query_vectors: np.ndarray, k: int):
+        return self.store.search(self.slot, query_vectors, k)
+
+    def release(self):
+        self.store.drop_session(self.session_name)
+
+_shared_stores: Dict[int, SharedVectorStore] = {}
+
+def get_shared_store(dimension: int) -> SharedVectorStore:
+    """The process-wide shared store for vectors of the given dimension."""
+    if dimension not in _shared_stores:
+        _shared_stores[dimension] = SharedVectorStore(dimension, settings.MEMORY_SHARED_STORE_SHARDS)
+        logger.info(f"Created shared vector store for dimension {dimension}")
+    return _shared_stores[dimension]
+
+def shared_store_stats() -> Optional[List[Dict]]:
+    if not settings.MEMORY_SHARED_STORE:
+        return None
+    return [store.stats() for store in _shared_stores.values()]
@@ -0,0 +1,225 @@
+import os
+import logging
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..serialization import JSON_LINES, decode_records, encode_records, get_record_codec, json_dumps_bytes, json_loads
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = ".snapshot"
+MANIFEST_NAME = "manifest.json"
+VECTORS_NAME = "vectors.npy"
+RECORDS_NAME = "records"  # plus the record codec's extension
+# Flat snapshot pair written before snapshot generations; still read, replaced on the next save.
+VECTORS_SUFFIX = ".vectors.npy"
+RECORDS_SUFFIX = ".records.jsonl"
+PENDING_SUFFIX = ".pending.jsonl"
+LEGACY_SUFFIX = ".json"
+MIGRATED_SUFFIX = ".json.bak"
+
+def fsync_directory(path: str):
+    """Persist a directory's entries (new or renamed files); not supported on Windows."""
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+class VectorStore:
+    """
+    On-disk layout for one MemoryDB:
+
+      {base}.snapshot/manifest.json       names the current generation and its record count
+      {base}.snapshot/<gen>/vectors.npy   contiguous float32 matrix (n x d) of normalized
+                                          vectors, memory-mapped read-only on load
+      {base}.snapshot/<gen>/records.jsonl one record per row (key, text, metadata, created_at);
+                                          records.msgpack with the MessagePack codec; record i
+                                          describes row i of the vector matrix
+      {base}.pending.jsonl                records migrated without a vector, embedded by MemoryDB on load
+
+    A save writes a new generation directory and then swaps manifest.json in with
+    os.replace, so readers see either the previous pair or the new one, never a mix.
+    Every file and directory is fsync'd before save returns, so the write-ahead log can
+    be truncated after it. Older generations are removed once the manifest points past them.
+    """
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self.snapshot_dir = base_path + SNAPSHOT_SUFFIX
+        self.manifest_path = os.path.join(self.snapshot_dir, MANIFEST_NAME)
+        self.pending_path = base_path + PENDING_SUFFIX
+        self.legacy_path = base_path + LEGACY_SUFFIX
+        self.generation = 0
+        self.count: Optional[int] = None
+        self.vectors_path: Optional[str] = None
+        self.records_path: Optional[str] = None
+
+    def _resolve(self):
+        """Point vectors_path and records_path at the current snapshot, if there is one."""
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'rb') as f:
+                manifest = json_loads(f.read())
+            self.generation = manifest['generation']
+            self.count = manifest['count']
+            self.vectors_path = os.path.join(self.snapshot_dir, manifest['vectors'])
+            self.records_path = os.path.join(self.snapshot_dir, manifest['records'])
+        elif os.path.exists(self.base_path + RECORDS_SUFFIX) and os.path.exists(self.base_path + VECTORS_SUFFIX):
+            self.generation, self.count = 0, None
+            self.vectors_path = self.base_path + VECTORS_SUFFIX
+            self.records_path = self.base_path + RECORDS_SUFFIX
+        else:
+            self.generation, self.count = 0, None
+            self.vectors_path = self.records_path = None
+
+    def exists(self) -> bool:
+        self._resolve()
+        return self.records_path is not None
+
+    def record_count(self) -> int:
+        """Number of records in the current snapshot (0 without one)."""
+        if not self.exists():
+            return 0
+        if self.count is None:
+            with open(self.records_path, 'rb') as f:
+                self.count = len(decode_records(f.read()))
+        return self.count
+
+    def load(self) -> Tuple[List[Dict], np.ndarray]:
+        """Return (records, vectors); vectors is a read-only memory map of the .npy file."""
+        if not self.exists():
+            raise Exception(f"No memory snapshot at {self.base_path}")
+        vectors = np.load(self.vectors_path, mmap_mode='r')
+        with open(self.records_path, 'rb') as f:
+            records = decode_records(f.read())
+        if len(records) != vectors.shape[0]:
+            raise ValueError(
+                f"{self.records_path} has {len(records)} records but {self.vectors_path} has {vectors.shape[0]} vectors"
+            )
+        return records, vectors
+
+    def load_pending(self) -> List[Dict]:
+        if not os.path.exists(self.pending_path):
+            return []
+        with open(self.pending_path, 'rb') as f:
+            return decode_records(f.read())
+
+    def clear_pending(self):
+        if os.path.exists(self.pending_path):
+            os.remove(self.pending_path)
+
+    def save(self, records: List[Dict], vectors: np.ndarray):
+        if len(records) != vectors.shape[0]:
+            raise ValueError(f"Cannot save {len(records)} records with {vectors.shape[0]} vectors")
+        # Re-read the manifest: an unreadable one raises here rather than being overwritten.
+        self._resolve()
+        generation = self.generation + 1
+        name = f"{generation:08d}"
+        directory = os.path.join(self.snapshot_dir, name)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)  # left by a save that died before publishing
+        created = not os.path.isdir(self.snapshot_dir)
+        os.makedirs(directory)
+        with open(os.path.join(directory, VECTORS_NAME), 'wb') as f:
+            np.save(f, np.ascontiguousarray(vectors, dtype='float32'))
+            f.flush()
+            os.fsync(f.fileno())
+        codec = get_record_codec()
+        records_name = RECORDS_NAME + codec.extension
+        with open(os.path.join(directory, records_name), 'wb') as f:
+            f.write(encode_records(records, codec))
+            f.flush()
+            os.fsync(f.fileno())
+        fsync_directory(directory)
+        manifest = {
+            'generation': generation,
+            'count': len(records),
+            'vectors': f"{name}/{VECTORS_NAME}",
+            'records': f"{name}/{records_name}"
+        }
+        manifest_tmp = self.manifest_path + ".tmp"
+        with open(manifest_tmp, 'wb') as f:
+            f.write(json_dumps_bytes(manifest))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(manifest_tmp, self.manifest_path)
+        fsync_directory(self.snapshot_dir)
+        if created:
+            fsync_directory(os.path.dirname(os.path.abspath(self.snapshot_dir)))
+        self._resolve()
+        self._remove_stale(name)
+
+    def _remove_stale(self, current: str):
+        """Delete generations older than current and a flat snapshot pair from before generations."""
+        stale = [os.path.join(self.snapshot_dir, entry) for entry in os.listdir(self.snapshot_dir)
+                 if entry != current and entry != MANIFEST_NAME]
+        stale += [self.base_path + VECTORS_SUFFIX, self.base_path + RECORDS_SUFFIX]
+        for path in stale:
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                elif os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                # e.g. still memory-mapped on Windows; retried after the next save.
+                logger.debug(f"Could not remove old snapshot {path}: {str(e)}")
+
+def migrate_json_memories(store: VectorStore, dimension: Optional[int] = None) -> int:
+    """
+    One-time migration of a legacy {name}.json memory file (vectors as JSON lists)
+    into the binary layout. The legacy file is kept as {name}.json.bak. Records that
+    have no vector are written to the pending file to be embedded on next load.
+    Returns the number of migrated records.
+    """
+    with open(store.legacy_path, 'rb') as f:
+        legacy = json_loads(f.read())
+    records, vectors, pending = [], [], []
+    for key, memory in legacy.items():
+        record = {
+            'key': key,
+            'text': memory.get('text', ''),
+            'metadata': memory.get('metadata', {}),
+            'created_at': memory.get('created_at')
+        }
+        if 'vector' not in memory:
+            pending.append(record)
+            continue
+        vector = np.asarray(memory['vector'], dtype='float32')
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector = vector / norm
+        vectors.append(vector)
+        records.append(record)
+    if vectors:
+        matrix = np.vstack(vectors).astype('float32')
+    else:
+        matrix = np.zeros((0, dimension or 0), dtype='float32')
+    store.save(records, matrix)
+    if pending:
+        with open(store.pending_path, 'wb') as f:
+            f.write(JSON_LINES.encode(pending))
+        logger.warning(f"{len(pending)} memories in {store.legacy_path} have no vector; they will be embedded on load")
+    os.replace(store.legacy_path, store.base_path + MIGRATED_SUFFIX)
+    logger.info(f"Migrated {len(records) + len(pending)} memories from {store.legacy_path} to {store.vectors_path}")
+    return len(records) + len(pending)
+
+def migrate_directory(directory: str) -> int:
+    """Migrate every legacy memory file (*_memory.json and chat_memory.json) in a directory."""
+    migrated = 0
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith("_memory" + LEGACY_SUFFIX) or filename == "chat_memory" + LEGACY_SUFFIX:
+            store = VectorStore(os.path.join(directory, filename[:-len(LEGACY_SUFFIX)]))
+            if not store.exists():
+                migrate_json_memories(store)
+                migrated += 1
+    return migrated
+
+if __name__ == "__main__":
+    from ..config.settings import settings
+    logging.basicConfig(level=logging.INFO)
+    for path in (settings.SESSIONS_PATH, settings.MEMORY_PATH):
+        print(f"Migrated {migrate_directory(path)} memory files in {path}")
@@ -0,0 +1,123 @@
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from ..serialization import json_dumps, json_loads
+
+logger = logging.getLogger(__name__)
+
+WAL_SUFFIX = ".wal"
+
+def encode_vector(vector: np.ndarray) -> str:
+    return base64.b64encode(np.ascontiguousarray(vector, dtype='float32').tobytes()).decode('ascii')
+
+def decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype='float32')
+
+class WriteAheadLog:
+    """
+    Append-only journal of memory changes, one JSON entry per line:
+
+      {"op": "add", "key": ..., "id": ..., "text": ..., "metadata": ..., "created_at": ..., "vector": <base64 float32>}
+      {"op": "delete", "key": ...}
+
+    Entries are flushed to the OS on every append and fsync'd in groups: once
+    fsync_batch entries are unsynced or fsync_interval seconds have passed since the
+    last fsync (the owner calls sync() from a timer for the trailing group).
+    Methods may be called from worker threads; a lock serializes them.
+    """
+
+    def __init__(self, path: str, fsync_batch: int = 32, fsync_interval: float = 0.05):
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.entries = 0
+        self.unsynced = 0
+        self._last_sync = time.monotonic()
+        self._file = None
+        self._lock = threading.RLock()
+
+    def replay(self) -> List[Dict]:
+        """
+        Read all complete entries. A torn final entry left by a crash is cut off so
+        that later appends are not stranded behind it.
+        """
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        entries.append(json_loads(line))
+                    except (json.JSONDecodeError, UnicodeDecodeError):
+                        logger.warning(f"Truncating torn entry at byte {offset} of {self.path}")
+                        break
+                offset += len(line)
+        if offset < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+        self.entries = len(entries)
+        return entries
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        return self._file
+
+    def append(self, entries: List[Dict]):
+        lines = "".join(json_dumps(entry) + "\n" for entry in entries)
+        with self._lock:
+            f = self._open()
+            f.write(lines)
+            f.flush()
+            self.entries += len(entries)
+            self.unsynced += len(entries)
+            if self.unsynced >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self.sync()
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None and self.unsynced:
+                os.fsync(self._file.fileno())
+            self.unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def reset(self):
+        """Drop all entries; called once they are part of a durable snapshot."""
+        with self._lock:
+            self.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self.entries = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self.sync()
+                self._file.close()
+                self._file = None
+
+    def size_bytes(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+def add_entry(key: str, record: Dict, vector: np.ndarray) -> Dict:
+    return {
+        'op': 'add',
+        'key': key,
+        'id': record.get('id'),
+        'text': record['text'],
+        'metadata': record.get('metadata', {}),
+        'created_at': record.get('created_at'),
+        'vector': encode_vector(vector)
+    }
+
+def delete_entry(key: str) -> Dict:
+    return {'op': 'delete', 'key': key}
@@ -0,0 +1,168 @@
+import abc
+import json
+import logging
+from typing import Any, Iterable, List, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+from .config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Optional fast backends; everything falls back to the stdlib json module without them.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CODEC_JSONL = "jsonl"
+CODEC_MSGPACK = "msgpack"
+# File name extension of each encoding, so a file's name never lies about its contents.
+CODEC_EXTENSIONS = {CODEC_JSONL: ".jsonl", CODEC_MSGPACK: ".msgpack"}
+
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson is not None else 0
+
+def fast_json_enabled() -> bool:
+    return orjson is not None and settings.SERIALIZATION_FAST_JSON
+
+def json_dumps_bytes(obj: Any) -> bytes:
+    """Compact UTF-8 JSON (non-ASCII is not escaped), through orjson when available."""
+    if fast_json_enabled():
+        try:
+            return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits; the stdlib encoder handles them
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode('utf-8')
+
+def json_dumps(obj: Any) -> str:
+    return json_dumps_bytes(obj).decode('utf-8')
+
+def json_loads(data) -> Any:
+    """Parse JSON from bytes or str."""
+    if fast_json_enabled():
+        return orjson.loads(data)
+    return json.loads(data)
+
+class RecordCodec(abc.ABC):
+    """Encodes a sequence of records (dicts, strings, ...) as one byte stream that can be appended to."""
+
+    name = ""
+    extension = ""
+
+    @abc.abstractmethod
+    def encode(self, records: Iterable[Any]) -> bytes:
+        ...
+
+    @abc.abstractmethod
+    def decode(self, data: bytes) -> List[Any]:
+        ...
+
+    @abc.abstractmethod
+    def decode_complete(self, data: bytes) -> Tuple[List[Any], int]:
+        """
+        Records up to the first one that is incomplete or does not decode (a torn
+        trailing write), and the number of bytes they span.
+        """
+
+class JsonLinesCodec(RecordCodec):
+    """One JSON document per line; readable with any text tool."""
+
+    name = CODEC_JSONL
+    extension = CODEC_EXTENSIONS[CODEC_JSONL]
+
+    def encode(self, records: Iterable[Any]) -> bytes:
+        return b"".join(json_dumps_bytes(record) + b"\n" for record in records)
+
+    def decode(self, data: bytes) -> List[Any]:
+        return [json_loads(line) for line in data.splitlines() if line.strip()]
+
+    def decode_complete(self, data: bytes) -> Tuple[List[Any], int]:
+        records, offset = [], 0
+        for line in data.splitlines(keepends=True):
+            if line.strip():
+                # Every record is written with its newline; a line without one was cut short.
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json_loads(line))
+                except ValueError:
+                    break
+            offset += len(line)
+        return records, offset
+
+class MsgpackCodec(RecordCodec):
+    """Concatenated MessagePack objects; smaller and faster to parse than JSON lines."""
+
+    name = CODEC_MSGPACK
+    extension = CODEC_EXTENSIONS[CODEC_MSGPACK]
+
+    def encode(self, records: Iterable[Any]) -> bytes:
+        packer = msgpack.Packer(use_bin_type=True)
+        return b"".join(packer.pack(record) for record in records)
+
+    def decode(self, data: bytes) -> List[Any]:
+        unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+        unpacker.feed(data)
+        return list(unpacker)
+
+    def decode_complete(self, data: bytes) -> Tuple[List[Any], int]:
+        unpacker = msgpack.Unpacker(raw=False, strict_map_key=False)
+        unpacker.feed(data)
+        records, offset = [], 0
+        try:
+            for record in unpacker:
+                records.append(record)
+                offset = unpacker.tell()
+        except (ValueError, msgpack.UnpackException):
+            pass
+        return records, offset
+
+JSON_LINES = JsonLinesCodec()
+_codecs = {CODEC_JSONL: JSON_LINES}
+if msgpack is not None:
+    _codecs[CODEC_MSGPACK] = MsgpackCodec()
+_warned_missing = False
+
+def get_record_codec() -> RecordCodec:
+    """The codec new record files are written with (SERIALIZATION_RECORD_CODEC)."""
+    global _warned_missing
+    codec = _codecs.get(settings.SERIALIZATION_RECORD_CODEC)
+    if codec is None:
+        if not _warned_missing:
+            _warned_missing = True
+            logger.info(f"Record codec {settings.SERIALIZATION_RECORD_CODEC} is not available; writing JSON lines")
+        codec = _codecs[CODEC_JSONL]
+    return codec
+
+def detect_codec(data: bytes) -> RecordCodec:
+    """
+    Tell the encoding of a record file from its first byte. JSON text always starts
+    with an ASCII character, while a MessagePack map, array or string starts with a
+    byte >= 0x80, so files written before a codec change keep loading.
+    """
+    first = data.lstrip()[:1]
+    if first and first[0] >= 0x80:
+        if msgpack is None:
+            raise Exception("Found MessagePack records but the msgpack package is not installed")
+        return _codecs[CODEC_MSGPACK]
+    return _codecs[CODEC_JSONL]
+
+def encode_records(records: Iterable[Any], codec: Optional[RecordCodec] = None) -> bytes:
+    return (codec or get_record_codec()).encode(records)
+
+def decode_records(data: bytes) -> List[Any]:
+    return detect_codec(data).decode(data)
+
+def decode_complete_records(data: bytes) -> Tuple[List[Any], int]:
+    """decode_records for an append-only file: see RecordCodec.decode_complete."""
+    return detect_codec(data).decode_complete(data)
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered through json_dumps_bytes (orjson when available)."""
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps_bytes(content)
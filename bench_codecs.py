@@ -0,0 +1,94 @@
+"""
+Microbenchmark of the serialization codecs in app.serialization.
+
+    python bench_codecs.py [--rounds N]
+
+Compares the stdlib json module, orjson and MessagePack (whichever are installed) on
+payloads shaped like the app's own: session turns, memory records and a /chat
+response. Reports encode and decode time per payload and the encoded size.
+"""
+import argparse
+import json
+import time
+import uuid
+from datetime import datetime
+
+from app import serialization
+
+def session_turns(count: int = 2000) -> list:
+    return [
+        ("You: " if i % 2 == 0 else "Assistant: ") + f"Message {i} about the project plan, schedule and budget. " * 4
+        for i in range(count)
+    ]
+
+def memory_records(count: int = 2000) -> list:
+    return [{
+        'key': str(uuid.uuid4()),
+        'text': f"Summary {i}: the user prefers concise answers and works on the data pipeline. " * 3,
+        'metadata': {'memorized': True, 'importance': i % 5},
+        'created_at': datetime.utcnow().isoformat()
+    } for i in range(count)]
+
+def chat_response(memories: int = 5) -> dict:
+    return {
+        'response': "Here is a detailed answer that spans a few sentences. " * 20,
+        'memories': [{
+            'key': str(uuid.uuid4()),
+            'text': "A remembered fact about the user's preferences. " * 3,
+            'similarity': 0.83,
+            'lexical_score': 4.2,
+            'score': 0.031,
+            'metadata': {'memorized': True},
+            'created_at': datetime.utcnow().isoformat()
+        } for _ in range(memories)]
+    }
+
+def timed(func, rounds: int) -> float:
+    """Best-of-rounds wall time in milliseconds."""
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0
+
+def stdlib_lines(records: list) -> bytes:
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode('utf-8')
+
+def bench_records(name: str, records: list, rounds: int):
+    rows = [("json (stdlib)", lambda: stdlib_lines(records),
+             lambda data: [json.loads(line) for line in data.splitlines() if line.strip()])]
+    if serialization.orjson is not None:
+        jsonl = serialization.JsonLinesCodec()
+        rows.append(("jsonl (orjson)", lambda: jsonl.encode(records), jsonl.decode))
+    if serialization.msgpack is not None:
+        packed = serialization.MsgpackCodec()
+        rows.append(("msgpack", lambda: packed.encode(records), packed.decode))
+    print(f"\n{name} ({len(records)} records)")
+    for label, encode, decode in rows:
+        data = encode()
+        assert decode(data) == records
+        print(f"  {label:<16} encode {timed(encode, rounds):8.2f} ms   decode {timed(lambda: decode(data), rounds):8.2f} ms"
+              f"   {len(data) / 1024:8.1f} KiB")
+
+def bench_response(payload: dict, rounds: int):
+    rows = [("json (stdlib)", lambda: json.dumps(payload).encode('utf-8'))]
+    if serialization.orjson is not None:
+        rows.append(("orjson", lambda: serialization.orjson.dumps(payload)))
+    print("\n/chat response (1000 encodes)")
+    for label, encode in rows:
+        print(f"  {label:<16} encode {timed(lambda: [encode() for _ in range(1000)], rounds):8.2f} ms"
+              f"   {len(encode())} bytes")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5, help="Repetitions per measurement; the best one is reported")
+    args = parser.parse_args()
+    available = ["json"] + [name for name in ("orjson", "msgpack") if getattr(serialization, name) is not None]
+    print(f"Available: {', '.join(available)}")
+    bench_records("Session turns", session_turns(), args.rounds)
+    bench_records("Memory records", memory_records(), args.rounds)
+    bench_response(chat_response(), args.rounds)
+
+if __name__ == "__main__":
+    main()
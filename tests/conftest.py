@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config.settings import settings
+from app.memory.session_catalog import close_session_catalog
+
+@pytest.fixture(autouse=True)
+def data_paths(tmp_path, monkeypatch):
+    """Point every on-disk path at a fresh temporary directory."""
+    sessions = tmp_path / "sessions"
+    memory = tmp_path / "memory"
+    sessions.mkdir()
+    memory.mkdir()
+    monkeypatch.setattr(settings, "SESSIONS_PATH", str(sessions))
+    monkeypatch.setattr(settings, "MEMORY_PATH", str(memory))
+    monkeypatch.setattr(settings, "SESSION_CATALOG_PATH", str(tmp_path / "session_catalog.sqlite3"))
+    monkeypatch.setattr(settings, "SERIALIZATION_RECORD_CODEC", "jsonl")
+    yield tmp_path
+    close_session_catalog()
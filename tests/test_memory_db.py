@@ -0,0 +1,62 @@
+import asyncio
+import zlib
+
+import numpy as np
+import pytest
+
+from app.config.settings import settings
+from app.memory import model_registry
+from app.memory.memory_db import MemoryDB
+
+DIMENSION = 64
+
+class FakeEmbeddingClient:
+    """Bag-of-words vectors, so texts sharing words are similar without a running model."""
+
+    embedding_model = "fake-embed"
+
+    async def get_embedding(self, text):
+        return (await self.get_embeddings([text]))[0]
+
+    async def get_embeddings(self, texts):
+        embeddings = []
+        for text in texts:
+            vector = np.zeros(DIMENSION, dtype='float32')
+            for word in text.lower().split():
+                vector[zlib.crc32(word.encode()) % DIMENSION] += 1.0
+            embeddings.append(vector.tolist())
+        return embeddings
+
+@pytest.fixture
+def hnsw(monkeypatch):
+    monkeypatch.setattr(model_registry, "_model_registry", None)
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_ENABLED", False)
+    monkeypatch.setattr(settings, "MEMORY_LEXICAL_ENABLED", False)
+    monkeypatch.setattr(settings, "MEMORY_INDEX_TIER", "hnsw")
+    # Keep the tombstoned vector in the graph instead of rebuilding it away.
+    monkeypatch.setattr(settings, "MEMORY_INDEX_TOMBSTONE_RATIO", 100.0)
+
+def test_updated_memory_is_not_found_by_its_old_text(hnsw):
+    async def scenario():
+        db = await MemoryDB.create(session_name="s", ollama_client=FakeEmbeddingClient())
+        await db._index_task  # the empty flat index is moved to HNSW in the background
+        keys = await db.add_memories(["the cat sat on the mat", "quantum physics lecture notes"])
+        old_id = db.memories[keys[0]]['id']
+
+        assert await db.update_memory(keys[0], text="cooking pasta tonight")
+
+        assert db.index_info()['tier'] == "hnsw"
+        assert db.memories[keys[0]]['id'] != old_id
+        stale = await db.query("the cat sat on the mat", threshold=0.5)
+        fresh = await db.query("cooking pasta tonight", threshold=0.5)
+        await db.close()
+        reopened = await MemoryDB.create(session_name="s", ollama_client=FakeEmbeddingClient())
+        replayed = await reopened.query("cooking pasta tonight", threshold=0.5)
+        await reopened.close()
+        return keys, stale, fresh, replayed
+
+    keys, stale, fresh, replayed = asyncio.run(scenario())
+
+    assert stale == []
+    assert [(hit['key'], hit['text']) for hit in fresh] == [(keys[0], "cooking pasta tonight")]
+    assert [(hit['key'], hit['text']) for hit in replayed] == [(keys[0], "cooking pasta tonight")]
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.chat.scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, ModelScheduler, SchedulerRejected
+from app.main import scheduler_rejected_handler
+
+def test_full_queue_rejects_with_429():
+    async def scenario():
+        scheduler = ModelScheduler("m", max_concurrency=1, max_queue=1, max_wait=5.0)
+        lease = await scheduler.lease("a")
+        waiting = asyncio.create_task(scheduler.lease("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerRejected) as rejected:
+            await scheduler.lease("c")
+        lease.release()
+        (await waiting).release()
+        return scheduler, rejected.value
+
+    scheduler, rejected = asyncio.run(scenario())
+
+    assert rejected.status_code == 429
+    # Default 5 s service time, one waiter ahead, one slot: ceil(5 * 2 / 1).
+    assert rejected.retry_after == 10
+    assert scheduler.stats()['rejected'] == 1
+    assert (scheduler.running, scheduler.queued) == (0, 0)
+
+def test_wait_timeout_rejects_with_503():
+    async def scenario():
+        scheduler = ModelScheduler("m", max_concurrency=1, max_queue=4, max_wait=0.01)
+        lease = await scheduler.lease("a")
+        with pytest.raises(SchedulerRejected) as rejected:
+            await scheduler.lease("b")
+        lease.release()
+        return scheduler, rejected.value
+
+    scheduler, rejected = asyncio.run(scenario())
+
+    assert rejected.status_code == 503
+    assert rejected.retry_after >= 1
+    assert scheduler.stats()['timed_out'] == 1
+    assert (scheduler.running, scheduler.queued) == (0, 0)
+
+def test_interactive_request_displaces_background_waiter():
+    async def scenario():
+        scheduler = ModelScheduler("m", max_concurrency=1, max_queue=1, max_wait=5.0)
+        lease = await scheduler.lease("a")
+        background = asyncio.create_task(scheduler.lease("memorize", PRIORITY_BACKGROUND))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(scheduler.lease("chat", PRIORITY_INTERACTIVE))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerRejected) as rejected:
+            await background
+        lease.release()
+        (await interactive).release()
+        return scheduler, rejected.value
+
+    scheduler, rejected = asyncio.run(scenario())
+
+    assert rejected.status_code == 503
+    assert scheduler.stats()['shed'] == 1
+
+def test_waiters_are_granted_round_robin_across_sessions():
+    async def scenario():
+        scheduler = ModelScheduler("m", max_concurrency=1, max_queue=8, max_wait=5.0)
+        order = []
+
+        async def generate(session):
+            async with scheduler.slot(session):
+                order.append(session)
+
+        lease = await scheduler.lease("busy")
+        tasks = [asyncio.create_task(generate(session)) for session in ("busy", "busy", "busy", "other")]
+        await asyncio.sleep(0)
+        lease.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == ["busy", "other", "busy", "busy"]
+
+def test_rejection_maps_to_status_and_retry_after_header():
+    response = asyncio.run(scheduler_rejected_handler(None, SchedulerRejected("overloaded", 429, 7)))
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "7"
+    assert b"overloaded" in response.body
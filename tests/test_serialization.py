@@ -0,0 +1,62 @@
+import pytest
+
+from app.config.settings import settings
+from app.serialization import (
+    JSON_LINES, RecordCodec, decode_complete_records, decode_records, detect_codec, encode_records, get_record_codec
+)
+
+RECORDS = [
+    {"role": "user", "text": "héllo ✓", "n": 1, "tags": ["a", "b"], "nested": {"x": None, "y": 2.5}},
+    "You: plain string turn",
+    {"empty": {}}
+]
+
+@pytest.fixture
+def msgpack_codec(monkeypatch):
+    pytest.importorskip("msgpack")
+    monkeypatch.setattr(settings, "SERIALIZATION_RECORD_CODEC", "msgpack")
+    return get_record_codec()
+
+def test_record_codec_is_abstract():
+    with pytest.raises(TypeError):
+        RecordCodec()
+
+def test_json_lines_round_trip():
+    data = encode_records(RECORDS, JSON_LINES)
+
+    assert data.count(b"\n") == len(RECORDS)
+    assert detect_codec(data) is JSON_LINES
+    assert decode_records(data) == RECORDS
+    assert decode_complete_records(data) == (RECORDS, len(data))
+
+def test_default_codec_is_json_lines():
+    assert get_record_codec() is JSON_LINES
+    assert get_record_codec().extension == ".jsonl"
+
+def test_json_lines_torn_tail():
+    data = encode_records(RECORDS, JSON_LINES)
+    intact = encode_records(RECORDS[:2], JSON_LINES)
+
+    assert decode_complete_records(data[:-1]) == (RECORDS[:2], len(intact))
+    assert decode_complete_records(intact + b'{"text": "cut') == (RECORDS[:2], len(intact))
+    assert decode_complete_records(b"") == ([], 0)
+
+def test_msgpack_round_trip(msgpack_codec):
+    data = encode_records(RECORDS)
+
+    assert msgpack_codec.extension == ".msgpack"
+    assert detect_codec(data) is msgpack_codec
+    assert decode_records(data) == RECORDS
+    assert decode_complete_records(data) == (RECORDS, len(data))
+
+def test_msgpack_torn_tail(msgpack_codec):
+    intact = encode_records(RECORDS[:2])
+    data = intact + encode_records(RECORDS[2:])
+
+    assert decode_complete_records(data[:-1]) == (RECORDS[:2], len(intact))
+
+def test_files_written_before_a_codec_change_still_decode(msgpack_codec):
+    json_data = encode_records(RECORDS, JSON_LINES)
+    msgpack_data = encode_records(RECORDS, msgpack_codec)
+
+    assert decode_records(json_data) == decode_records(msgpack_data) == RECORDS
@@ -0,0 +1,147 @@
+import gzip
+import os
+
+import pytest
+
+from app.config.settings import settings
+from app.memory import session_manager
+from app.memory.session_manager import (
+    PartialHistoryError, compact_session, get_session_dirpath, load_session, save_session
+)
+
+def _turns(n, prefix="You"):
+    return [f"{prefix}: {i}" for i in range(n)]
+
+def _segment_files(session_name):
+    return sorted(name for name in os.listdir(get_session_dirpath(session_name)) if name != "meta.json")
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(settings, "SESSION_SEGMENT_TURNS", 4)
+    # Compaction is run explicitly by the tests that want it.
+    monkeypatch.setattr(settings, "SESSION_COMPACT_SEGMENTS", 1000)
+
+def test_save_appends_new_turns():
+    assert save_session("s", _turns(3)) == {"session_name": "s", "turns": 3, "appended": 3}
+    assert save_session("s", _turns(10)) == {"session_name": "s", "turns": 10, "appended": 7}
+
+    assert load_session("s")["chat_history"] == _turns(10)
+    assert _segment_files("s") == ["0000000000.jsonl", "0000000004.jsonl", "0000000008.jsonl"]
+
+def test_save_from_start_reads_only_the_segments_it_overlaps(monkeypatch):
+    save_session("s", _turns(10))
+    read = []
+    original = session_manager._read_segment
+
+    def recording(dirpath, filename):
+        read.append(filename)
+        return original(dirpath, filename)
+
+    monkeypatch.setattr(session_manager, "_read_segment", recording)
+    result = save_session("s", _turns(12)[9:], start=9)
+
+    assert result == {"session_name": "s", "turns": 12, "appended": 2}
+    assert "0000000000.jsonl" not in read
+    assert load_session("s")["chat_history"] == _turns(12)
+
+def test_edited_history_rewrites_the_session():
+    save_session("s", _turns(10))
+    generation = session_manager._generation(get_session_dirpath("s"))
+    edited = _turns(10)
+    edited[3] = "You: edited"
+
+    assert save_session("s", edited) == {"session_name": "s", "turns": 10, "appended": 10}
+
+    assert load_session("s")["chat_history"] == edited
+    assert session_manager._generation(get_session_dirpath("s")) == generation + 1
+
+def test_edit_in_an_earlier_segment_of_the_overlap_is_detected():
+    save_session("s", _turns(10))
+    # The client resends from turn 2; turn 3 lives in the first segment, not the tail.
+    edited = _turns(12)[2:]
+    edited[1] = "You: edited"
+
+    with pytest.raises(PartialHistoryError):
+        save_session("s", edited, start=2)
+    assert load_session("s")["chat_history"] == _turns(10)
+
+def test_shorter_history_rewrites_the_session():
+    save_session("s", _turns(10))
+    save_session("s", _turns(2))
+    assert load_session("s")["chat_history"] == _turns(2)
+    save_session("s", [])
+    assert load_session("s")["chat_history"] == []
+
+def test_partial_save_past_the_end_is_rejected():
+    save_session("s", _turns(3))
+    with pytest.raises(PartialHistoryError):
+        save_session("s", ["You: x"], start=5)
+    with pytest.raises(PartialHistoryError):
+        save_session("new", ["You: x"], start=1)
+
+def test_torn_segment_is_truncated_and_appended_after():
+    save_session("s", _turns(6))
+    path = os.path.join(get_session_dirpath("s"), "0000000004.jsonl")
+    intact = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'"You: to')
+
+    assert load_session("s")["chat_history"] == _turns(6)
+    assert os.path.getsize(path) == intact
+    save_session("s", _turns(8))
+    assert load_session("s")["chat_history"] == _turns(8)
+
+def test_torn_first_record_of_the_tail():
+    save_session("s", _turns(8))
+    with open(os.path.join(get_session_dirpath("s"), "0000000008.jsonl"), 'wb') as f:
+        f.write(b'"You: to')
+
+    assert save_session("s", _turns(9)) == {"session_name": "s", "turns": 9, "appended": 1}
+    assert load_session("s")["chat_history"] == _turns(9)
+
+def test_pagination_with_limit_and_before():
+    save_session("s", _turns(10))
+
+    page = load_session("s", limit=3)
+    assert (page["chat_history"], page["start"], page["next_cursor"], page["total_turns"]) == (_turns(10)[7:], 7, 7, 10)
+    page = load_session("s", limit=3, before=page["next_cursor"])
+    assert (page["chat_history"], page["start"], page["next_cursor"]) == (_turns(10)[4:7], 4, 4)
+    page = load_session("s", limit=5, before=3)
+    assert (page["chat_history"], page["start"], page["next_cursor"]) == (_turns(10)[:3], 0, None)
+    assert load_session("s", limit=0)["chat_history"] == []
+    assert load_session("s", before=100)["chat_history"] == _turns(10)
+
+def test_load_missing_session_raises():
+    with pytest.raises(FileNotFoundError):
+        load_session("missing")
+
+def test_compaction_merges_sealed_segments():
+    save_session("s", _turns(14))
+    compact_session("s")
+
+    assert _segment_files("s") == ["0000000000-0000000012.jsonl.gz", "0000000012.jsonl"]
+    with gzip.open(os.path.join(get_session_dirpath("s"), "0000000000-0000000012.jsonl.gz"), 'rb') as f:
+        assert f.read().count(b"\n") == 12
+    assert load_session("s")["chat_history"] == _turns(14)
+    assert load_session("s", limit=4, before=6)["chat_history"] == _turns(14)[2:6]
+    save_session("s", _turns(17))
+    assert load_session("s")["chat_history"] == _turns(17)
+
+def test_compaction_racing_a_rewrite_is_abandoned(monkeypatch):
+    save_session("s", _turns(12, "A"))
+    original = session_manager._read_segment
+
+    def racing(dirpath, filename):
+        # The session is rewritten after compaction listed the sealed segments.
+        monkeypatch.setattr(session_manager, "_read_segment", original)
+        save_session("s", _turns(12, "B"))
+        return original(dirpath, filename)
+
+    monkeypatch.setattr(session_manager, "_read_segment", racing)
+    compact_session("s")
+
+    assert load_session("s")["chat_history"] == _turns(12, "B")
+    assert not any(name.endswith(".gz") or name.endswith(".tmp") for name in _segment_files("s"))
+
+    compact_session("s")
+    assert load_session("s")["chat_history"] == _turns(12, "B")
@@ -0,0 +1,108 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from app.memory.vector_store import (
+    MANIFEST_NAME, MIGRATED_SUFFIX, RECORDS_SUFFIX, VECTORS_SUFFIX, VectorStore, migrate_json_memories
+)
+from app.serialization import JSON_LINES
+
+def _records(n, prefix="m"):
+    return [{'key': f"{prefix}{i}", 'text': f"text {i}", 'metadata': {}, 'created_at': None} for i in range(n)]
+
+def _vectors(n, d=4):
+    return np.random.default_rng(n).random((n, d), dtype='float32')
+
+def test_save_and_load_round_trip(tmp_path):
+    store = VectorStore(str(tmp_path / "s_memory"))
+    assert not store.exists()
+    records, vectors = _records(3), _vectors(3)
+
+    store.save(records, vectors)
+    loaded, matrix = VectorStore(store.base_path).load()
+
+    assert loaded == records
+    assert np.array_equal(np.asarray(matrix), vectors)
+    assert store.record_count() == 3
+
+def test_each_save_publishes_a_new_generation(tmp_path):
+    store = VectorStore(str(tmp_path / "s_memory"))
+    store.save(_records(2, "a"), _vectors(2))
+    first = store.generation
+    store.save(_records(5, "b"), _vectors(5))
+
+    assert store.generation == first + 1
+    with open(store.manifest_path) as f:
+        manifest = json.load(f)
+    assert manifest['generation'] == store.generation
+    assert manifest['count'] == 5
+    # Only the current generation is left next to the manifest.
+    assert sorted(os.listdir(store.snapshot_dir)) == sorted([MANIFEST_NAME, f"{store.generation:08d}"])
+    records, _ = VectorStore(store.base_path).load()
+    assert [record['key'] for record in records] == [f"b{i}" for i in range(5)]
+
+def test_unpublished_generation_is_ignored(tmp_path):
+    store = VectorStore(str(tmp_path / "s_memory"))
+    store.save(_records(2), _vectors(2))
+    # A save that died before swapping the manifest in leaves a directory behind.
+    os.makedirs(os.path.join(store.snapshot_dir, f"{store.generation + 1:08d}"))
+    with open(os.path.join(store.snapshot_dir, f"{store.generation + 1:08d}", "vectors.npy"), 'wb') as f:
+        f.write(b"partial")
+
+    records, _ = VectorStore(store.base_path).load()
+    assert len(records) == 2
+    store.save(_records(1), _vectors(1))
+    assert VectorStore(store.base_path).record_count() == 1
+
+def test_unreadable_manifest_raises_instead_of_being_overwritten(tmp_path):
+    store = VectorStore(str(tmp_path / "s_memory"))
+    store.save(_records(2), _vectors(2))
+    with open(store.manifest_path, 'wb') as f:
+        f.write(b'{"generation": ')
+
+    with pytest.raises(ValueError):
+        VectorStore(store.base_path).load()
+    with pytest.raises(ValueError):
+        store.save(_records(1), _vectors(1))
+
+def test_mismatched_lengths_are_rejected(tmp_path):
+    store = VectorStore(str(tmp_path / "s_memory"))
+    with pytest.raises(ValueError):
+        store.save(_records(2), _vectors(3))
+
+def test_flat_layout_is_read_and_replaced(tmp_path):
+    base = str(tmp_path / "s_memory")
+    np.save(base + VECTORS_SUFFIX, _vectors(2))
+    with open(base + RECORDS_SUFFIX, 'wb') as f:
+        f.write(JSON_LINES.encode(_records(2)))
+
+    store = VectorStore(base)
+    records, _ = store.load()
+    assert len(records) == 2
+
+    store.save(_records(3), _vectors(3))
+    assert not os.path.exists(base + VECTORS_SUFFIX)
+    assert not os.path.exists(base + RECORDS_SUFFIX)
+    assert VectorStore(base).record_count() == 3
+
+def test_migrate_json_memories(tmp_path):
+    store = VectorStore(str(tmp_path / "s_memory"))
+    legacy = {
+        "k1": {'text': "one", 'metadata': {'n': 1}, 'created_at': "t1", 'vector': [3.0, 4.0]},
+        "k2": {'text': "two", 'metadata': {}, 'created_at': "t2", 'vector': [0.0, 2.0]},
+        "k3": {'text': "no vector", 'metadata': {}, 'created_at': "t3"}
+    }
+    with open(store.legacy_path, 'w') as f:
+        json.dump(legacy, f)
+
+    assert migrate_json_memories(store) == 3
+
+    records, vectors = VectorStore(store.base_path).load()
+    assert [record['key'] for record in records] == ["k1", "k2"]
+    assert records[0]['metadata'] == {'n': 1}
+    assert np.allclose(np.asarray(vectors), [[0.6, 0.8], [0.0, 1.0]])
+    assert [record['key'] for record in store.load_pending()] == ["k3"]
+    assert not os.path.exists(store.legacy_path)
+    assert os.path.exists(store.base_path + MIGRATED_SUFFIX)
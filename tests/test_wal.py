@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+
+from app.memory.wal import WriteAheadLog, add_entry, decode_vector, delete_entry
+
+def _record(key):
+    return {'id': key, 'text': f"memory {key}", 'metadata': {}, 'created_at': "2024-01-01T00:00:00"}
+
+def test_replay_returns_appended_entries(tmp_path):
+    path = str(tmp_path / "m.wal")
+    wal = WriteAheadLog(path)
+    vector = np.arange(4, dtype='float32')
+    wal.append([add_entry("a", _record("a"), vector), delete_entry("b")])
+    wal.close()
+
+    entries = WriteAheadLog(path).replay()
+
+    assert [entry['op'] for entry in entries] == ['add', 'delete']
+    assert entries[0]['key'] == "a"
+    assert np.array_equal(decode_vector(entries[0]['vector']), vector)
+
+def test_replay_truncates_torn_tail(tmp_path):
+    path = str(tmp_path / "m.wal")
+    wal = WriteAheadLog(path)
+    wal.append([delete_entry("a"), delete_entry("b")])
+    wal.close()
+    intact = os.path.getsize(path)
+    with open(path, 'ab') as f:
+        f.write(b'{"op": "add", "key": "c", "te')
+
+    wal = WriteAheadLog(path)
+    entries = wal.replay()
+
+    assert [entry['key'] for entry in entries] == ["a", "b"]
+    assert os.path.getsize(path) == intact
+    assert wal.entries == 2
+
+def test_appends_after_torn_tail_are_replayed(tmp_path):
+    path = str(tmp_path / "m.wal")
+    with open(path, 'wb') as f:
+        f.write(b'{"op": "delete", "key": "a"}\n{"op": "del')
+
+    wal = WriteAheadLog(path)
+    wal.replay()
+    wal.append([delete_entry("b")])
+    wal.close()
+
+    assert [entry['key'] for entry in WriteAheadLog(path).replay()] == ["a", "b"]
+
+def test_reset_removes_log(tmp_path):
+    path = str(tmp_path / "m.wal")
+    wal = WriteAheadLog(path)
+    wal.append([delete_entry("a")])
+    wal.reset()
+
+    assert not os.path.exists(path)
+    assert WriteAheadLog(path).replay() == []